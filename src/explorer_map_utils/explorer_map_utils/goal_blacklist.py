@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Blacklist of the navigation goals that Nav2 failed to reach.
+
+Failed goals are recorded in a spatial hash: the plane is divided in square cells of 'cell_size'
+meters, and every cell keeps a penalty that halves every 'half_life' seconds. A goal is suppressed
+while the penalty of its cell or of one of the 8 neighbouring cells is above 'threshold', so that
+the robot stops retrying the same goal and the goals right next to it. A lookup is a constant
+number of dict lookups, whatever the number of failed goals.
+"""
+
+from collections import Counter
+import math
+
+import numpy as np
+
+
+class GoalBlacklist():
+    """Spatial hash of time-decaying penalties of the failed navigation goals."""
+
+    def __init__(self, cell_size=0.5, half_life=120.0, threshold=0.5, min_penalty=0.01):
+        """
+        :param cell_size: side of the cells of the spatial hash, in meters
+        :param half_life: time for a penalty to halve, in seconds
+        :param threshold: penalty above which the goals of a cell and its neighbours are suppressed
+        :param min_penalty: penalty below which a cell is forgotten
+        """
+        self.cell_size = cell_size
+        self.half_life = half_life
+        self.threshold = threshold
+        self.min_penalty = min_penalty
+
+        self._cells = {}  # (i, j) -> (penalty, time of the penalty)
+        self.failures = 0  # number of failed goals recorded
+        self.failures_by_status = Counter()  # number of failed goals per GoalStatus
+        self.suppressed = 0  # number of lookups that suppressed a goal
+
+    def cell(self, x, y):
+        """
+        Hashes a position to its cell.
+
+        :param x: x coordinate in meters
+        :param y: y coordinate in meters
+        :return: (i, j) index of the cell
+        """
+        return (math.floor(x / self.cell_size), math.floor(y / self.cell_size))
+
+    def record_failure(self, x, y, now, status=None):
+        """
+        Records a failed goal, adding 1 to the decayed penalty of its cell.
+
+        :param x: x coordinate of the goal in meters
+        :param y: y coordinate of the goal in meters
+        :param now: current time in seconds
+        :param status: GoalStatus of the failure, for the metrics
+        """
+        key = self.cell(x, y)
+        self._cells[key] = (self._decayed(key, now) + 1.0, now)
+        self.failures += 1
+        self.failures_by_status[status] += 1
+        self._forget(now)
+
+    def penalty(self, x, y, now):
+        """
+        Gets the penalty of a position, the largest decayed penalty of its cell and its neighbours.
+
+        :param x: x coordinate in meters
+        :param y: y coordinate in meters
+        :param now: current time in seconds
+        :return: penalty, 0 if no goal failed around the position
+        """
+        if not self._cells:
+            return 0.0
+        i, j = self.cell(x, y)
+        return max(self._decayed((i + di, j + dj), now) for di in (-1, 0, 1) for dj in (-1, 0, 1))
+
+    def is_suppressed(self, x, y, now):
+        """
+        Checks whether a goal is suppressed because goals failed at or around its position.
+
+        :param x: x coordinate of the goal in meters
+        :param y: y coordinate of the goal in meters
+        :param now: current time in seconds
+        :return: True if the goal should not be sent
+        """
+        suppressed = self.penalty(x, y, now) >= self.threshold
+        self.suppressed += suppressed
+        return suppressed
+
+    def metrics(self, now):
+        """
+        Gets the failure metrics of the blacklist.
+
+        :param now: current time in seconds
+        :return: dict of metric name to value
+        """
+        metrics = {
+            'failures': self.failures,
+            'suppressed_lookups': self.suppressed,
+            'blacklisted_cells': sum(self._decayed(key, now) >= self.threshold
+                                     for key in self._cells),
+        }
+        for status, count in self.failures_by_status.items():
+            metrics[f'failures_status_{status}'] = count
+        return metrics
+
+    def export_state(self, now):
+        """
+        Gets the penalties of the blacklist as arrays, to save them in a mission snapshot.
+
+        :param now: current time in seconds, the penalties are decayed to it
+        :return: (cells, penalties), int64 array (n, 2) of the cells and float array (n,) of their
+        penalties
+        """
+        # copied first, the failures may be recorded from another thread meanwhile
+        entries = dict(self._cells)
+        decayed = {key: penalty * 0.5 ** (max(now - time, 0.0) / self.half_life)
+                   for key, (penalty, time) in entries.items()}
+        keys = [key for key, penalty in decayed.items() if penalty >= self.min_penalty]
+        cells = np.array(keys, dtype=np.int64).reshape(-1, 2)
+        penalties = np.array([decayed[key] for key in keys], dtype=float)
+        return cells, penalties
+
+    def restore_state(self, cells, penalties, now, failures=0, failures_by_status=()):
+        """
+        Replaces the penalties and the failure counts with those of a mission snapshot.
+
+        The clock may have restarted with the node, so the penalties decay again from now.
+
+        :param cells: int array (n, 2) of the cells, see export_state
+        :param penalties: float array (n,) of their penalties
+        :param now: current time in seconds
+        :param failures: number of failed goals recorded
+        :param failures_by_status: (status, count) pairs of the failed goals per GoalStatus
+        """
+        self._cells = {(int(i), int(j)): (float(penalty), now)
+                       for (i, j), penalty in zip(cells, penalties)}
+        self.failures = failures
+        self.failures_by_status = Counter({status: count for status, count in failures_by_status})
+
+    def _decayed(self, key, now):
+        if key not in self._cells:
+            return 0.0
+        penalty, time = self._cells[key]
+        return penalty * 0.5 ** (max(now - time, 0.0) / self.half_life)
+
+    def _forget(self, now):
+        for key in [key for key in self._cells if self._decayed(key, now) < self.min_penalty]:
+            del self._cells[key]
@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Zero-copy decoding of nav_msgs/OccupancyGrid messages, shared by all the map consumers.
+
+rclpy stores the int8 'data' field of a received OccupancyGrid in an array.array('b'), which
+numpy reads through the buffer protocol: numpy.asarray(msg.data) is already a zero-copy int8
+array, and np.array(msg.data) an int8 copy of the payload. Neither widens it. Only a payload held
+as a plain list, as in a message built by hand, is converted element by element, to int64.
+occupancy_grid_view does not make decoding faster than numpy.asarray; it gives every consumer the
+same read-only int8 (height, width) view of the buffer, with the map metadata carried along.
+
+Run ``python3 -m explorer_map_utils.occupancy_grid`` to compare the memory and latency of the
+decodings on a 2000 x 2000 grid. The best of 5 runs, without ROS installed:
+
+                  decoding  latency (ms)  allocated (MB)
+        np.array(msg.data)         0.349             4.0
+   numpy.asarray(msg.data)         0.001             0.0
+  np.array(msg.data, int8)         0.345             4.0
+  occupancy_grid_view(msg)         0.006             0.0
+"""
+
+from array import array
+from collections import namedtuple
+import time
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+
+# data: read-only int8 array of shape (height, width), indexed [row (y), column (x)]
+# info: MapMetaData of the message
+# origin_x, origin_y: position of the cell (0, 0) in the map frame, in meters
+OccupancyGridView = namedtuple('OccupancyGridView', [
+    'data', 'info', 'width', 'height', 'resolution', 'origin_x', 'origin_y', 'frame_id', 'stamp'])
+
+
+def occupancy_grid_view(msg):
+    """
+    Decodes an OccupancyGrid message into a read-only int8 2D view of its data, without copying.
+
+    The view shares the buffer of the message, so it stays valid as long as the message data is
+    not reassigned. Messages whose data is a plain list (built by hand rather than received) are
+    converted once to int8.
+
+    :param msg: OccupancyGrid message
+    :return: OccupancyGridView
+    """
+    info = msg.info
+    try:
+        data = np.frombuffer(msg.data, dtype=np.int8)
+    except TypeError:
+        data = np.asarray(msg.data, dtype=np.int8)
+    data = data.reshape((info.height, info.width))
+    data.flags.writeable = False
+
+    return OccupancyGridView(
+        data=data, info=info, width=info.width, height=info.height, resolution=info.resolution,
+        origin_x=info.origin.position.x, origin_y=info.origin.position.y,
+        frame_id=msg.header.frame_id, stamp=msg.header.stamp)
+
+
+def grid_message_data(grid):
+    """
+    Encodes a 2D grid into the int8 array.array expected by the 'data' field of an OccupancyGrid.
+
+    :param grid: 2D array of occupancy values in [-1, 100]
+    :return: array.array('b') of the grid in row-major order
+    """
+    return array('b', np.ascontiguousarray(grid, dtype=np.int8).tobytes())
+
+
+def benchmark(side=2000, repeats=5):
+    """
+    Prints the memory and latency of the decodings of a (side x side) OccupancyGrid.
+
+    :param side: side of the square grid, in cells
+    :param repeats: number of runs of every decoding, the best one is reported
+    """
+    rng = np.random.default_rng(0)
+    # built like a received message, whose int8 payload rclpy delivers as an array.array('b')
+    data = grid_message_data(rng.choice(np.array([-1, 0, 100], dtype=np.int8), size=(side, side)))
+    corner = SimpleNamespace(x=0.0, y=0.0)
+    info = SimpleNamespace(width=side, height=side, resolution=0.05,
+                           origin=SimpleNamespace(position=corner))
+    msg = SimpleNamespace(header=SimpleNamespace(frame_id='map', stamp=None), info=info, data=data)
+
+    decodings = [
+        ('np.array(msg.data)', lambda: np.array(msg.data).reshape((side, side))),
+        ('numpy.asarray(msg.data)', lambda: np.asarray(msg.data).reshape((side, side))),
+        ('np.array(msg.data, int8)', lambda: np.array(msg.data, dtype=np.int8).reshape(
+            (side, side))),
+        ('occupancy_grid_view(msg)', lambda: occupancy_grid_view(msg).data),
+    ]
+    print(f'{side} x {side} grid, {len(msg.data) / 1e6:.1f} MB of int8 payload')
+    print(f"{'decoding':>26} {'latency (ms)':>13} {'allocated (MB)':>15}")
+    for name, decode in decodings:
+        latency = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            decode()
+            latency = min(latency, time.perf_counter() - start)
+
+        tracemalloc.start()
+        data = decode()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        assert data[side - 1, side - 1] == msg.data[-1]
+        print(f'{name:>26} {latency * 1000:>13.3f} {peak / 1e6:>15.1f}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -11,6 +11,8 @@ from std_msgs.msg import Float32
 from rclpy.exceptions import ParameterNotDeclaredException
 from rcl_interfaces.msg import ParameterType
 
+from explorer_map_utils.occupancy_grid import occupancy_grid_view
+
 
 
 class Subscriber(Node):
@@ -51,8 +53,9 @@ class Subscriber(Node):
         self.subscription  # prevent unused variable warning
 
     def listener_callback(self, msg):
-        map_array = numpy.asarray(msg.data)
-        resolution = msg.info.resolution
+        grid = occupancy_grid_view(msg)  # read-only int8 view of the message, no copy
+        map_array = grid.data
+        resolution = grid.resolution
         map_explored = numpy.count_nonzero((map_array <= self.free_thresh) & (map_array > -1)) * resolution**2
         percentage_explored = map_explored/self.free_space
         map_explored_msg = Float32()
@@ -25,6 +25,9 @@ from nav_msgs.msg import OccupancyGrid
 from nav_msgs.msg import MapMetaData
 from nav2_msgs.action import NavigateToPose
 from explorer_interfaces.action import Discover
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from explorer_map_utils.goal_blacklist import GoalBlacklist
+from explorer_map_utils.occupancy_grid import occupancy_grid_view
 
 
 # ros2 action send_goal wander explorer_interfaces/action/Wander "{strategy: 1, map_completed_thres: 0.6}"
@@ -65,11 +68,15 @@ class NavigationClient(Node):
         self.cartographer = CartographerSubscriber()  # a cartographer subscription is created to access the occupancy
         rclpy.spin_once(self.cartographer)
         # grid and determine which positions to navigate to
+        self.blacklist = GoalBlacklist()  # goals Nav2 failed to reach, and their neighbours, are not sent again
+        self.current_goal_position = None  # (x, y) of the goal being sent
+        self.metrics_publisher = self.create_publisher(DiagnosticArray, 'diagnostics', 10)
 
     def goal_response_callback(self, future):
         goal_handle = future.result()
         if not goal_handle.accepted:
             self.get_logger().info('Exploration goal rejected')
+            self.record_failed_goal(GoalStatus.STATUS_UNKNOWN)
             return
 
         self.get_logger().info('Navigation goal accepted')
@@ -84,14 +91,45 @@ class NavigationClient(Node):
             self.get_logger().info('Arrived at destination')
         else:
             self.get_logger().info('Goal failed with status: {0}'.format(status))
+            if status == GoalStatus.STATUS_ABORTED:
+                self.record_failed_goal(status)
 
         rclpy.spin_once(self.cartographer)
 
+    def now(self):
+        return self.get_clock().now().nanoseconds / 1e9
+
+    def record_failed_goal(self, status):
+        """
+        Blacklists the current goal after Nav2 failed to reach it, and publishes the failure metrics.
+
+        :param status: GoalStatus of the failure
+        """
+        if self.current_goal_position is None:
+            return
+        self.blacklist.record_failure(*self.current_goal_position, self.now(), status=status)
+        self.get_logger().info(f'Goal {self.current_goal_position} blacklisted, '
+                               f'{self.blacklist.failures} failed goals so far')
+
+        metrics = self.blacklist.metrics(self.now())
+        diagnostic = DiagnosticStatus()
+        diagnostic.name = f'{self.get_name()}: failed goals'
+        diagnostic.message = f"{metrics['failures']} failed goals"
+        diagnostic.values = [KeyValue(key=key, value=str(value)) for key, value in metrics.items()]
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.get_clock().now().to_msg()
+        diagnostics.status = [diagnostic]
+        self.metrics_publisher.publish(diagnostics)
+
     def send_goal(self):
         self.get_logger().info('Waiting for action server...')
         self._action_client.wait_for_server()
 
         rclpy.spin_once(self.cartographer)  # refresh the list of accessible waypoints
+        # skip the waypoints at or around goals that failed recently
+        while (len(self.cartographer.sorted_accessible_waypoints) > 1 and self.blacklist.is_suppressed(
+                *self.cartographer.sorted_accessible_waypoints[0], self.now())):
+            self.cartographer.sorted_accessible_waypoints = self.cartographer.sorted_accessible_waypoints[1:]
         waypoint = self.cartographer.sorted_accessible_waypoints[0]  # grab the first waypoint
         self.cartographer.sorted_accessible_waypoints = self.cartographer.sorted_accessible_waypoints[1:]  # pop the
         # first element from the list, in case the
@@ -102,6 +140,7 @@ class NavigationClient(Node):
         goal_msg.pose.header.frame_id = 'base_footprint'
         goal_msg.pose.pose.position.x = float(waypoint[0])
         goal_msg.pose.pose.position.y = float(waypoint[1])
+        self.current_goal_position = (goal_msg.pose.pose.position.x, goal_msg.pose.pose.position.y)
         # goal_msg.pose.pose.orientation.w = 1.0
 
         self.get_logger().info(
@@ -139,13 +178,9 @@ class CartographerSubscriber(Node):
         :return: None
         """
 
-        data = np.array(msg.data)  # download the occupancy grid
-        current_map_width = msg.info.width  # get the current map width
-        current_map_height = msg.info.height  # get the current map height
-        resolution = msg.info.resolution  # get the resolution
-
-        # reshape the data so it resembles the map shape
-        data = np.reshape(data, (current_map_height, current_map_width))
+        grid = occupancy_grid_view(msg)  # read-only int8 view of the occupancy grid, shaped like the map
+        data = grid.data
+        resolution = grid.resolution  # get the resolution
 
         # Here we go through every waypoint and save the ones that are accessible.
         # An accessible waypoint is one which has no obstacles, and has few or no unknown squares in the vicinity.
@@ -208,7 +243,7 @@ class CartographerSubscriber(Node):
                     sum += 1000000
                 # if the occupancy state is below 50 and known, just add the value to sum.
                 else:
-                    sum += data[x, y]
+                    sum += int(data[x, y])  # the grid is int8, do not accumulate in it
 
         # average value for the square is computed
         average = sum / (size * size)
@@ -22,6 +22,7 @@ setup(
         'console_scripts': [
             'computation_controller = turtlebot_motion.computation_controller:main',
             'move_controller = turtlebot_motion.move_controller:main',
+            'discoverer = turtlebot_motion.discoverer:main',
         ],
     },
 )
@@ -0,0 +1,12 @@
+import importlib.util
+import os
+import sys
+
+
+# the tests run on the sources of the package, whether pytest is started from the package or
+# by colcon test. explorer_map_utils is taken from the workspace when it is not installed
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if PACKAGE_ROOT not in sys.path:
+    sys.path.insert(0, PACKAGE_ROOT)
+if importlib.util.find_spec('explorer_map_utils') is None:
+    sys.path.append(os.path.join(os.path.dirname(PACKAGE_ROOT), 'explorer_map_utils'))
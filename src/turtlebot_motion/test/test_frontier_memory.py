@@ -0,0 +1,61 @@
+import tracemalloc
+from types import SimpleNamespace
+
+import numpy as np
+
+from turtlebot_motion.frontier_search import FrontierSearch, OccupancyGrid2d, grid_message
+from turtlebot_motion.frontier_search import explored_map, getFrontier, getFrontierBFS
+
+
+SEARCHES = 1000
+
+
+def robot_pose(costmap, mx, my):
+    x, y = costmap.mapToWorld(mx, my)
+    return SimpleNamespace(position=SimpleNamespace(x=x, y=y))
+
+
+def test_frontier_search_memory_is_reclaimed():
+    # a mapped room inside unknown space, the robot stands on a wall so that the search first
+    # looks for a free cell
+    data = np.full((16, 16), -1, dtype=np.int8)
+    data[3:13, 3:13] = 0
+    data[4:6, 4:10] = 100
+    costmap = OccupancyGrid2d(grid_message(data))
+    pose = robot_pose(costmap, 4, 4)
+    expected = getFrontierBFS(pose, costmap, None)
+    assert len(expected) > 0
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        search = FrontierSearch()
+        for _ in range(SEARCHES):
+            assert getFrontierBFS(pose, costmap, None, search) == expected
+        _, peak = tracemalloc.get_traced_memory()
+        del search
+        current, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    # one flag per cell and queues of cell indices, reclaimed once the search is dropped
+    assert peak - baseline < 64 * data.size
+    assert current - baseline < 4096
+
+
+def test_vectorized_frontier_memory_is_reclaimed():
+    costmap = OccupancyGrid2d(explored_map(64))
+    pose = robot_pose(costmap, 4, 4)
+    expected = getFrontier(pose, costmap, None)
+
+    tracemalloc.start()
+    try:
+        baseline, _ = tracemalloc.get_traced_memory()
+        for _ in range(SEARCHES):
+            assert getFrontier(pose, costmap, None) == expected
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    assert peak - baseline < 64 * costmap.getSizeX() * costmap.getSizeY()
+    assert current - baseline < 4096
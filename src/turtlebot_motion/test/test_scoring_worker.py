@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+
+from turtlebot_motion.scoring_worker import ScoringWorker
+from turtlebot_motion.waypoint_scoring import IncrementalScorer
+
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_worker_survives_scoring_error():
+    def generate_waypoints(data, coverage, resolution, clearance, pyramid):
+        if data[0, 0] == 100:
+            raise ValueError('bad map')
+        return np.array([[1.0, 1.0], [2.0, 2.0]])
+
+    worker = ScoringWorker(IncrementalScorer(), generate_waypoints)
+    try:
+        data = np.zeros((60, 60), dtype=np.int8)
+        data[0, 0] = 100
+        failed = worker.submit(data, None, 0.05, np.zeros(2))
+        wait_for(lambda: worker.failures == 1)
+        version, trace = worker.take_error()
+        assert version == failed
+        assert 'bad map' in trace
+        assert worker.take_error() is None
+
+        data[0, 0] = 0
+        scored = worker.submit(data, None, 0.05, np.zeros(2))
+        wait_for(lambda: worker.latest() is not None)
+        result = worker.take()
+        assert result.map_version == scored
+        assert result.full_rescore
+        assert len(result.waypoints) == 2
+    finally:
+        worker.stop()
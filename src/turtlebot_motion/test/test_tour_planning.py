@@ -0,0 +1,26 @@
+import numpy as np
+
+from turtlebot_motion.tour_planning import two_opt
+
+
+def test_two_opt_removes_unreachable_leg():
+    costs = np.array([[0.0, 1.0, 1.0, 5.0],
+                      [1.0, 0.0, np.inf, 1.0],
+                      [1.0, np.inf, 0.0, 1.0],
+                      [5.0, 1.0, 1.0, 0.0]])
+    tour = two_opt([0, 1, 2, 3], costs)
+
+    assert tour.tolist() == [0, 1, 3, 2]
+    assert sum(costs[a, b] for a, b in zip(tour[:-1], tour[1:])) == 3.0
+
+
+def test_two_opt_keeps_shortest_path():
+    rng = np.random.default_rng(0)
+    points = rng.random((12, 2))
+    costs = np.linalg.norm(points[:, None] - points[None, :], axis=2)
+    tour = two_opt(np.arange(12), costs)
+
+    assert tour[0] == 0
+    assert sorted(tour.tolist()) == list(range(12))
+    length = costs[tour[:-1], tour[1:]].sum()
+    assert length <= costs[np.arange(11), np.arange(1, 12)].sum()
@@ -0,0 +1,44 @@
+import numpy as np
+
+from turtlebot_motion.waypoint_queue import WaypointQueue
+
+
+N_WAYPOINTS = 50
+
+
+def test_pop_order_matches_sorted_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(200):
+        queue = WaypointQueue(N_WAYPOINTS)
+        reference = {}
+        indices = rng.integers(0, N_WAYPOINTS, 30)
+        scores = rng.random(30)
+        queue.reset(indices, scores)
+        reference.update(zip(indices.tolist(), scores.tolist()))
+
+        for _ in range(20):
+            # the indices are drawn with repeats, a repeated waypoint keeps its last score
+            indices = rng.integers(0, N_WAYPOINTS, rng.integers(0, 10))
+            if rng.random() < 0.3:
+                queue.remove(indices)
+                for index in indices.tolist():
+                    reference.pop(index, None)
+            else:
+                scores = np.where(rng.random(len(indices)) < 0.2, np.inf, rng.random(len(indices)))
+                queue.update(indices, scores)
+                for index, score in zip(indices.tolist(), scores.tolist()):
+                    if np.isfinite(score):
+                        reference[index] = score
+                    else:
+                        reference.pop(index, None)
+            assert len(queue) == len(reference)
+            if rng.random() < 0.2 and reference:
+                best = max(reference, key=reference.get)
+                assert queue.pop() == best
+                del reference[best]
+
+        expected = sorted(reference, key=reference.get, reverse=True)
+        assert queue.top(5) == expected[:5]
+        assert [queue.pop() for _ in range(len(expected))] == expected
+        assert len(queue) == 0
+        assert queue.pop() is None
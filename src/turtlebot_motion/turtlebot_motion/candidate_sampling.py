@@ -0,0 +1,323 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Frontier-seeded sampling of the discoverer candidate waypoints.
+
+The discoverer used to score a 0.2 m lattice over the whole map, although almost all of it is
+either explored and seen already, or solid. The candidates are now sampled only where there is
+something left to see: in a band of free space around the cells next to unknown space, and in
+the free space the camera has not seen yet.
+
+The band is thinned with Poisson-disk sampling, so that no two candidates are closer than the
+spacing. The sampling is vectorized: the band is divided in buckets of the spacing, every bucket
+keeps its cell of highest priority, and a single pass over the 8 neighbouring buckets drops the
+candidates that conflict with a candidate of higher priority. The priority of a cell is a fixed
+hash of its position, so a region of the map that did not change keeps the same candidates from
+one map to the next. If the band yields more candidates than the budget, the spacing grows until
+it fits, so the number of candidates scored follows the length of the frontier, not the area of
+the map.
+
+On a large map, the band itself is a pass over the whole grid. With a MapPyramid, the band is
+found on the blocks of the pyramid instead, and only the buckets over those blocks are gathered
+from the grid, so that the sampling follows the area around the frontiers.
+
+Run ``python3 -m turtlebot_motion.candidate_sampling`` to compare the number of candidates and
+the sampling latency with the uniform lattice.
+"""
+
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from turtlebot_motion.map_fields import free_space
+from turtlebot_motion.waypoint_scoring import OBSTACLE_THRESHOLD, ROBOT_RADIUS, clearance_map
+from turtlebot_motion.waypoint_scoring import coverage_like, random_map
+
+
+def boundary_band(data, coverage_map, resolution, clearance=None, band=0.6,
+                  robot_radius=ROBOT_RADIUS, obstacle_threshold=OBSTACLE_THRESHOLD):
+    """
+    Gets the free cells worth going to: close to unknown space, or not seen by the camera yet.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param coverage_map: visual coverage map (0 = unseen), or None
+    :param resolution: size of one cell in meters
+    :param clearance: clearance of every cell, in meters, capped at robot_radius or above, as
+    returned by clearance_map. Computed if None
+    :param band: distance from the cells next to unknown space within which cells are kept, in
+    meters
+    :param robot_radius: clearance below which a cell is not accessible, in meters
+    :param obstacle_threshold: occupancy probability above which a cell is an obstacle
+    :return: boolean array of the cells of the band that the robot can stand on
+    """
+    data = np.asarray(data)
+    free = free_space(data, obstacle_threshold)
+    near_unknown = ndimage.binary_dilation(data < 0, structure=np.ones((3, 3), dtype=bool))
+    unseen = coverage_like(coverage_map, data.shape, dtype=np.uint8) == 0
+    boundary = free & (near_unknown | unseen)
+    if not boundary.any():
+        return boundary
+
+    # the band does not need exact distances, the chamfer transform is several times faster
+    within_band = ndimage.distance_transform_cdt(~boundary) * resolution <= band
+    if clearance is None:
+        clearance = clearance_map(data, resolution, cap=robot_radius,
+                                  obstacle_threshold=obstacle_threshold)
+    return free & within_band & (clearance >= robot_radius)
+
+
+def cell_priority(rows, cols):
+    """
+    Hashes cells to fixed pseudo-random priorities, so that the sampling is stable between maps.
+
+    :param rows: row of every cell
+    :param cols: column of every cell
+    :return: int64 array of priorities
+    """
+    # the low 31 bits of the products do not depend on the width of the integers, the 32-bit
+    # arithmetic wraps around to the same priorities in half the memory
+    rows = np.asarray(rows).astype(np.uint32)
+    cols = np.asarray(cols).astype(np.uint32)
+    priority = ((rows * np.uint32(73856093)) ^ (cols * np.uint32(19349663))
+                ^ (rows * cols * np.uint32(83492791)))
+    return (priority & np.uint32(0x7fffffff)).astype(np.int64)
+
+
+def poisson_disk(mask, spacing):
+    """
+    Samples cells of a mask so that no two of them are closer than the spacing.
+
+    :param mask: boolean array of the cells that can be sampled
+    :param spacing: smallest distance between two samples, in cells
+    :return: rows and columns of the samples, and their priority
+    """
+    spacing = max(int(np.ceil(spacing)), 1)
+    rows, cols = np.nonzero(mask)
+    priority = cell_priority(rows, cols)
+
+    # every bucket of (spacing x spacing) cells keeps its cell of highest priority
+    n_bucket_cols = mask.shape[1] // spacing + 1
+    buckets = (rows // spacing) * n_bucket_cols + cols // spacing
+    order = np.lexsort((-priority, buckets))
+    first = np.ones(order.size, dtype=bool)
+    first[1:] = buckets[order[1:]] != buckets[order[:-1]]
+    kept = order[first]
+    rows, cols, priority = rows[kept], cols[kept], priority[kept]
+    if rows.size == 0:
+        return rows, cols, priority
+
+    # samples of neighbouring buckets may still be too close, the one of lower priority is dropped
+    return drop_conflicts(rows, cols, priority, spacing, mask.shape)
+
+
+def drop_conflicts(rows, cols, priority, spacing, shape):
+    """
+    Drops the samples closer than the spacing to a sample of higher priority.
+
+    There is at most one sample per bucket of (spacing x spacing) cells, so only the samples of
+    the 8 neighbouring buckets can be too close.
+
+    :param rows: row of every sample
+    :param cols: column of every sample
+    :param priority: priority of every sample
+    :param spacing: smallest distance between two samples, in cells, an integer
+    :param shape: shape of the grid
+    :return: rows and columns of the samples kept, and their priority
+    """
+    bucket_rows, bucket_cols = rows // spacing + 1, cols // spacing + 1
+    grid = np.full((shape[0] // spacing + 3, shape[1] // spacing + 3), -1, dtype=np.int64)
+    grid[bucket_rows, bucket_cols] = np.arange(rows.size)
+    dropped = np.zeros(rows.size, dtype=bool)
+    for d_row in (-1, 0, 1):
+        for d_col in (-1, 0, 1):
+            if d_row == 0 and d_col == 0:
+                continue
+            neighbour = grid[bucket_rows + d_row, bucket_cols + d_col]
+            has_neighbour = neighbour >= 0
+            neighbour = np.where(has_neighbour, neighbour, 0)
+            distance2 = (rows - rows[neighbour]) ** 2 + (cols - cols[neighbour]) ** 2
+            too_close = distance2 < spacing ** 2
+            dropped |= has_neighbour & too_close & (priority[neighbour] > priority)
+    return rows[~dropped], cols[~dropped], priority[~dropped]
+
+
+def coarse_band(pyramid, resolution, band=0.6, level=1):
+    """
+    Gets the blocks of a pyramid level that may hold cells of the band of boundary_band.
+
+    A block is kept if it has free cells and is within the band of a block with unknown or unseen
+    cells, one block further for the free cells next to the unknown cells of a neighbouring block.
+    The blocks are a superset of the band, by up to two blocks.
+
+    :param pyramid: MapPyramid of the grid
+    :param resolution: size of one cell in meters
+    :param band: distance from the cells next to unknown space within which cells are kept, in
+    meters
+    :param level: level of the pyramid
+    :return: boolean array of the blocks of the level
+    """
+    flagged = pyramid.any('unknown', level) | pyramid.any('unseen', level)
+    reach = int(np.ceil(band / (pyramid.block_size(level) * resolution))) + 1
+    near = ndimage.maximum_filter(flagged, size=2 * reach + 1, mode='constant', cval=False)
+    return near & pyramid.any('free', level)
+
+
+def sample_blocks(data, clearance, blocks, block_size, spacing, lattice=8,
+                  robot_radius=ROBOT_RADIUS, obstacle_threshold=OBSTACLE_THRESHOLD):
+    """
+    Samples cells of the given blocks so that no two of them are closer than the spacing.
+
+    This is poisson_disk over the free cells of the blocks the robot can stand on, where only the
+    buckets of the spacing that overlap the blocks are gathered from the grid, so that the cost
+    follows the area of the blocks instead of the area of the map.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param clearance: clearance of every cell, in meters, as returned by clearance_map
+    :param blocks: boolean array of the blocks to sample, one per (block_size x block_size) cells
+    :param block_size: side of the blocks, in cells
+    :param spacing: smallest distance between two samples, in cells
+    :param lattice: smallest number of cells tried along each side of a bucket. Above twice this
+    spacing, the samples lie on a lattice of spacing // lattice cells
+    :param robot_radius: clearance below which a cell is not accessible, in meters
+    :param obstacle_threshold: occupancy probability above which a cell is an obstacle
+    :return: rows and columns of the samples, and their priority
+    """
+    spacing = max(int(np.ceil(spacing)), 1)
+    height, width = data.shape
+    block_rows, block_cols = np.nonzero(blocks)
+    if block_rows.size == 0:
+        return block_rows, block_cols, cell_priority(block_rows, block_cols)
+
+    # the buckets overlapping every block: a block spans at most 'span' buckets along each side
+    n_bucket_rows, n_bucket_cols = height // spacing + 1, width // spacing + 1
+    first_rows, first_cols = block_rows * block_size // spacing, block_cols * block_size // spacing
+    last_rows = np.minimum((block_rows + 1) * block_size - 1, height - 1) // spacing
+    last_cols = np.minimum((block_cols + 1) * block_size - 1, width - 1) // spacing
+    overlapped = np.zeros((n_bucket_rows, n_bucket_cols), dtype=bool)
+    span = -(-block_size // spacing) + 1
+    for d_row in range(span):
+        for d_col in range(span):
+            overlapped[np.minimum(first_rows + d_row, last_rows),
+                       np.minimum(first_cols + d_col, last_cols)] = True
+    buckets = np.flatnonzero(overlapped)
+
+    # every bucket keeps its cell of highest priority, as in poisson_disk, among the cells of a
+    # lattice of stride spacing // lattice, so that the cells tried per bucket do not grow with
+    # the spacing. The cells are indexed with broadcast (rows, 1) and (1, columns) arrays
+    offsets = np.arange(0, spacing, max(spacing // lattice, 1))
+    rows = (buckets // n_bucket_cols * spacing)[:, None, None] + offsets[None, :, None]
+    cols = (buckets % n_bucket_cols * spacing)[:, None, None] + offsets[None, None, :]
+    inside = (rows < height) & (cols < width)
+    rows, cols = np.minimum(rows, height - 1), np.minimum(cols, width - 1)
+    eligible = (inside & blocks[rows // block_size, cols // block_size]
+                & (clearance[rows, cols] >= robot_radius))
+    if robot_radius <= 0.0:
+        # otherwise the cells that are not free have no clearance, and fail the check above
+        cell_data = data[rows, cols]
+        eligible &= (cell_data >= 0) & (cell_data <= obstacle_threshold)
+    priority = np.where(eligible, cell_priority(rows, cols), -1).reshape(len(buckets), -1)
+    best = np.argmax(priority, axis=1)
+    priority = priority[np.arange(len(buckets)), best]
+    kept = priority >= 0
+    best, buckets, priority = best[kept], buckets[kept], priority[kept]
+    rows = buckets // n_bucket_cols * spacing + offsets[best // len(offsets)]
+    cols = buckets % n_bucket_cols * spacing + offsets[best % len(offsets)]
+    return drop_conflicts(rows, cols, priority, spacing, data.shape)
+
+
+def sample_candidates(data, coverage_map, resolution, clearance=None, spacing=0.4, budget=2000,
+                      band=0.6, robot_radius=ROBOT_RADIUS, obstacle_threshold=OBSTACLE_THRESHOLD,
+                      max_rounds=4, pyramid=None, level=1):
+    """
+    Samples the candidate waypoints of a map, around its frontiers and unseen regions.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param coverage_map: visual coverage map (0 = unseen), or None
+    :param resolution: size of one cell in meters
+    :param clearance: clearance of every cell, see boundary_band, computed if None
+    :param spacing: smallest distance between two candidates, in meters
+    :param budget: largest number of candidates
+    :param band: distance to the frontiers within which candidates are sampled, in meters
+    :param robot_radius: clearance below which a cell is not accessible, in meters
+    :param obstacle_threshold: occupancy probability above which a cell is an obstacle
+    :param max_rounds: number of times the spacing may grow to fit the budget
+    :param pyramid: MapPyramid of the grid, up to date with it, or None. With a pyramid, the band
+    is made of the blocks of coarse_band, and only those blocks are sampled
+    :param level: level of the pyramid the band is computed at
+    :return: array of shape (n, 2) of waypoints in map coordinates (x, y), in meters
+    """
+    spacing_cells = spacing / resolution
+    if pyramid is None:
+        mask = boundary_band(data, coverage_map, resolution, clearance=clearance, band=band,
+                             robot_radius=robot_radius, obstacle_threshold=obstacle_threshold)
+
+        def sample(spacing_cells):
+            return poisson_disk(mask, spacing_cells)
+    else:
+        data = np.asarray(data)
+        if clearance is None:
+            clearance = clearance_map(data, resolution, cap=robot_radius,
+                                      obstacle_threshold=obstacle_threshold)
+        blocks = coarse_band(pyramid, resolution, band=band, level=level)
+        block_size = pyramid.block_size(level)
+        # the free cells of the blocks bound the number of samples, the spacing starts where
+        # they fit the budget
+        free_cells = pyramid.count('free', level)[blocks].sum()
+        spacing_cells = max(spacing_cells, np.sqrt(free_cells / budget))
+
+        def sample(spacing_cells):
+            return sample_blocks(data, clearance, blocks, block_size, spacing_cells,
+                                 robot_radius=robot_radius, obstacle_threshold=obstacle_threshold)
+
+    rows, cols, priority = sample(spacing_cells)
+    for _ in range(max_rounds):
+        if rows.size <= budget:
+            break
+        # the number of samples falls with the square of the spacing
+        spacing_cells *= 1.05 * np.sqrt(rows.size / budget)
+        rows, cols, priority = sample(spacing_cells)
+    if rows.size > budget:
+        kept = np.sort(np.argsort(-priority, kind='stable')[:budget])
+        rows, cols = rows[kept], cols[kept]
+
+    # the center of the cell, so that waypoints_to_cells maps the waypoint back to it
+    return np.column_stack(((cols + 0.5) * resolution, (rows + 0.5) * resolution))
+
+
+def benchmark(map_sizes=(200, 400, 800, 1600), resolution=0.05, step=0.2, explored=0.8,
+              repeats=3):
+    """
+    Prints the number of candidates and the sampling latency against the map size.
+
+    The maps are random, with a square unknown region in their middle so that a fraction
+    'explored' of the map is known, and fully seen by the camera except for that region.
+
+    :param map_sizes: side of the square maps, in cells
+    :param resolution: size of one cell in meters
+    :param step: distance between the waypoints of the uniform lattice, in meters
+    :param explored: fraction of the map that is known
+    :param repeats: number of runs, the best one is reported
+    """
+    print(f"{'map (cells)':>12} {'lattice':>8} {'candidates':>11} {'sampling (ms)':>14}")
+    for side in map_sizes:
+        data, _ = random_map(side, side)
+        data[data != 100] = 0
+        data[np.random.default_rng(0).random((side, side)) < 0.98] = 0  # sparse obstacles
+        hole = int(side * np.sqrt(1 - explored))
+        start_cell = (side - hole) // 2
+        data[start_cell:start_cell + hole, start_cell:start_cell + hole] = -1
+        coverage_map = (data >= 0).astype(np.uint8)
+
+        lattice = len(np.arange(0.0, side * resolution, step)) ** 2
+        latency = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            candidates = sample_candidates(data, coverage_map, resolution)
+            latency = min(latency, time.perf_counter() - start)
+        print(f'{side:>5} x {side:<4} {lattice:>8} {len(candidates):>11} {latency * 1000:>14.1f}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -1,13 +1,16 @@
 from rclpy.node import Node
 from std_msgs.msg import Bool
 from std_msgs.msg import Float32MultiArray
+from nav_msgs.msg import Odometry
+from rclpy.qos import QoSProfile, ReliabilityPolicy
 #from geometry_msgs.msg import Vector3
 import rclpy
 import depthai as dai
 dai.LogLevel.DEBUG
 dai.LogOutputLevel.CONSOLE
 import math
-import tf_transformations
+
+from turtlebot_motion.odometry_buffer import OdometryBuffer
 
 class BallDetector(Node):
     def __init__(self):
@@ -16,6 +19,12 @@ class BallDetector(Node):
         self.ball_detected_pub = self.create_publisher(Bool, '/ball_detected', 10)
         self.ball_position_pub = self.create_publisher(Float32MultiArray, '/ball_position', 10)
 
+        # The detections are projected from the pose of the robot when the frame was captured
+        self.odom_buffer = OdometryBuffer()
+        qos_profile = QoSProfile(depth=10)
+        qos_profile.reliability = ReliabilityPolicy.BEST_EFFORT
+        self.odom_sub = self.create_subscription(Odometry, '/odom', self.odom_buffer.append_odometry, qos_profile)
+
         self.pipeline = dai.Pipeline()
 
         # Color Camera
@@ -68,13 +77,26 @@ class BallDetector(Node):
 
         self.timer = self.create_timer(1, self.process)
 
+    def capture_time(self, in_detections):
+        """
+        Gets the time a frame was captured, in the clock of the node.
+
+        The device timestamps are synced with the host steady clock, so the age of the frame is
+        subtracted from the current time.
+
+        :param in_detections: detections of the frame
+        :return: time in seconds
+        """
+        age = (dai.Clock.now() - in_detections.getTimestamp()).total_seconds()
+        return self.get_clock().now().nanoseconds / 1e9 - age
+
     def process(self):
-        current_odom = self.latest_odom
         if not self.q_detections.has():
             print("No detections available.")
             return
 
         in_detections = self.q_detections.get()
+        current_pose = self.odom_buffer.pose_at(self.capture_time(in_detections))
         detected = Bool()
         ball_info = Float32MultiArray()
 
@@ -90,11 +112,8 @@ class BallDetector(Node):
                 distance = math.sqrt(x**2 + z**2)
                 angle_rad = math.atan2(x, z)
 
-                if current_odom is not None:
-                    robot_x = current_odom.pose.pose.position.x
-                    robot_y = current_odom.pose.pose.position.y
-                    q = current_odom.pose.pose.orientation
-                    _, _, robot_yaw = tf_transformations.euler_from_quaternion([q.x, q.y, q.z, q.w])
+                if current_pose is not None:
+                    robot_x, robot_y, robot_yaw = current_pose
                     ball_x = robot_x + distance * math.cos(robot_yaw + angle_rad)
                     ball_y = robot_y + distance * math.sin(robot_yaw + angle_rad)
                 else:
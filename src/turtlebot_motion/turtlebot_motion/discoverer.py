@@ -14,7 +14,6 @@ from cv_bridge import CvBridge
 import cv2
 from ultralytics import YOLO
 from geometry_msgs.msg import Twist
-import time
 import math
 
 
@@ -25,6 +24,9 @@ from sensor_msgs.msg import LaserScan, Image
 
 from rclpy.action import ActionServer, CancelResponse
 from rclpy.action import ActionClient
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup, ReentrantCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
+from rclpy.task import Future
 from rcl_interfaces.msg import ParameterType
 from action_msgs.msg import GoalStatus
 from nav_msgs.msg import Odometry
@@ -35,13 +37,34 @@ from rclpy.qos import QoSProfile, ReliabilityPolicy
 from std_msgs.msg import Float32MultiArray
 from nav_msgs.msg import OccupancyGrid
 from nav_msgs.msg import MapMetaData
-from nav2_msgs.action import NavigateToPose
-
-from matplotlib import pyplot as plt
+from nav2_msgs.action import FollowWaypoints, NavigateToPose
+
+from diagnostic_msgs.msg import DiagnosticArray, DiagnosticStatus, KeyValue
+from geometry_msgs.msg import Point, PoseStamped
+from visualization_msgs.msg import Marker, MarkerArray
+
+from explorer_map_utils.goal_blacklist import GoalBlacklist
+from explorer_map_utils.occupancy_grid import occupancy_grid_view
+from turtlebot_motion.candidate_sampling import sample_candidates
+from turtlebot_motion.latency_monitor import LatencyMonitor
+from turtlebot_motion.map_fields import free_space, position_to_cell
+from turtlebot_motion.map_pyramid import MapPyramid
+from turtlebot_motion.mission_snapshot import SnapshotStore
+from turtlebot_motion.odometry_buffer import OdometryBuffer, stamp_to_seconds
+from turtlebot_motion.rotation_control import RotationController, angle_difference
+from turtlebot_motion.scoring_worker import ScoringWorker
+from turtlebot_motion.tour_planning import geodesic_costs, plan_tour
+from turtlebot_motion.view_gain import ViewGainScorer, heading_gains
+from turtlebot_motion.waypoint_queue import WaypointQueue
+from turtlebot_motion.waypoint_scoring import IncrementalScorer
 
 
 # ros2 action send_goal wander explorer_interfaces/action/Wander "{strategy: 1, map_completed_thres: 0.6}"
 
+# At the beginning, when all values are uncertain, these waypoints are used so the robot begins to navigate
+FALLBACK_WAYPOINTS = [np.array([1.5, 0.0]), np.array([0.0, 1.5]), np.array([-1.5, 0.0]), np.array([0.0, -1.5])]
+
+
 class LaserSubscriber(Node):
     def __init__(self):
         super().__init__('laser_subscriber')
@@ -84,70 +107,336 @@ class OdomSubscriber(Node):
         qos_profile = QoSProfile(depth=10)
         qos_profile.reliability = ReliabilityPolicy.BEST_EFFORT
         self.subscription = self.create_subscription(Odometry, 'odom', self.listener_callback, qos_profile)
-        self.odom_buffer = []
+        self.odom_buffer = OdometryBuffer()  # poses of the last seconds, to get the pose at the time of a capture
         self.current_position=None
+        self.stamp = None  # capture time of current_position, in seconds
+        self.yaw_rate = 0.0  # rad/s
         self.subscription  # prevent unused variable warning
 
     def listener_callback(self, msg):
-        self.odom_buffer.append(msg)
-        if len(self.odom_buffer) > 10:
-            self.odom_buffer.pop(0)  # Keep only the last 10 odometry messages   
+        self.odom_buffer.append_odometry(msg)
         self.current_position=msg.pose.pose.position            
+        self.stamp = stamp_to_seconds(msg.header.stamp)
+        self.yaw_rate = msg.twist.twist.angular.z
 
 
 
 class NavigationClient(Node):
     def __init__(self):
         super().__init__('navigation_client')
-        self._action_client = ActionClient(self, NavigateToPose, 'navigate_to_pose')
+        # All the nodes are spun by a single executor, see nodes(). The action clients share a callback group, the
+        # timers of the decision loop are in another one so that they fire while an action callback runs.
+        self.action_group = MutuallyExclusiveCallbackGroup()
+        self.timer_group = ReentrantCallbackGroup()
+        self._action_client = ActionClient(self, NavigateToPose, 'navigate_to_pose', callback_group=self.action_group)
         self.cartographer = CartographerSubscriber()  # a cartographer subscription is created to access the occupancy
-        rclpy.spin_once(self.cartographer)
         self.subscription = OdomSubscriber()  # a subscription to the odometry is created to access the robot position
-        rclpy.spin_once(self.subscription)
+        self.cartographer.odometry = self.subscription.odom_buffer  # the maps are scored from the pose they were built at
         self.last_photo_pose = None  # this variable is used to store the last photo pose
         # grid and determine which positions to navigate to
  # prevent unused variable warning
+        self.blacklist = GoalBlacklist()  # goals Nav2 failed to reach, and their neighbours, are not sent again
+        self.current_goal_position = None  # (x, y) of the goal being sent
+        self.metrics_publisher = self.create_publisher(DiagnosticArray, 'diagnostics', 10)
+
+        # Tour mode: the tour_size best waypoints are visited in a single FollowWaypoints action, ordered over
+        # 'euclidean' or 'geodesic' costs. The tail of the tour is planned again, at most every tour_replan_period
+        # seconds, when the map changes.
+        self.declare_parameter('tour_mode', False)
+        self.declare_parameter('tour_size', 5)
+        self.declare_parameter('tour_costs', 'euclidean')
+        self.declare_parameter('tour_replan_period', 10.0)
+        self.tour_mode = self.get_parameter('tour_mode').get_parameter_value().bool_value
+        self.tour_size = self.get_parameter('tour_size').get_parameter_value().integer_value
+        self.tour_costs = self.get_parameter('tour_costs').get_parameter_value().string_value
+        self.tour_replan_period = self.get_parameter('tour_replan_period').get_parameter_value().double_value
+        self._follow_client = ActionClient(self, FollowWaypoints, 'follow_waypoints', callback_group=self.action_group)
+        self.tour_index = 0  # index of the tour waypoint being navigated to, from the FollowWaypoints feedback
+
+        # Mission metrics, to compare the modes: time until the camera has seen 90% of the known free space
+        self.start_time = self.now()
+        self.time_to_coverage = None
+
+        # Decision loop: the goals are checked every decision_period seconds. The time between the capture of the
+        # sensor data a decision uses and the decision itself is measured, and should stay below max_decision_latency.
+        self.declare_parameter('decision_period', 0.1)
+        self.declare_parameter('max_decision_latency', 0.5)
+        self.decision_period = self.get_parameter('decision_period').get_parameter_value().double_value
+        max_decision_latency = self.get_parameter('max_decision_latency').get_parameter_value().double_value
+        self.latency = LatencyMonitor(bound=max_decision_latency)
+        self.metrics_timer = self.create_timer(10.0, self.publish_metrics, callback_group=self.timer_group)
+
+        # Ball scan: the robot turns to every stop with the odometry feedback, slowing down to spin_deceleration
+        # (rad/s^2) before it, and the stop ends once the yaw rate is below spin_settle_rate (rad/s)
+        self.declare_parameter('spin_max_speed', 2.0)
+        self.declare_parameter('spin_deceleration', 3.0)
+        self.declare_parameter('spin_tolerance_deg', 1.5)
+        self.declare_parameter('spin_settle_rate', 0.05)
+        self.rotation = RotationController(
+            max_speed=self.get_parameter('spin_max_speed').get_parameter_value().double_value,
+            deceleration=self.get_parameter('spin_deceleration').get_parameter_value().double_value,
+            tolerance=math.radians(self.get_parameter('spin_tolerance_deg').get_parameter_value().double_value),
+            settle_rate=self.get_parameter('spin_settle_rate').get_parameter_value().double_value)
+        self.scan_duration = None  # time of the last scan, in seconds
+        self.scan_error = None  # heading error at the end of the last scan, in degrees
+
+        # Scanning stops: every scan_check_distance meters, the unseen area the camera would see from every stop of a
+        # scan is cast over the visual coverage map. The robot stops only if the stops add up to scan_min_unseen_area
+        # (m^2), and only turns to the stops showing at least scan_min_heading_area (m^2).
+        self.declare_parameter('scan_check_distance', 0.5)
+        self.declare_parameter('scan_min_unseen_area', 1.0)
+        self.declare_parameter('scan_min_heading_area', 0.1)
+        self.scan_check_distance = self.get_parameter('scan_check_distance').get_parameter_value().double_value
+        self.scan_min_unseen_area = self.get_parameter('scan_min_unseen_area').get_parameter_value().double_value
+        self.scan_min_heading_area = self.get_parameter('scan_min_heading_area').get_parameter_value().double_value
+        self.last_scan_check = None  # position of the last scan decision
+
+        # Goal-update mode: while a goal is active, it is replaced by the best waypoint, with a single preempting goal,
+        # when it is no longer a reachable candidate or the best waypoint beats it by goal_update_margin (utility).
+        # Goals are replaced at most every goal_update_period seconds, and not within goal_update_min_distance (m).
+        self.declare_parameter('goal_update', False)
+        self.declare_parameter('goal_update_margin', 20.0)
+        self.declare_parameter('goal_update_period', 2.0)
+        self.declare_parameter('goal_update_min_distance', 0.5)
+        self.goal_update = self.get_parameter('goal_update').get_parameter_value().bool_value
+        self.goal_update_margin = self.get_parameter('goal_update_margin').get_parameter_value().double_value
+        self.goal_update_period = self.get_parameter('goal_update_period').get_parameter_value().double_value
+        self.goal_update_min_distance = self.get_parameter(
+            'goal_update_min_distance').get_parameter_value().double_value
+        self.preempted_goals = set()  # uuids of the goals replaced by a newer one, their abort is not a failure
+        self.goal_updates = 0  # number of goals replaced
+        self.travelled = 0.0  # distance travelled towards goals, in meters
+        self.wasted_travel = 0.0  # distance travelled towards goals that were obsolete, in meters
+
+        # Warm restart: the failed goals, the queued waypoints and the mission metrics are saved to snapshot_directory
+        # every snapshot_period seconds, and restored from it at startup, so a restarted discoverer resumes the
+        # mission instead of starting it again. '' disables the snapshots.
+        self.declare_parameter('snapshot_directory', '')
+        self.declare_parameter('snapshot_period', 5.0)
+        snapshot_directory = self.get_parameter('snapshot_directory').get_parameter_value().string_value
+        snapshot_period = self.get_parameter('snapshot_period').get_parameter_value().double_value
+        self.snapshot = None
+        if snapshot_directory:
+            self.snapshot = SnapshotStore(os.path.expanduser(snapshot_directory), 'mission')
+            self.restore_snapshot()
+            self.snapshot_timer = self.create_timer(snapshot_period, self.save_snapshot,
+                                                    callback_group=self.timer_group)
+
+    def nodes(self):
+        """
+        Gets the navigation client and its helper nodes, to add them to the executor.
+
+        :return: list of nodes
+        """
+        return [self, self.cartographer, self.cartographer.visual_node, self.subscription]
 
+    async def sleep(self, duration):
+        """
+        Waits without blocking the executor, the other callbacks run in the meantime.
+
+        :param duration: time to wait, in seconds
+        """
+        future = Future()
+        timer = self.create_timer(duration, lambda: future.done() or future.set_result(None),
+                                  callback_group=self.timer_group)
+        try:
+            await future
+        finally:
+            self.destroy_timer(timer)
+
+    async def wait_for_server(self, client):
+        """
+        Waits until the action server of a client is available, without blocking the executor.
+
+        :param client: ActionClient
+        """
+        while not client.server_is_ready():
+            await self.sleep(0.5)
+
+    def record_latency(self, sensor, capture_time):
+        """
+        Records the latency of a decision taken now from the data of a sensor, and warns if it is late.
+
+        :param sensor: name of the sensor, such as 'odom', 'ball' or 'map'
+        :param capture_time: capture time of the data, in seconds, or None if unknown
+        """
+        latency = self.latency.record(sensor, capture_time, self.now())
+        if latency is not None and latency > self.latency.bound:
+            self.get_logger().warn(f'Decision taken on {sensor} data {latency:.3f} s old')
 
     def goal_response_callback(self, future):
         goal_handle = future.result()
         if not goal_handle.accepted:
             self.get_logger().info('Exploration goal rejected')
+            self.record_failed_goal(GoalStatus.STATUS_UNKNOWN)
             return
 
         self.get_logger().info('Navigation goal accepted')
 
         self._get_result_future = goal_handle.get_result_async()
-        self._get_result_future.add_done_callback(self.get_result_callback)
+        self._get_result_future.add_done_callback(lambda future: self.get_result_callback(future, goal_handle))
 
-    def get_result_callback(self, future):
+    def get_result_callback(self, future, goal_handle=None):
         result = future.result().result
         status = future.result().status
-        if status == GoalStatus.STATUS_SUCCEEDED:
+        preempted = goal_handle is not None and bytes(goal_handle.goal_id.uuid) in self.preempted_goals
+        if preempted:
+            self.preempted_goals.discard(bytes(goal_handle.goal_id.uuid))
+            self.get_logger().info('Goal replaced by a better one')
+        elif status == GoalStatus.STATUS_SUCCEEDED:
             self.get_logger().info('Arrived at destination')
         else:
             self.get_logger().info('Goal failed with status: {0}'.format(status))
+            # goals cancelled to take photos did not fail
+            if status == GoalStatus.STATUS_ABORTED:
+                self.record_failed_goal(status)
+
+    def now(self):
+        return self.get_clock().now().nanoseconds / 1e9
 
-        rclpy.spin_once(self.cartographer)
-        rclpy.spin_once(self.subscription)    
+    def record_failed_goal(self, status):
+        """
+        Blacklists the current goal after Nav2 failed to reach it, and publishes the failure metrics.
+
+        :param status: GoalStatus of the failure
+        """
+        if self.current_goal_position is None:
+            return
+        self.blacklist.record_failure(*self.current_goal_position, self.now(), status=status)
+        self.get_logger().info(f'Goal {self.current_goal_position} blacklisted, '
+                               f'{self.blacklist.failures} failed goals so far')
+        self.publish_metrics()
+
+    def publish_metrics(self):
+        """
+        Publishes the failed goal metrics of the blacklist and the coverage metrics on /diagnostics.
+        """
+        metrics = self.blacklist.metrics(self.now())
+        metrics['tour_mode'] = self.tour_mode
+        metrics['time_to_90_coverage'] = self.time_to_coverage
+        metrics['goal_update'] = self.goal_update
+        metrics['goal_updates'] = self.goal_updates
+        metrics['travelled'] = self.travelled
+        metrics['wasted_travel'] = self.wasted_travel
+        metrics['scan_duration'] = self.scan_duration
+        metrics['scan_error_deg'] = self.scan_error
+        metrics.update(self.latency.metrics())
+        status = DiagnosticStatus()
+        status.name = f'{self.get_name()}: failed goals'
+        status.message = f"{metrics['failures']} failed goals"
+        status.values = [KeyValue(key=key, value=str(value)) for key, value in metrics.items()]
+        diagnostics = DiagnosticArray()
+        diagnostics.header.stamp = self.get_clock().now().to_msg()
+        diagnostics.status = [status]
+        self.metrics_publisher.publish(diagnostics)
+
+    def save_snapshot(self):
+        """
+        Saves the failed goals, the queued waypoints and the mission metrics to the snapshot directory.
+        """
+        now = self.now()
+        cells, penalties = self.blacklist.export_state(now)
+        arrays = {'blacklist_cells': cells, 'blacklist_penalties': penalties}
+        metadata = {
+            'elapsed': now - self.start_time,
+            'time_to_coverage': self.time_to_coverage,
+            'failures': self.blacklist.failures,
+            'failures_by_status': list(self.blacklist.failures_by_status.items()),
+            'goal_updates': self.goal_updates,
+            'travelled': self.travelled,
+            'wasted_travel': self.wasted_travel,
+        }
+        waypoints = self.cartographer.snapshot_state()
+        if waypoints is not None:
+            arrays.update(waypoints[0])
+            metadata['waypoints'] = waypoints[1]
+        self.snapshot.save(arrays, metadata)
+
+    def restore_snapshot(self):
+        """
+        Restores the failed goals, the queued waypoints and the mission metrics of the last snapshot.
+
+        The mission time goes on from the time of the snapshot, the clock may have restarted with the node.
+        """
+        snapshot = self.snapshot.load()
+        if snapshot is None:
+            return
+        arrays, metadata = snapshot
+        now = self.now()
+        self.blacklist.restore_state(arrays['blacklist_cells'], arrays['blacklist_penalties'], now,
+                                     failures=metadata['failures'],
+                                     failures_by_status=metadata['failures_by_status'])
+        self.start_time = now - metadata['elapsed']
+        self.time_to_coverage = metadata['time_to_coverage']
+        self.goal_updates = metadata['goal_updates']
+        self.travelled = metadata['travelled']
+        self.wasted_travel = metadata['wasted_travel']
+        if 'waypoints' in metadata:
+            self.cartographer.restore_state(arrays, metadata['waypoints'])
+        self.get_logger().info(f'Restored the mission of snapshot {self.snapshot.generation}: '
+                               f'{metadata["elapsed"]:.1f} s, {self.blacklist.failures} failed goals, '
+                               f'{len(self.cartographer.waypoint_queue)} waypoints queued')
+
+    def is_blacklisted(self, waypoint):
+        """
+        Checks whether a waypoint is suppressed because goals failed at or around it.
+
+        :param waypoint: waypoint in map coordinates (x, y)
+        :return: True if the waypoint should not be sent
+        """
+        return self.blacklist.is_suppressed(float(waypoint[0] + self.cartographer.origin[0]),
+                                            float(waypoint[1] + self.cartographer.origin[1]), self.now())
 
     def distance(self,p1, p2):
         return ((p1.x - p2.x)**2 + (p1.y - p2.y)**2)**0.5   
 
-    def send_goal(self, ball_position_subscriber, cmd_vel_publisher, command=Twist()):
-        self.get_logger().info('Waiting for action server...')
-        self._action_client.wait_for_server()
+    def goal_message(self, waypoint):
+        """
+        Builds the navigation goal of a waypoint, and makes it the current goal.
 
-        #rclpy.spin_once(self.cartographer)  # refresh the list of accessible waypoints
-        waypoint = self.cartographer.sorted_accessible_waypoints[0]  # grab the first waypoint
-        self.cartographer.sorted_accessible_waypoints = self.cartographer.sorted_accessible_waypoints[1:]  # pop the
-        # first element from the list, in case the
-        # accessible waypoints didn't refresh
-        # write command
+        :param waypoint: waypoint in map coordinates (x, y)
+        :return: NavigateToPose goal
+        """
         goal_msg = NavigateToPose.Goal()
         goal_msg.pose.header.frame_id = 'odom'
         goal_msg.pose.pose.position.x = float(waypoint[0] + self.cartographer.origin[0])
         goal_msg.pose.pose.position.y = float(waypoint[1] + self.cartographer.origin[1])
+        self.current_goal_position = (goal_msg.pose.pose.position.x, goal_msg.pose.pose.position.y)
+        return goal_msg
+
+    def goal_obsolete(self, position):
+        """
+        Checks the current goal against the newest scoring result, with hysteresis.
+
+        The goal is obsolete when it is no longer an accessible candidate, for instance because the camera has seen its
+        surroundings, or when the best waypoint in the queue beats its utility by goal_update_margin. The utility
+        includes the travel from the robot, so the goal gets harder to beat as the robot gets closer to it.
+
+        :param position: current position of the robot
+        :return: True if the goal should be replaced
+        """
+        result = self.cartographer.scoring_result
+        best = self.cartographer.waypoint_queue.peek()
+        if result is None or best is None or self.current_goal_position is None:
+            return False
+        goal_x, goal_y = self.current_goal_position
+        if math.hypot(position.x - goal_x, position.y - goal_y) < self.goal_update_min_distance:
+            return False  # about to arrive
+        index = self.cartographer.waypoint_index(self.current_goal_position)
+        if index is None or not result.accessible[index]:
+            return True
+        return index != best and result.utility[best] > result.utility[index] + self.goal_update_margin
+
+    async def send_goal(self, ball_position_subscriber, cmd_vel_publisher, command=Twist()):
+        self.get_logger().info('Waiting for action server...')
+        await self.wait_for_server(self._action_client)
+
+        waypoint = self.cartographer.pop_waypoint(self.is_blacklisted)  # pop the best waypoint that is not
+        # blacklisted, in case the accessible waypoints didn't refresh
+        if self.cartographer.scoring_result is not None:
+            self.record_latency('map', self.cartographer.scoring_result.stamp)
+        # write command
+        goal_msg = self.goal_message(waypoint)
         self.last_photo_pose = self.get_current_position()  # save the last photo pose
         # goal_msg.pose.pose.orientation.w = 1.0
 
@@ -157,47 +446,74 @@ class NavigationClient(Node):
 
         self._send_goal_future = self._action_client.send_goal_async(goal_msg)
         self._send_goal_future.add_done_callback(self.goal_response_callback)
+        goal_handle = await self._send_goal_future
+        if not goal_handle.accepted:
+            return
+        result_future = goal_handle.get_result_async()
 
-        rclpy.spin_until_future_complete(self, self._send_goal_future)
-
-        goal_handle = self._send_goal_future.result()
-        get_result_future = goal_handle.get_result_async()
-        
-        #rclpy.spin_until_future_complete(self, get_result_future)
         position= self.get_current_position()
         if position is not None:
             self.get_logger().info(f'Robot position -> x: {position.x}, y: {position.y}, z: {position.z}')
-               
-        while not get_result_future.done():
-            rclpy.spin_once(self)
-            rclpy.spin_once(ball_position_subscriber)
+
+        # the executor keeps running the callbacks, the loop only looks at the newest data every decision_period
+        previous_pos = position
+        last_update = self.now()
+        while not result_future.done():
+            await self.sleep(self.decision_period)
             if ball_position_subscriber.ball_position is not None:
-                print("Ball position detected, stopping navigation.")
+                self.record_latency('ball', ball_position_subscriber.stamp)
+                self.get_logger().info("Ball position detected, stopping navigation.")
                 break
             current_pos = self.get_current_position()
-            if current_pos is None:
-                self.get_logger().info("No odometry data available yet.")
+            if current_pos is None or self.last_photo_pose is None:
+                self.last_photo_pose = current_pos
                 continue
+            self.record_latency('odom', self.subscription.stamp)
+
+            # the travel while the goal is obsolete is wasted, whether the goal is replaced or not
+            step = 0.0 if previous_pos is None else self.distance(current_pos, previous_pos)
+            previous_pos = current_pos
+            self.travelled += step
+            self.cartographer.apply_scoring_result()
+            if self.goal_obsolete(current_pos):
+                self.wasted_travel += step
+                if self.goal_update and self.now() - last_update >= self.goal_update_period:
+                    # a new goal preempts the active one in Nav2, without a cancel round-trip
+                    self.preempted_goals.add(bytes(goal_handle.goal_id.uuid))
+                    goal_msg = self.goal_message(self.cartographer.pop_waypoint(self.is_blacklisted))
+                    self.record_latency('map', self.cartographer.scoring_result.stamp)
+                    self.goal_updates += 1
+                    self.get_logger().info(f'Goal obsolete, replaced by x: {goal_msg.pose.pose.position.x:.2f} '
+                                           f'y: {goal_msg.pose.pose.position.y:.2f} ({self.goal_updates} replaced, '
+                                           f'{self.wasted_travel:.1f} m of {self.travelled:.1f} m wasted)')
+                    self._send_goal_future = self._action_client.send_goal_async(goal_msg)
+                    self._send_goal_future.add_done_callback(self.goal_response_callback)
+                    goal_handle = await self._send_goal_future
+                    if not goal_handle.accepted:
+                        return
+                    result_future = goal_handle.get_result_async()
+                    last_update = self.now()
+                    continue
             self.get_logger().info(f'Current goal position -> x: {goal_msg.pose.pose.position.x}, y: {goal_msg.pose.pose.position.y}')
             self.get_logger().info(f'Distance to goal: {self.distance(current_pos, goal_msg.pose.pose.position):.2f} meters')
             self.get_logger().info(f'Distance to last photo pose: {self.distance(current_pos, self.last_photo_pose):.2f} meters')
 
-            if current_pos and self.distance(current_pos, self.last_photo_pose) >= 3.0:
-                self.get_logger().info("3 meters passed — taking photo sequence.")
+            headings = self.plan_scan(current_pos)
+            if headings is None or len(headings) > 0:
+                self.get_logger().info("Unseen area in view — taking photo sequence.")
 
                 # Cancel goal
                 self.get_logger().info("Cancelling current goal...")
-                cancel_future = goal_handle.cancel_goal_async()
-                rclpy.spin_until_future_complete(self, cancel_future)
-                cancel_result = cancel_future.result()
-                print(cancel_result)
+                cancel_result = await goal_handle.cancel_goal_async()
+                self.get_logger().debug(f'Cancel response: {cancel_result}')
                 self.get_logger().info("Goal cancelled successfully.")
 
-                spin_detect_ball(self.subscription, cmd_vel_publisher, command, ball_position_subscriber)
-                # Resend goal
+                await spin_detect_ball(self, cmd_vel_publisher, command, ball_position_subscriber, headings=headings)
+                # Resend goal. Like every other goal, its rejection or abort is recorded by the callbacks, so the
+                # goals interrupted by a photo stop are blacklisted too
                 self._send_goal_future = self._action_client.send_goal_async(goal_msg)
-                rclpy.spin_until_future_complete(self, self._send_goal_future)
-                goal_handle = self._send_goal_future.result()
+                self._send_goal_future.add_done_callback(self.goal_response_callback)
+                goal_handle = await self._send_goal_future
 
                 if not goal_handle.accepted:
                     self.get_logger().error("Goal was rejected after photo.")
@@ -206,17 +522,225 @@ class NavigationClient(Node):
                 result_future = goal_handle.get_result_async()
                 self.last_photo_pose = current_pos  # reset distance tracking
 
-        rclpy.spin_once(self.cartographer)
-        print("Goal completed or cancelled.")
+        self.update_coverage_metrics()
+        self.get_logger().info("Goal completed or cancelled.")
+
+    def plan_scan(self, position, force=False):
+        """
+        Decides whether stopping to scan is worth it at a position, and which headings to scan.
+
+        The decision is taken every scan_check_distance meters. The unseen area at every stop of a scan is cast over
+        the visual coverage map from the current pose; the stop at the current heading is left out, the camera sees it
+        while driving. Before the first coverage map, a full scan is done every 3 meters.
+
+        :param position: current position of the robot
+        :param force: scan the stops showing unseen cells even if they add up to less than scan_min_unseen_area, and
+        whatever the distance since the last decision
+        :return: list of headings to scan in radians, empty if no scan is needed, or None for a full scan
+        """
+        if (not force and self.last_scan_check is not None
+                and self.distance(position, self.last_scan_check) < self.scan_check_distance):
+            return []
+        self.last_scan_check = position
+        pose = self.subscription.odom_buffer.latest()
+        view = None if pose is None else self.cartographer.unseen_headings((position.x, position.y), pose[3])
+        if view is None:
+            if force or self.last_photo_pose is None or self.distance(position, self.last_photo_pose) >= 3.0:
+                return None
+            return []
+
+        headings, areas = view[0][1:], view[1][1:]
+        worth = areas >= self.scan_min_heading_area
+        if not force and areas[worth].sum() < self.scan_min_unseen_area:
+            return []
+        self.get_logger().info(f'{areas[worth].sum():.2f} m^2 unseen around the robot, scanning '
+                               f'{np.count_nonzero(worth)} headings')
+        return list(headings[worth])
+
+    def update_coverage_metrics(self, threshold=0.9):
+        """
+        Records the time the camera took to see a fraction of the known free space, once.
+
+        :param threshold: fraction of the known free cells
+        """
+        coverage = self.cartographer.coverage_fraction()
+        if coverage is None or self.time_to_coverage is not None or coverage < threshold:
+            return
+        self.time_to_coverage = self.now() - self.start_time
+        mode = 'tour' if self.tour_mode else 'single goal'
+        self.get_logger().info(f'{threshold:.0%} visual coverage reached after {self.time_to_coverage:.1f} s '
+                               f'({mode} mode)')
+        self.publish_metrics()
+
+    def tour_feedback_callback(self, feedback_msg):
+        self.tour_index = feedback_msg.feedback.current_waypoint
+
+    async def follow_tour(self, tour):
+        """
+        Sends a tour to Nav2 as a single FollowWaypoints goal.
+
+        :param tour: list of waypoints in map coordinates (x, y), in visiting order
+        :return: goal handle, or None if the goal was rejected
+        """
+        goal_msg = FollowWaypoints.Goal()
+        stamp = self.get_clock().now().to_msg()
+        for waypoint in tour:
+            pose = PoseStamped()
+            pose.header.frame_id = 'odom'
+            pose.header.stamp = stamp
+            pose.pose.position.x = float(waypoint[0] + self.cartographer.origin[0])
+            pose.pose.position.y = float(waypoint[1] + self.cartographer.origin[1])
+            pose.pose.orientation.w = 1.0
+            goal_msg.poses.append(pose)
+        self.tour_index = 0
+        self.current_goal_position = (goal_msg.poses[0].pose.position.x, goal_msg.poses[0].pose.position.y)
+        self.get_logger().info(f'Sending a tour of {len(tour)} waypoints, first one x: '
+                               f'{self.current_goal_position[0]:.2f} y: {self.current_goal_position[1]:.2f}')
+
+        goal_handle = await self._follow_client.send_goal_async(goal_msg, feedback_callback=self.tour_feedback_callback)
+        if not goal_handle.accepted:
+            self.get_logger().error('Tour rejected')
+            self.record_failed_goal(GoalStatus.STATUS_UNKNOWN)
+            return None
+        return goal_handle
+
+    async def send_tour(self, ball_position_subscriber, cmd_vel_publisher, command=Twist()):
+        """
+        Visits the best waypoints in a single FollowWaypoints action, instead of one NavigateToPose goal each.
+
+        As in send_goal, the tour is interrupted to look for the ball when there is enough unseen area around the
+        robot (see plan_scan), and resumed from the waypoint being navigated to. When the map changed and the last
+        plan is older than tour_replan_period, the tail of the tour is planned again with the newest waypoints. The
+        waypoints Nav2 missed are blacklisted.
+        """
+        self.get_logger().info('Waiting for the waypoint follower...')
+        await self.wait_for_server(self._follow_client)
+
+        tour = self.cartographer.pop_tour(self.tour_size, self.is_blacklisted, costs=self.tour_costs)
+        if self.cartographer.scoring_result is not None:
+            self.record_latency('map', self.cartographer.scoring_result.stamp)
+        goal_handle = await self.follow_tour(tour)
+        if goal_handle is None:
+            return
+        result_future = goal_handle.get_result_async()
+        self.last_photo_pose = self.get_current_position()
+        planned_version = self.cartographer.scoring_result.version if self.cartographer.scoring_result else None
+        planned_time = self.now()
+
+        while not result_future.done():
+            await self.sleep(self.decision_period)
+            if ball_position_subscriber.ball_position is not None:
+                self.record_latency('ball', ball_position_subscriber.stamp)
+                self.get_logger().info("Ball position detected, stopping the tour.")
+                await goal_handle.cancel_goal_async()
+                return
+            current_pos = self.get_current_position()
+            if current_pos is None or self.last_photo_pose is None:
+                self.last_photo_pose = current_pos
+                continue
+            self.record_latency('odom', self.subscription.stamp)
+
+            self.cartographer.apply_scoring_result()
+            result = self.cartographer.scoring_result
+            map_changed = result is not None and result.version != planned_version
+            replan = map_changed and self.now() - planned_time >= self.tour_replan_period and len(tour) > 1
+            headings = self.plan_scan(current_pos)
+            photo = headings is None or len(headings) > 0
+            if not replan and not photo:
+                continue
+
+            remaining = tour[min(self.tour_index, len(tour) - 1):]
+            self.get_logger().info('Interrupting the tour' + (' to take photos' if photo else ' to re-plan it'))
+            await goal_handle.cancel_goal_async()
+            if photo:
+                await spin_detect_ball(self, cmd_vel_publisher, command, ball_position_subscriber, headings=headings)
+                self.last_photo_pose = current_pos  # reset distance tracking
+                if ball_position_subscriber.ball_position is not None:
+                    return
+            if replan:
+                # the waypoint being navigated to stays first, the rest is planned from it
+                tail = self.cartographer.pop_tour(self.tour_size - 1, self.is_blacklisted, keep=remaining[1:],
+                                                  start=remaining[0], costs=self.tour_costs)
+                self.record_latency('map', result.stamp)
+                tour = [remaining[0]] + tail
+                self.cartographer.tour = tour
+                planned_version = result.version
+                planned_time = self.now()
+            else:
+                tour = remaining
+            goal_handle = await self.follow_tour(tour)
+            if goal_handle is None:
+                return
+            result_future = goal_handle.get_result_async()
+
+        tour_result = result_future.result()
+        for missed in tour_result.result.missed_waypoints:
+            index = getattr(missed, 'index', missed)  # MissedWaypoint since Iron, index before
+            if 0 <= index < len(tour):
+                self.current_goal_position = (float(tour[index][0] + self.cartographer.origin[0]),
+                                              float(tour[index][1] + self.cartographer.origin[1]))
+                self.record_failed_goal(GoalStatus.STATUS_ABORTED)
+        self.update_coverage_metrics()
+        self.get_logger().info("Tour completed or cancelled.")
+
+    async def explore(self, ball_position_subscriber, cmd_vel_publisher, command=Twist()):
+        """
+        Explores until the robot reaches the ball, sending goals or tours and spinning to look for the ball.
+
+        This is the decision loop of the discoverer. It runs as a task of the executor and only waits on futures, so
+        the sensor callbacks keep running while it waits for Nav2.
+        """
+        while rclpy.ok():
+            if self.tour_mode:
+                await self.send_tour(ball_position_subscriber, cmd_vel_publisher, command)
+            else:
+                await self.send_goal(ball_position_subscriber, cmd_vel_publisher, command)
+            position = self.get_current_position()
+            headings = None if position is None else self.plan_scan(position, force=True)
+            if (ball_position_subscriber.ball_position is None and (headings is None or len(headings) > 0)
+                    and await spin_detect_ball(self, cmd_vel_publisher, command, ball_position_subscriber,
+                                               headings=headings)):
+                self.get_logger().info("Ball detected, stopping navigation.")
+            if ball_position_subscriber.ball_position is not None:
+                self.record_latency('ball', ball_position_subscriber.stamp)
+                self.get_logger().info(f"Ball position: {ball_position_subscriber.ball_position}")
+                # navigate to the ball position
+                goal_msg = NavigateToPose.Goal()
+                goal_msg.pose.header.frame_id = 'odom'
+                goal_msg.pose.pose.position.x = ball_position_subscriber.ball_position[0]
+                goal_msg.pose.pose.position.y = ball_position_subscriber.ball_position[1]
+                goal_msg.pose.pose.orientation.w = 1.0  # Assuming no specific orientation is required
+
+                self.get_logger().info(
+                    f"Sending navigation goal to ball position x: {goal_msg.pose.pose.position.x}, y: {goal_msg.pose.pose.position.y}"
+                )
+
+                self._send_goal_future = self._action_client.send_goal_async(goal_msg)
+                goal_handle = await self._send_goal_future
+                if not goal_handle.accepted:
+                    self.get_logger().error("Goal to ball position was rejected.")
+                    continue
+
+                self.get_logger().info("Goal to ball position accepted.")
+                result = await goal_handle.get_result_async()
+
+                if result.status == GoalStatus.STATUS_SUCCEEDED:
+                    self.get_logger().info("Arrived at ball position.")
+                    break
+                else:
+                    self.get_logger().info("Failed to reach ball position.")
+            else:
+                self.get_logger().info("No ball position received yet, continuing navigation...")
+        self.get_logger().info("Navigation loop finished.")
 
     def get_current_position(self):
         """
         This function gets the current position of the robot in the map.
         :return: current position of the robot in the map
         """
-        rclpy.spin_once(self.subscription)
         position = self.subscription.current_position
         if position is not None:
+            self.cartographer.robot_position = np.array([position.x, position.y])
             return position
         else:
             self.get_logger().info("No odometry data available yet.")
@@ -231,8 +755,9 @@ class VisualCoverageSubscriber(Node):
         self.subscription  # prevent unused variable warning
 
     def listener_callback(self, msg):
-        self.coverage_map = np.array(msg.data).reshape((msg.info.height, msg.info.width))
-        self.map_info = msg.info
+        coverage = occupancy_grid_view(msg)  # read-only view of the message, no copy
+        self.coverage_map = coverage.data
+        self.map_info = coverage.info
         self.get_logger().info('Received visual coverage map.')        
 
 
@@ -241,169 +766,390 @@ class CartographerSubscriber(Node):
         super().__init__('cartographer_subscriber')
         self.occupancy_subscription = self.create_subscription(OccupancyGrid, 'map', self.occupancy_callback, 10)
 
+        # Visualization parameters, set visualization to False for production runs
+        self.declare_parameter('visualization', True)
+        self.declare_parameter('visualization_max_rate', 1.0)  # Hz
+        self.declare_parameter('visualization_max_points', 5000)  # per marker, the waypoints are subsampled
+        self.visualization = self.get_parameter('visualization').get_parameter_value().bool_value
+        self.visualization_max_rate = self.get_parameter('visualization_max_rate').get_parameter_value().double_value
+        self.visualization_max_points = self.get_parameter(
+            'visualization_max_points').get_parameter_value().integer_value
+        self.marker_publisher = self.create_publisher(MarkerArray, 'discoverer_waypoints', 10)
+        self.last_markers_time = None
+
+        # Score a waypoint must gain per meter of travel from the robot to be worth it, 0 ranks by score only
+        self.declare_parameter('travel_cost_weight', 2.0)
+        self.travel_cost_weight = self.get_parameter('travel_cost_weight').get_parameter_value().double_value
+
+        # Next-best-view scoring: score of a waypoint from which the whole camera view is unseen, 0 to use the
+        # unseen fraction of the waypoint window instead. The camera must match the visual coverage mapper.
+        self.declare_parameter('view_gain_weight', 100.0)
+        self.declare_parameter('fov_deg', 60.0)
+        self.declare_parameter('max_range', 3.0)
+        self.declare_parameter('ray_count', 30)
+        self.view_gain_weight = self.get_parameter('view_gain_weight').get_parameter_value().double_value
+        self.fov_deg = self.get_parameter('fov_deg').get_parameter_value().double_value
+        self.max_range = self.get_parameter('max_range').get_parameter_value().double_value
+        self.ray_count = self.get_parameter('ray_count').get_parameter_value().integer_value
+
+        # Clearance to the closest obstacle or unknown cell: waypoints closer than robot_radius are not accessible,
+        # and the score grows with the clearance up to preferred_clearance (meters)
+        self.declare_parameter('robot_radius', 0.2)
+        self.declare_parameter('preferred_clearance', 0.5)
+        self.robot_radius = self.get_parameter('robot_radius').get_parameter_value().double_value
+        preferred_clearance = self.get_parameter('preferred_clearance').get_parameter_value().double_value
+
+        # Candidate waypoints: sampled around the frontiers and unseen regions, candidate_spacing apart (meters),
+        # within candidate_band of them (meters), at most candidate_budget of them
+        self.declare_parameter('candidate_spacing', 0.4)
+        self.declare_parameter('candidate_band', 0.6)
+        self.declare_parameter('candidate_budget', 2000)
+        self.candidate_spacing = self.get_parameter('candidate_spacing').get_parameter_value().double_value
+        self.candidate_band = self.get_parameter('candidate_band').get_parameter_value().double_value
+        self.candidate_budget = self.get_parameter('candidate_budget').get_parameter_value().integer_value
+
+        # Large maps: keep the grid as a pyramid of blocks of 4, 16 and 64 cells, and sample the candidates and run
+        # the travel wavefront over the blocks instead of the whole grid at full resolution
+        self.declare_parameter('map_pyramid', True)
+        self.map_pyramid = self.get_parameter('map_pyramid').get_parameter_value().bool_value
+        self.map_frame = 'map'
+
         self.waypoints = self.generate_list_of_waypoints(n_of_waypoints=100, step=0.2)
         self.accessible_waypoints = np.array([])
-        self.sorted_accessible_waypoints = np.array([])
+        self.waypoint_queue = WaypointQueue()  # max-heap of the accessible waypoints, by utility
+        self.popped = np.zeros(0, dtype=bool)  # waypoints popped as goals and not rescored since
+        self.fallback_waypoints = []
         self.occupancy_value = np.array([])
+        self.unaccessible_waypoints = np.array([])
         self.origin = np.array([0.0, 0.0])
+        self.current_goal = None  # waypoint popped as the navigation goal
+        self.tour = []  # waypoints of the tour being followed, in visiting order
+        self.grid_data = None  # newest occupancy grid
+        self.grid_resolution = None
+        self.grid_origin = None  # [x, y] origin of the newest occupancy grid
+        self.robot_position = None  # [x, y] position of the robot, the waypoints it cannot reach are dropped
+        self.odometry = None  # OdometryBuffer of the robot poses, set by the navigation client
+        # the scores of every waypoint persist between maps, only the changed regions are rescored, on a
+        # background thread. The utility of a waypoint trades its score against the travel distance from the robot.
+        # The view gain replaces the unseen fraction of the window in the score.
+        view_gain = None
+        coverage_weight = 0.5
+        if self.view_gain_weight > 0.0:
+            view_gain = ViewGainScorer(fov_deg=self.fov_deg, max_range=self.max_range, ray_count=self.ray_count)
+            coverage_weight = 0.0
+        scorer = IncrementalScorer(size=5, robot_radius=self.robot_radius, preferred_clearance=preferred_clearance,
+                                   coverage_weight=coverage_weight)
+        pyramid = MapPyramid() if self.map_pyramid else None
+        self.worker = ScoringWorker(scorer, self.sample_waypoints, travel_weight=self.travel_cost_weight,
+                                    view_gain=view_gain, gain_weight=self.view_gain_weight, pyramid=pyramid)
+        self.scoring_result = None  # newest scoring result applied to the waypoint queue
         self.visual_node = VisualCoverageSubscriber()  # a visual coverage subscriber is created to access the visual coverage map
-        rclpy.spin_once(self.visual_node)  # refresh the visual coverage map
 
     def occupancy_callback(self, msg):
         """
 
-        The cartographer subscriber callback function refreshes the list of accessible waypoints. It sorts them and
-        saves them in the self.sorted_accessible_waypoints variable.
+        The cartographer subscriber callback function hands the new map over to the scoring worker, which refreshes
+        the list of accessible waypoints in the background. The map callback never waits for the scoring, so it does
+        not stall the executor. The waypoint queue belongs to the navigation loop, which applies the newest scoring
+        result when it pops goals.
 
         :param msg: OccupancyGrid message. Includes map metadata and an array with the occupancy probability values
         :return: None
         """
 
-        data = np.array(msg.data)  # download the occupancy grid
-        current_map_width = msg.info.width  # get the current map width
+        grid = occupancy_grid_view(msg)  # read-only int8 view of the occupancy grid, shaped like the map
+        data = grid.data
+        current_map_width = grid.width  # get the current map width
         self.get_logger().info(f"Current map width: {current_map_width}")
-        current_map_height = msg.info.height  # get the current map height
+        current_map_height = grid.height  # get the current map height
         self.get_logger().info(f"Current map height: {current_map_height}")
 
-        resolution = msg.info.resolution  # get the resolution
-        origin = msg.info.origin.position  # get the origin of the map
-        self.origin = np.array([origin.x, origin.y])  # save the origin in a numpy array
-        # get the map origin in the occupancy grid
-        origin_x = int((origin.x) / resolution)
-        origin_y = int((origin.y) / resolution)
+        resolution = grid.resolution  # get the resolution
+        self.map_frame = grid.frame_id or self.map_frame
+        self.grid_data = data  # kept for the tours and the coverage metrics
+        self.grid_resolution = resolution
+        self.grid_origin = np.array([grid.origin_x, grid.origin_y])
+
+        # Here we hand the map over to the worker, which scores the waypoints and keeps the accessible ones.
+        # If it is still busy with a previous map, only the newest map waiting is scored next.
+        # The waypoints outside the free-space component of the robot are dropped, they cannot be reached.
+        # The robot position is the one at the time of the map, not the newest one, when the odometry covers it.
+        stamp = stamp_to_seconds(grid.stamp)
+        robot_position = self.robot_position
+        pose = None if self.odometry is None else self.odometry.pose_at(stamp)
+        if pose is not None:
+            robot_position = np.array(pose[:2])
+        map_version = self.worker.submit(data, self.visual_node.coverage_map, resolution,
+                                         np.array([grid.origin_x, grid.origin_y]), robot_position, stamp=stamp)
+        self.get_logger().info(f"Map {map_version} handed over to the scoring worker")
+
+        # The visualization is published as markers, rate-limited and only when someone is listening
+        self.publish_markers()
+
+    def apply_scoring_result(self):
+        """
+        Applies the newest result of the scoring worker to the waypoint queue, if there is one.
 
+        Only the waypoints rescored since the last applied result are pushed, so a popped goal comes back once its
+        window changes. When the travel distances were recomputed or the waypoints were sampled again, the queue is
+        rebuilt in O(n) instead, without the popped goals. With a travel cost (travel_cost_weight > 0) that is every
+        result, as every utility changes when the robot moves.
 
-        # reshape the data so it resembles the map shape
-        data = np.reshape(data, (current_map_height, current_map_width))
-        self.waypoints = self.generate_waypoints_from_map(current_map_width, current_map_height, resolution)
-        waypoints_height= max(self.waypoints[:,0])
-        waypoints_width=max(self.waypoints[:,1])
-        self.get_logger().info(f"Waypoints height: {waypoints_height}, Waypoints width: {waypoints_width}")
-    
-        
+        :return: True if a new result was applied
+        """
+        error = self.worker.take_error()
+        if error is not None:
+            self.get_logger().error(f'Scoring of map {error[0]} failed ({self.worker.failures} failures so far), '
+                                    f'the next map is scored from scratch:\n{error[1]}')
+        result = self.worker.take()
+        if result is None:
+            return False
+
+        self.scoring_result = result
+        self.waypoints = result.waypoints
+        self.origin = result.origin  # the waypoints are relative to the origin of the map they were scored on
+        self.accessible_waypoints = result.waypoints[result.accessible]
+        self.occupancy_value = result.scores[result.accessible]  # store the score of the WPs
+        self.unaccessible_waypoints = result.waypoints[result.valid & ~result.accessible]
+
+        # Queueing...
+        if result.full_rescore:
+            self.popped = np.zeros(len(result.waypoints), dtype=bool)
+        else:
+            if result.previous_indices is not None:
+                # the waypoints were sampled again, the popped ones that are still there stay popped
+                popped = np.zeros(len(result.waypoints), dtype=bool)
+                kept = result.previous_indices >= 0
+                popped[kept] = self.popped[result.previous_indices[kept]]
+                self.popped = popped
+            self.popped[result.changed] = False
+        if result.full_rescore or result.travel_updated or result.previous_indices is not None:
+            queued = result.accessible & ~self.popped
+            self.waypoint_queue.reset(np.flatnonzero(queued), result.utility[queued], n_waypoints=len(result.waypoints))
+        else:
+            self.waypoint_queue.update(result.changed, result.utility[result.changed])
 
-        # Here we go through every waypoint and save the ones that are accessible.
-        # An accessible waypoint is one which has no obstacles, and has few or no unknown squares in the vicinity.
-        self.accessible_waypoints = np.array([])
-        self.occupancy_value = np.array([])
-        unaccessible_waypoints = np.array([])
-        for waypoint in self.waypoints:
-            try:
-                occupancy_grid_coordinates = [int((waypoint[1]) / resolution), int((waypoint[0]) /
-                                                                                         resolution)]
+        # Default fallback waypoints
+        if len(self.waypoint_queue) == 0:
+            self.fallback_waypoints = list(FALLBACK_WAYPOINTS)
 
+        self.get_logger().info(f"Accessible waypoints have been updated from map {result.map_version} "
+                               f"({len(result.changed)} rescored in {result.duration * 1000:.1f} ms, "
+                               f"{np.count_nonzero(~result.reachable)} unreachable, "
+                               f"{result.coalesced} older maps skipped)")
+        return True
 
-                accessible, score = self.convolute(data, self.visual_node.coverage_map, occupancy_grid_coordinates, size=5, occ_threshold=40)  # perform convolution
+    def snapshot_state(self):
+        """
+        Gets the waypoints of the newest scoring result and the ones still queued, to save them in a mission snapshot.
 
-                # if the convolution returns True, it means the WP is accessible, so it is stored in
-                # self.accessible_waypoints
-                if accessible:
-                    self.accessible_waypoints = np.append(self.accessible_waypoints, waypoint)
-                    self.occupancy_value = np.append(self.occupancy_value, score)  # store the score of the WP
-                else:
-                    # if the convolution returns False, it means the WP is not accessible, so it is stored in
-                    # self.unaccessible_waypoints
-                    unaccessible_waypoints = np.append(unaccessible_waypoints, waypoint)
-            # because the waypoint array is over-sized, we need to remove the values that are out of range
+        :return: dict of array name to array and metadata dict, or None before the first scoring result
+        """
+        result, popped = self.scoring_result, self.popped
+        if result is None or len(popped) != len(result.waypoints):
+            return None  # the result is being applied
+        arrays = {'waypoints': result.waypoints, 'utility': result.utility, 'queued': result.accessible & ~popped}
+        return arrays, {'origin': np.asarray(result.origin).tolist(), 'resolution': result.resolution}
 
-            except IndexError:
-                pass
+    def restore_state(self, arrays, metadata):
+        """
+        Queues the waypoints of a mission snapshot, so that goals are sent before the first map is scored. The first
+        scoring result replaces them.
 
-            # scatter the accessible and unaccessible waypoints in the map with different colors
-            
+        :param arrays: dict of array name to array, see snapshot_state
+        :param metadata: metadata dict, see snapshot_state
+        """
+        queued = np.array(arrays['queued'], dtype=bool)
+        self.waypoints = np.array(arrays['waypoints'])
+        self.origin = np.array(metadata['origin'])
+        self.accessible_waypoints = self.waypoints[queued]
+        self.popped = np.zeros(len(self.waypoints), dtype=bool)
+        self.waypoint_queue.reset(np.flatnonzero(queued), np.array(arrays['utility'])[queued],
+                                  n_waypoints=len(self.waypoints))
+
+    def pop_waypoint(self, suppressed=None):
+        """
+        Pops the accessible waypoint with the highest utility, from the newest scoring result.
 
-        # reshape the accessible waypoints array to shape (n, 2)
-        self.accessible_waypoints = self.accessible_waypoints.reshape(-1, 2)
+        While no waypoint is accessible, the fallback waypoints are used instead.
 
-        # Sorting...
-        occupancy_value_idxs = self.occupancy_value.argsort()
-        self.sorted_accessible_waypoints = self.accessible_waypoints[occupancy_value_idxs[::-1]]
+        :param suppressed: function of a waypoint returning True if it must be skipped. Skipped waypoints leave the
+        queue, they come back once their window is rescored.
+        :return: waypoint in map coordinates (x, y)
+        """
+        self.apply_scoring_result()
+        index = self.waypoint_queue.pop()
+        while index is not None and suppressed is not None and suppressed(self.waypoints[index]):
+            self.popped[index] = True
+            index = self.waypoint_queue.pop()
+        if index is not None:
+            self.popped[index] = True
+            self.current_goal = self.waypoints[index]
+        else:
+            if not self.fallback_waypoints:
+                self.fallback_waypoints = list(FALLBACK_WAYPOINTS)
+            self.current_goal = self.fallback_waypoints.pop(0)
+        self.publish_markers()
+        return self.current_goal
 
-        # Default fallback waypoints
-        if np.size(self.sorted_accessible_waypoints) == 0:
-            self.sorted_accessible_waypoints = np.array([[1.5, 0.0], [0.0, 1.5], [-1.5, 0.0], [0.0, -1.5]])
-
-        self.get_logger().info('Accessible waypoints have been updated...')
-
-        # --- ⬇️ Visualization Part Starts Here ⬇️ ---
-        plt.figure(figsize=(8, 8))
-        # Draw the occupancy map
-        data_img = np.copy(data)
-        data_img[data_img == -1] = 128  # unknown -> gray
-        plt.imshow(data_img, cmap='gray', origin='lower')  # Map
-
-        # Draw waypoints
-        if self.accessible_waypoints.shape[0] > 0:
-            plt.scatter(
-                (self.accessible_waypoints[:, 0]) / msg.info.resolution,
-                (self.accessible_waypoints[:, 1]) / msg.info.resolution,
-                c='green', s=5, label='Accessible'
-            )
-
-        if unaccessible_waypoints.shape[0] > 0:
-            unaccessible_waypoints = unaccessible_waypoints.reshape(-1, 2)
-            plt.scatter(
-                (unaccessible_waypoints[:, 0]) / msg.info.resolution,
-                (unaccessible_waypoints[:, 1]) / msg.info.resolution,
-                c='red', s=5, label='Unaccessible'
-            )
-
-        # Draw navigation goal (first in sorted accessible list)
-        if self.sorted_accessible_waypoints.shape[0] > 0:
-            nav_goal = self.sorted_accessible_waypoints[0]
-            plt.scatter(
-                [(nav_goal[0]) / msg.info.resolution],
-                [(nav_goal[1]) / msg.info.resolution],
-                marker='*', c='blue', s=100, label='Navigation Goal'
-            )
-
-        # Draw origin
-        plt.scatter(
-            [self.origin[0] / msg.info.resolution],
-            [self.origin[1] / msg.info.resolution],
-            marker='o', c='yellow', s=100, label='Origin'
-        )
+    def pop_tour(self, size, suppressed=None, keep=(), start=None, costs='euclidean'):
+        """
+        Pops the accessible waypoints with the highest utility and orders them into a short tour.
+
+        The order is a nearest-neighbour path from the start improved with 2-opt, over straight-line or geodesic
+        costs. While no waypoint is accessible, the tour is a single fallback waypoint.
 
-        plt.legend()
-        plt.title('Map with Accessible Waypoints and Navigation Goal')
-        plt.xlabel('Map X (cells)')
-        plt.ylabel('Map Y (cells)')
-        plt.grid(False)
-        plt.tight_layout()
-        plt.pause(0.001)
-        plt.clf()
+        :param size: number of waypoints of the tour
+        :param suppressed: function of a waypoint returning True if it must be skipped, see pop_waypoint
+        :param keep: waypoints already planned that stay in the tour, they count in its size
+        :param start: (x, y) start of the tour in map coordinates, the robot position if None
+        :param costs: 'euclidean' for straight-line costs, 'geodesic' for travel distances along the free space
+        :return: list of waypoints in map coordinates (x, y), in visiting order
+        """
+        self.apply_scoring_result()
+        points = [np.asarray(point) for point in keep]
+        while len(points) < size:
+            index = self.waypoint_queue.pop()
+            if index is None:
+                break
+            self.popped[index] = True
+            if suppressed is None or not suppressed(self.waypoints[index]):
+                points.append(self.waypoints[index])
+        if not points:
+            return [self.pop_waypoint(suppressed)]
+
+        if start is None:
+            start = points[0] if self.robot_position is None else self.robot_position - self.origin
+        cost_matrix = None
+        if costs == 'geodesic' and self.grid_data is not None:
+            cells = [position_to_cell(point, (0.0, 0.0), self.grid_resolution) for point in [start] + points]
+            cost_matrix = geodesic_costs(free_space(self.grid_data), cells, self.grid_resolution)
+        order, length = plan_tour(np.array(points), np.asarray(start), costs=cost_matrix)
+        self.tour = [points[i] for i in order]
+        self.current_goal = self.tour[0]
+        self.get_logger().info(f"Tour of {len(self.tour)} waypoints planned, {length:.1f} m long")
+        self.publish_markers()
+        return self.tour
+
+    def waypoint_index(self, position):
+        """
+        Finds the waypoint of the newest scoring result at a world position.
 
-    @staticmethod
-    def convolute(data, coverage_map, coordinates, size=3, occ_threshold=40, coverage_weight=0.5):
+        The waypoints are sampled again on every map, so a goal is found by its position rather than by its index.
 
+        :param position: (x, y) position in world coordinates
+        :return: index of the waypoint within half a cell of the position, or None if there is none
         """
-        Performs a convolution operation on the occupancy grid data to determine if a waypoint is accessible.
+        result = self.scoring_result
+        if result is None or len(result.waypoints) == 0:
+            return None
+        offsets = result.waypoints + result.origin - np.asarray(position)
+        distances = np.hypot(offsets[:, 0], offsets[:, 1])
+        index = int(np.argmin(distances))
+        return index if distances[index] <= result.resolution / 2 else None
+
+    def unseen_headings(self, position, yaw, count=6):
         """
-        occ_sum = 0
-        coverage_sum = 0
+        Gets the unseen area the camera would see at every stop of a scan, from the newest maps.
 
-        for x in range(int(coordinates[0] - size / 2), int(coordinates[0] + size / 2)):
-            for y in range(int(coordinates[1] - size / 2), int(coordinates[1] + size / 2)):
-                if data[x, y] == -1:
-                    occ_sum += 100  # unknown area
-                elif data[x, y] > 50:
-                    occ_sum += 1000000  # obstacle
-                else:
-                    occ_sum += data[x, y]
+        :param position: (x, y) position of the robot in world coordinates
+        :param yaw: heading of the robot in radians
+        :param count: number of stops of the scan, the first one at the current heading
+        :return: headings of the stops in radians, and the unseen area of every stop in m^2, or None before the first
+        maps
+        """
+        data, origin, resolution = self.grid_data, self.grid_origin, self.grid_resolution
+        if data is None or self.visual_node.coverage_map is None:
+            return None
+        row, col = position_to_cell(position, origin, resolution)
+        headings, gains = heading_gains(data, self.visual_node.coverage_map, row, col, yaw, resolution,
+                                        fov_deg=self.fov_deg, max_range=self.max_range, ray_count=self.ray_count,
+                                        count=count)
+        return headings, gains * resolution ** 2
 
-                # encourage going to unseen places (0 = unseen, 1 = seen)
-                coverage_sum += 1 - coverage_map[x, y]  # high if unseen
+    def coverage_fraction(self):
+        """
+        Gets the fraction of the known free cells that the camera has seen.
 
-        area = size * size
-        occ_avg = occ_sum / area
-        coverage_avg = coverage_sum / area  # 0 if fully seen, 1 if fully unseen
+        :return: fraction in [0, 1], or None before the first maps
+        """
+        if self.grid_data is None or self.visual_node.coverage_map is None:
+            return None
+        free = free_space(self.grid_data)
+        coverage = self.visual_node.coverage_map
+        height = min(free.shape[0], coverage.shape[0])
+        width = min(free.shape[1], coverage.shape[1])
+        n_free = np.count_nonzero(free)
+        if n_free == 0:
+            return None
+        return np.count_nonzero(free[:height, :width] & (coverage[:height, :width] != 0)) / n_free
 
-        if occ_avg < occ_threshold:
-            score = (1 - coverage_weight) * occ_avg + coverage_weight * (100 * coverage_avg)
-            return True, score
-        else:
-            return False, float('inf')
+    def publish_markers(self):
+        """
+        Publishes the accessible, unaccessible and chosen waypoints as a MarkerArray.
 
+        Nothing is published if the visualization is disabled, if nobody subscribes to the markers, or if the last
+        markers were published less than 1 / visualization_max_rate seconds ago.
+
+        :return: True if the markers were published
+        """
+        if not self.visualization or self.marker_publisher.get_subscription_count() == 0:
+            return False
+        now = self.get_clock().now()
+        if (self.last_markers_time is not None and self.visualization_max_rate > 0.0
+                and (now - self.last_markers_time).nanoseconds < 1e9 / self.visualization_max_rate):
+            return False
+        self.last_markers_time = now
+
+        markers = MarkerArray()
+        markers.markers.append(self.waypoint_marker(0, 'accessible', self.accessible_waypoints,
+                                                    (0.0, 1.0, 0.0), now))
+        markers.markers.append(self.waypoint_marker(1, 'unaccessible', self.unaccessible_waypoints,
+                                                    (1.0, 0.0, 0.0), now))
+        chosen = np.zeros((0, 2)) if self.current_goal is None else np.reshape(self.current_goal, (1, 2))
+        markers.markers.append(self.waypoint_marker(2, 'chosen', chosen, (0.0, 0.0, 1.0), now,
+                                                    marker_type=Marker.SPHERE_LIST, scale=0.25))
+        self.marker_publisher.publish(markers)
+        return True
+
+    def waypoint_marker(self, marker_id, namespace, waypoints, color, stamp, marker_type=Marker.POINTS, scale=0.05):
+        """
+        Builds a marker showing waypoints in the map frame.
+
+        :param marker_id: id of the marker
+        :param namespace: namespace of the marker
+        :param waypoints: array of shape (n, 2) of waypoints relative to the map origin, subsampled to at most
+        visualization_max_points
+        :param color: (r, g, b) color of the marker
+        :param stamp: time of the marker
+        :param marker_type: POINTS or SPHERE_LIST
+        :param scale: size of the points in meters
+        :return: Marker
+        """
+        marker = Marker()
+        marker.header.frame_id = self.map_frame
+        marker.header.stamp = stamp.to_msg()
+        marker.ns = namespace
+        marker.id = marker_id
+        marker.type = marker_type
+        marker.action = Marker.ADD
+        marker.pose.orientation.w = 1.0
+        marker.scale.x = scale
+        marker.scale.y = scale
+        marker.scale.z = scale
+        marker.color.r, marker.color.g, marker.color.b = color
+        marker.color.a = 1.0
+
+        waypoints = np.reshape(waypoints, (-1, 2))
+        if self.visualization_max_points > 0 and len(waypoints) > self.visualization_max_points:
+            waypoints = waypoints[::-(-len(waypoints) // self.visualization_max_points)]
+        world = (waypoints + self.origin).tolist()
+        marker.points = [Point(x=x, y=y) for x, y in world]
+        return marker
+
+    def destroy_node(self):
+        self.worker.stop()
+        super().destroy_node()
 
     def generate_list_of_waypoints(self, n_of_waypoints, step):
         """
@@ -428,27 +1174,23 @@ class CartographerSubscriber(Node):
 
         return waypoints
     
-    def generate_waypoints_from_map(self, map_width, map_height, resolution, step=0.2):
-        """
-        Generate waypoints that span the full map area based on its current size, origin, and resolution.
-        :param map_width: Width of the map in cells
-        :param map_height: Height of the map in cells
-        :param resolution: Size of one cell in meters
-        :param origin: [x, y] origin of the map in world coordinates
-        :param step: Distance between waypoints in meters
-        :return: np.ndarray of waypoints in (x, y) format
+    def sample_waypoints(self, data, coverage_map, resolution, clearance=None, pyramid=None):
         """
-        x_min = 0
-        y_min = 0
-        x_max = x_min + map_width * resolution
-        y_max = y_min + map_height * resolution
-
-        x_coords = np.arange(x_min, x_max, step)
-        y_coords = np.arange(y_min, y_max, step)
+        Samples candidate waypoints around the frontiers and the regions the camera has not seen yet.
 
-        waypoints = np.array([[x, y] for x in x_coords for y in y_coords])
+        The candidates are at least candidate_spacing apart, within candidate_band of a frontier, and at most
+        candidate_budget of them are kept, so the scoring follows the length of the frontiers instead of the map area.
 
-        return waypoints
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param coverage_map: visual coverage map (0 = unseen), or None
+        :param resolution: Size of one cell in meters
+        :param clearance: clearance of every cell in meters, computed if None
+        :param pyramid: MapPyramid of the grid, only its blocks around the frontiers are sampled, or None
+        :return: np.ndarray of waypoints in (x, y) format, relative to the origin of the map
+        """
+        return sample_candidates(data, coverage_map, resolution, clearance=clearance, spacing=self.candidate_spacing,
+                                 budget=self.candidate_budget, band=self.candidate_band,
+                                 robot_radius=self.robot_radius, pyramid=pyramid)
 
       
 def reset_commands(command: Twist) -> Twist:
@@ -462,69 +1204,107 @@ def reset_commands(command: Twist) -> Twist:
     return command 
 
 
-def spin_detect_ball( subscriber : LaserSubscriber, publisher: CmdVelPublisher, command:Twist, camera_subscriber):
+async def rotate_to(navigation, publisher: CmdVelPublisher, command: Twist, target):
     """
-    Makes the robot spin 360 degrees, stopping every 60 degrees to check for a ball using YOLO.
+    Turns the robot in place to a target heading, with the odometry of the navigation client as feedback.
+
+    :param navigation: NavigationClient, for its odometry, its rotation controller and its clock
+    :param publisher: publisher of the velocity commands
+    :param command: Twist reused for the commands
+    :param target: target heading in radians
+    :return: True if the target was reached before the timeout
     """
+    controller = navigation.rotation
+    odometry = navigation.subscription
+    start_time = navigation.now()
+    timeout = controller.timeout(angle_difference(target, odometry.odom_buffer.latest()[3]))
+    reached = False
+    while navigation.now() - start_time < timeout:
+        error = angle_difference(target, odometry.odom_buffer.latest()[3])
+        if controller.reached(error, odometry.yaw_rate):
+            reached = True
+            break
+        command = reset_commands(command)
+        command.angular.z = controller.command(error, odometry.yaw_rate)
+        publisher.publisher_.publish(command)
+        await navigation.sleep(controller.period)
+
+    # Stop, and wait for the robot to stop turning before looking
     command = reset_commands(command)
-    publisher.get_logger().info("Starting 360° spin with 6 detection checks...")
+    publisher.publisher_.publish(command)
+    settle_start = navigation.now()
+    while not controller.settled(odometry.yaw_rate) and navigation.now() - settle_start < controller.max_settle_time:
+        await navigation.sleep(controller.period)
+    return reached
 
-    ball_detected = False
 
-    angular_speed = 2.0  # radians per second
-    angle_per_step = math.pi / 6  # 60 degrees = π/3 radians
-    spin_time_per_step = angle_per_step / abs(angular_speed)  # time to rotate 60 degrees
+def scan_order(yaw, headings):
+    """
+    Orders the headings of a scan so that the robot turns the least.
 
-    for step in range(6):
-        publisher.get_logger().info(f"Step {step + 1} of 6: Rotating {math.degrees(angle_per_step)} degrees...")
+    The headings are swept in one direction, counterclockwise or clockwise, whichever turns less from the current
+    heading.
 
-        # Start rotating
-        command = reset_commands(command)
-        command.angular.z = angular_speed
-        publisher.publisher_.publish(command)
+    :param yaw: current heading in radians
+    :param headings: headings to scan in radians
+    :return: list of the headings in visiting order
+    """
+    offsets = [angle_difference(heading, yaw) % (2 * math.pi) for heading in headings]
+    order = [heading for _, heading in sorted(zip(offsets, headings))]
+    orders = (order, order[::-1])
+    turns = [sum(abs(angle_difference(b, a)) for a, b in zip([yaw] + sequence, sequence)) for sequence in orders]
+    return orders[int(np.argmin(turns))]
+
+
+async def spin_detect_ball(navigation, publisher: CmdVelPublisher, command: Twist, camera_subscriber, headings=None,
+                           steps=6):
+    """
+    Makes the robot spin to look for a ball, stopping at a list of headings or every 60 degrees over a full turn.
+
+    Every stop is a target heading the robot turns to with the odometry feedback, see rotate_to, so the error does not
+    add up from one stop to the next. The time and the heading error of the scan are kept in the metrics of the
+    navigation client.
+
+    :param headings: headings to stop at, in radians, or None for a full turn from the current heading
+    :param steps: number of stops of a full turn
+    """
+    command = reset_commands(command)
+    if navigation.subscription.odom_buffer.latest() is None:
+        publisher.get_logger().warn("No odometry data available yet, cannot spin.")
+        return False
+
+    ball_detected = False
+    start_time = navigation.now()
+    start_yaw = navigation.subscription.odom_buffer.latest()[3]
+    if headings is None:
+        targets = [start_yaw + (step + 1) * 2 * math.pi / steps for step in range(steps)]
+        publisher.get_logger().info(f"Starting 360° spin with {steps} detection checks...")
+    else:
+        targets = scan_order(start_yaw, headings)
+        publisher.get_logger().info(f"Starting scan of {len(targets)} headings...")
+
+    for step, target in enumerate(targets):
+        publisher.get_logger().info(f"Step {step + 1} of {len(targets)}: Rotating to {math.degrees(target):.0f} degrees...")
+        if not await rotate_to(navigation, publisher, command, target):
+            publisher.get_logger().warn(f"Step {step + 1} timed out before reaching its heading")
 
-        # Wait exactly the needed time
-        start_time = time.time()
-        print(f"Rotating for {spin_time_per_step:.2f} seconds...")
-        while time.time() - start_time < 2*spin_time_per_step:
-            #print(f"Rotating... {time.time() - start_time:.2f} seconds elapsed")
-            #rclpy.spin_once(subscriber)
-            #print("Checking for obstacles...")
-            #rclpy.spin_once(camera_subscriber)
-            pass
-
-        # Stop rotation
-        command = reset_commands(command)
-        publisher.publisher_.publish(command)
-        current_time = time.time()
-        print("Waiting for 1 seconds to stabilize...")
-        #rclpy.spin_once(camera_subscriber)
-        time.sleep(1)  # Wait for 4 seconds to stabilize
-            #rclpy.spin_once(subscriber)
-        #rclpy.spin_once(camera_subscriber)
-        
         if camera_subscriber.ball_position is not None:
             publisher.get_logger().info(f"Ball position detected: {camera_subscriber.ball_position}")
             ball_detected = True
             break
-        
 
         publisher.get_logger().info(f"Checking for ball at step {step + 1}...")
 
-        # Perform YOLO detection
-        """""
-        if detect_ball(camera_subscriber, model):
-            ball_detected = True
-            publisher.get_logger().info("Ball detected!")
-            break
-        else:
-            publisher.get_logger().info("No ball detected.")
-            """
-
-
     command = reset_commands(command)
     publisher.publisher_.publish(command)
-    publisher.get_logger().info("Finished 360° spin.")
+    if not ball_detected and targets:
+        navigation.scan_duration = navigation.now() - start_time
+        navigation.scan_error = math.degrees(abs(angle_difference(targets[-1],
+                                                                  navigation.subscription.odom_buffer.latest()[3])))
+        publisher.get_logger().info(f"Finished the scan in {navigation.scan_duration:.2f} s, "
+                                    f"heading error {navigation.scan_error:.2f} degrees.")
+    elif ball_detected:
+        publisher.get_logger().info("Stopped the spin on the ball.")
 
     return ball_detected
 
@@ -538,11 +1318,13 @@ class BallPositionSubscriber(Node):
             10
         )
         self.ball_position = None
+        self.stamp = None  # time ball_position was received, in seconds, the message has no header
         self.subscription  # prevent unused variable warning
 
     def listener_callback(self, msg):
         if msg.data[0] != 0.0 and msg.data[1] != 0.0:
             self.ball_position = (msg.data[0], msg.data[1])
+            self.stamp = self.get_clock().now().nanoseconds / 1e9
             self.get_logger().info(f"Initial ball position set: {self.ball_position}")
         else:
             self.get_logger().info(f"Received new ball position: {msg.data[0]}, {msg.data[1]}")
@@ -560,62 +1342,20 @@ def main(args=None):
     command = Twist()
 
     print("Navigation client started.")
-    print("Will spin the subscription to the laser scanner and camera...")
-    #rclpy.spin_once(laser_subscriber)
-    #rclpy.spin_once(camera_subscriber)
-    print("Laser scanner and camera subscriptions spun once.")
-    print("Will spin the ball position subscriber...")
-    rclpy.spin_once(ball_position_subscriber)  # Spin the ball position subscriber once to initialize it
-    print("Ball position subscriber spun once.")
+    # a single executor spins every node, the navigation loop is one of its tasks
+    executor = MultiThreadedExecutor()
+    nodes = navigation.nodes() + [laser_subscriber, cmd_vel_publisher, ball_position_subscriber]
+    for node in nodes:
+        executor.add_node(node)
     print("Starting the navigation loop...")
-
-    while rclpy.ok():
-        navigation.send_goal(ball_position_subscriber, cmd_vel_publisher, command)
-        rclpy.spin_once(ball_position_subscriber)
-        if ball_position_subscriber.ball_position is None and spin_detect_ball(laser_subscriber, cmd_vel_publisher, command, ball_position_subscriber):
-            navigation.get_logger().info("Ball detected, stopping navigation.")
-        if ball_position_subscriber.ball_position is not None:
-            navigation.get_logger().info(f"Ball position: {ball_position_subscriber.ball_position}")
-            # navigate to the ball position
-            goal_msg = NavigateToPose.Goal()
-            goal_msg.pose.header.frame_id = 'odom'
-            goal_msg.pose.pose.position.x = ball_position_subscriber.ball_position[0]
-            goal_msg.pose.pose.position.y = ball_position_subscriber.ball_position[1]
-            goal_msg.pose.pose.orientation.w = 1.0  # Assuming no specific orientation is required
-
-            navigation.get_logger().info(
-                f"Sending navigation goal to ball position x: {goal_msg.pose.pose.position.x}, y: {goal_msg.pose.pose.position.y}"
-            )
-
-            navigation._send_goal_future = navigation._action_client.send_goal_async(goal_msg)
-            rclpy.spin_until_future_complete(navigation, navigation._send_goal_future)
-
-            goal_handle = navigation._send_goal_future.result()
-            if not goal_handle.accepted:
-                navigation.get_logger().error("Goal to ball position was rejected.")
-                continue
-
-            navigation.get_logger().info("Goal to ball position accepted.")
-            result_future = goal_handle.get_result_async()
-            rclpy.spin_until_future_complete(navigation, result_future)
-
-            if result_future.result().status == GoalStatus.STATUS_SUCCEEDED:
-                navigation.get_logger().info("Arrived at ball position.")
-                break
-            else:
-                navigation.get_logger().info("Failed to reach ball position.")
-        else:
-            navigation.get_logger().info("No ball position received yet, continuing navigation...")
-            
-
-          # Vérifie les mises à jour de la position de la balle
-    print("Navigation loop finished.")
-
-    navigation.destroy_node()
-    laser_subscriber.destroy_node()
-    ball_position_subscriber.destroy_node()  # Détruire le nouveau subscriber
-    rclpy.shutdown()
-    
+    task = executor.create_task(navigation.explore(ball_position_subscriber, cmd_vel_publisher, command))
+    try:
+        executor.spin_until_future_complete(task)
+    finally:
+        executor.shutdown()
+        for node in nodes:
+            node.destroy_node()
+        rclpy.shutdown()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,263 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Utility ranking of the frontier clusters for the frontier explorer of slam.py.
+
+moveToFrontiers used to drive to the frontier farthest from the robot in a straight line, which
+maximizes the travel rather than the area mapped per meter. rank_frontiers scores every cluster
+of a FrontierTracker by the area it is expected to reveal over the cost of getting there:
+
+- the gain is the unknown area the robot can map through the frontier. A frontier of n cells
+  opens at most n x (sensor range) cells of the unknown space, and no more than the unknown
+  cells within sensor range of its centroid, which are counted for all the clusters at once
+  from one summed-area table of the unknown cells;
+- the cost is the travel distance along the free space to the frontier, from one wavefront
+  from the robot shared by all the clusters: the cost of a cluster is the smallest distance
+  next to one of its cells. A fixed cost per goal keeps the frontiers next to the robot from
+  being worth an infinite utility.
+
+The clusters the robot cannot get to are dropped.
+
+Run ``python3 -m turtlebot_motion.frontier_ranking`` to compare the time to map 95% of the
+explorer_gazebo maps with the ranking and with the farthest frontier, in a simulation of the
+robot and of its laser scanner.
+"""
+
+from collections import namedtuple
+import os
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from turtlebot_motion.frontier_search import OCC_THRESHOLD, OccupancyGrid2d
+from turtlebot_motion.frontier_tracker import FrontierTracker
+from turtlebot_motion.map_fields import FOUR_CONNECTIVITY, free_space, geodesic_distance
+from turtlebot_motion.map_fields import nearest_cell, window_minimum
+from turtlebot_motion.view_gain import view_rays
+from turtlebot_motion.waypoint_scoring import box_sums, summed_area_table
+
+
+# key: id of the cluster in the tracker
+# utility: gain over cost, the frontiers are visited by decreasing utility
+# gain: unknown cells expected to be mapped through the frontier
+# cost: travel distance to the frontier in meters, without the cost per goal
+FrontierScore = namedtuple('FrontierScore', ['key', 'utility', 'gain', 'cost'])
+
+
+def unknown_around(data, rows, cols, radius):
+    """
+    Counts the unknown cells in the (2 radius + 1) square window around many cells at once.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param rows: row of every cell
+    :param cols: column of every cell
+    :param radius: half-size of the windows, in cells; the windows are clipped to the map
+    :return: int64 array with the number of unknown cells around every cell
+    """
+    height, width = data.shape
+    table = summed_area_table(data == OccupancyGrid2d.CostValues.NoInformation.value)
+    rows, cols = np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64)
+    return box_sums(table, np.clip(rows - radius, 0, height),
+                    np.clip(rows + radius + 1, 0, height), np.clip(cols - radius, 0, width),
+                    np.clip(cols + radius + 1, 0, width))
+
+
+def rank_frontiers(data, labels, frontiers, robot, resolution, sensor_range=3.5, goal_cost=1.0,
+                   occ_threshold=OCC_THRESHOLD, distance=None):
+    """
+    Scores the frontier clusters by expected gain over travel cost.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param labels: id of the cluster of every cell, 0 elsewhere, as FrontierTracker.labels
+    :param frontiers: dict of id to Frontier of the clusters to score
+    :param robot: (row, column) of the cell of the robot
+    :param resolution: size of one cell in meters
+    :param sensor_range: range of the laser scanner in meters
+    :param goal_cost: fixed cost of a goal in meters, added to the travel distance
+    :param occ_threshold: cost above which a cell cannot be driven through
+    :param distance: travel distance in cells from the robot to every cell, as returned by
+    geodesic_distance over the free cells, or None to compute it
+    :return: list of FrontierScore of the reachable clusters, by decreasing utility
+    """
+    data = np.asarray(data)
+    if len(frontiers) == 0:
+        return []
+    if distance is None:
+        distance = geodesic_distance(free_space(data, occ_threshold), robot)
+        if distance is None:
+            return []
+
+    keys = np.array(sorted(frontiers), dtype=np.int64)
+    # the frontier cells are unknown, their distance is the one of the closest free neighbour
+    cells = np.flatnonzero(np.isin(labels, keys))
+    rows, cols = np.divmod(cells, data.shape[1])
+    cell_costs = window_minimum(distance, rows, cols, 3)
+    costs = np.asarray(ndimage.minimum(cell_costs, labels.ravel()[cells], keys), dtype=np.float64)
+
+    reach = int(round(sensor_range / resolution))
+    centroids = np.array([(frontiers[key].row, frontiers[key].col) for key in keys.tolist()])
+    sizes = np.array([frontiers[key].size for key in keys.tolist()], dtype=np.int64)
+    behind = unknown_around(data, np.round(centroids[:, 0]), np.round(centroids[:, 1]), reach)
+    gains = np.minimum(sizes * reach, behind)
+
+    costs *= resolution
+    reachable = np.isfinite(costs)
+    utilities = np.where(reachable, gains / (costs + goal_cost), 0.0)
+    order = np.argsort(-utilities, kind='stable')
+    return [FrontierScore(int(keys[index]), float(utilities[index]), int(gains[index]),
+                          float(costs[index]))
+            for index in order.tolist() if reachable[index]]
+
+
+def farthest_frontier(scores, frontiers, robot):
+    """
+    Picks the reachable frontier farthest from the robot in a straight line, the previous rule.
+
+    :param scores: list of FrontierScore of the reachable clusters
+    :param frontiers: dict of id to Frontier
+    :param robot: (row, column) of the cell of the robot
+    :return: FrontierScore, or None if there is none
+    """
+    if len(scores) == 0:
+        return None
+    return max(scores, key=lambda score: np.hypot(frontiers[score.key].row - robot[0],
+                                                  frontiers[score.key].col - robot[1]))
+
+
+def gazebo_map(path, resolution=0.05, cell_size=0.5):
+    """
+    Rasterizes an explorer_gazebo map, whose CSV cells are walls (1) or floor (0).
+
+    The CSV rows are along x and its columns along y, as gazebo-map-from-csv.py builds the
+    worlds.
+
+    :param path: path of the CSV file
+    :param resolution: size of one cell of the grid in meters
+    :param cell_size: size of one CSV cell in meters
+    :return: int8 grid of the map, 100 for the walls and 0 for the floor, indexed [y, x]
+    """
+    walls = np.genfromtxt(path, delimiter=',').astype(bool).T
+    scale = int(round(cell_size / resolution))
+    return np.where(np.kron(walls, np.ones((scale, scale), dtype=bool)), 100, 0).astype(np.int8)
+
+
+def _scan(truth, known, cell, offsets, unique):
+    # the cells of the rays are mapped up to the first wall, which is mapped too
+    margin = int(np.abs(offsets).max()) + 1
+    height, width = truth.shape
+    opaque = np.ones((height + 2 * margin, width + 2 * margin), dtype=bool)
+    opaque[margin:-margin, margin:-margin] = truth > OCC_THRESHOLD
+    rows = offsets[:, :, 0] + cell[0] + margin
+    cols = offsets[:, :, 1] + cell[1] + margin
+    visible = np.ones(rows.shape, dtype=bool)
+    np.logical_and.accumulate(~opaque[rows[:, :-1], cols[:, :-1]], axis=1, out=visible[:, 1:])
+    rows, cols = rows.ravel()[unique] - margin, cols.ravel()[unique] - margin
+    inside = visible.ravel()[unique] & (rows >= 0) & (cols >= 0) & (rows < height) & (cols < width)
+    known[rows[inside], cols[inside]] = truth[rows[inside], cols[inside]]
+
+
+def explore(truth, start, rule, resolution=0.05, sensor_range=3.5, speed=0.22, goal_time=2.0,
+            scan_step=0.25, target=0.95, max_goals=200):
+    """
+    Simulates the exploration of a map, driving to one frontier after the other.
+
+    The robot maps the cells its laser scanner sees every scan_step meters, drives along the
+    shortest path over the mapped free space, and stops for goal_time seconds at every goal.
+
+    :param truth: int8 grid of the map, from gazebo_map
+    :param start: (row, column) of the cell the robot starts from
+    :param rule: 'utility' for rank_frontiers, 'farthest' for farthest_frontier
+    :return: time in seconds to map the target fraction of the free cells reachable from the
+    start, the distance travelled in meters and the number of goals; the time is inf if the
+    robot ran out of frontiers first
+    """
+    labels, _ = ndimage.label(truth == 0, structure=FOUR_CONNECTIVITY)
+    reachable = labels == labels[start]
+    total = np.count_nonzero(reachable)
+    offsets, unique = view_rays(fov_deg=360.0, max_range=sensor_range, resolution=resolution,
+                                ray_count=720, headings=[0.0])
+    step = max(int(round(scan_step / resolution)), 1)
+
+    known = np.full(truth.shape, -1, dtype=np.int8)
+    tracker = FrontierTracker()
+    robot = start
+    travelled, goals = 0.0, 0
+    _scan(truth, known, robot, offsets, unique)
+    while np.count_nonzero(reachable & (known == 0)) < target * total:
+        if goals == max_goals:
+            return float('inf'), travelled, goals
+        tracker.update(known, (0.0, 0.0), resolution)
+        frontiers = tracker.frontiers()
+        free = free_space(known, OCC_THRESHOLD)
+        distance = geodesic_distance(free, robot)
+        scores = rank_frontiers(known, tracker.labels, frontiers, robot, resolution, sensor_range,
+                                distance=distance)
+        if rule == 'utility':
+            chosen = scores[0] if scores else None
+        else:
+            chosen = farthest_frontier(scores, frontiers, robot)
+        if chosen is None:
+            return float('inf'), travelled, goals
+
+        # the goal is the cell the robot can get to closest to the centroid of the frontier
+        goal = nearest_cell(np.isfinite(distance), (int(round(frontiers[chosen.key].row)),
+                                                    int(round(frontiers[chosen.key].col))),
+                            max_radius=1024)
+        field = geodesic_distance(free, goal)
+        goals += 1
+        # the robot follows the steepest descent of the distance to the goal
+        path = 0
+        while field[robot] > 0:
+            r0, c0 = max(robot[0] - 1, 0), max(robot[1] - 1, 0)
+            window = field[r0:robot[0] + 2, c0:robot[1] + 2]
+            row, col = np.unravel_index(np.argmin(window), window.shape)
+            travelled += np.hypot(row + r0 - robot[0], col + c0 - robot[1]) * resolution
+            robot = (int(row + r0), int(col + c0))
+            path += 1
+            if path % step == 0:
+                _scan(truth, known, robot, offsets, unique)
+        _scan(truth, known, robot, offsets, unique)
+    return travelled / speed + goals * goal_time, travelled, goals
+
+
+def benchmark(spawn=(2.0, 3.0), resolution=0.05):
+    """
+    Prints the time to map 95% of every explorer_gazebo map, with both rules.
+
+    The robot starts at the spawn position of explorer.launch.py, or the closest free cell.
+
+    :param spawn: (x, y) position of the robot in meters
+    :param resolution: size of one cell in meters
+    """
+    directory = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..',
+                             'explorer_gazebo', 'maps')
+    names = sorted((name for name in os.listdir(directory) if name.endswith('.csv')),
+                   key=lambda name: int(name[3:-4]))
+    print(f"{'map':>6} {'farthest (s)':>13} {'utility (s)':>12} {'farthest (m)':>13} "
+          f"{'utility (m)':>12} {'goals':>6} {'rank (ms)':>10}")
+    totals = np.zeros(2)
+    for name in names:
+        truth = gazebo_map(os.path.join(directory, name), resolution)
+        start = nearest_cell(truth == 0, (int(spawn[1] / resolution), int(spawn[0] / resolution)),
+                             max_radius=1024)
+        results = [explore(truth, start, rule, resolution) for rule in ('farthest', 'utility')]
+        totals += [result[0] for result in results]
+
+        # latency of one ranking, on the map half explored
+        known = np.where(np.arange(truth.shape[1])[None, :] < truth.shape[1] // 2, truth, -1)
+        tracker = FrontierTracker()
+        tracker.update(known.astype(np.int8), (0.0, 0.0), resolution)
+        begin = time.perf_counter()
+        rank_frontiers(known, tracker.labels, tracker.frontiers(), start, resolution)
+        latency = time.perf_counter() - begin
+
+        print(f'{name[:-4]:>6} {results[0][0]:>13.0f} {results[1][0]:>12.0f} '
+              f'{results[0][1]:>13.1f} {results[1][1]:>12.1f} '
+              f'{results[0][2]:>2} / {results[1][2]:<2} {latency * 1000:>10.2f}')
+    print(f"{'total':>6} {totals[0]:>13.0f} {totals[1]:>12.0f}")
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Frontier extraction for the frontier explorer of slam.py.
+
+A frontier cell is an unknown cell next to a free cell and away from obstacles, and a frontier
+is a connected cluster of them, reported by the centroid of its cells. getFrontierBFS, the
+original search, walks the map from the robot cell by cell with a BFS over its 8 neighbours,
+then walks every frontier found with a second BFS: a few seconds per map once the map is large.
+The BFS keeps the classification flags of the cells in a FrontierSearch, one byte per cell
+allocated for the map size, and its queues are deques of cell indices.
+
+frontier_clusters gets the same frontiers with passes over the whole int8 grid:
+
+- the frontier mask is built from the 8 shifted copies of the grid: unknown cells with a free
+  neighbour and no neighbour above OCC_THRESHOLD;
+- the area the BFS walks, the cells next to a free cell, and the frontier clusters are labelled
+  with one connected-component pass each;
+- the sizes and centroids of the clusters are bincount reductions over their labels, and the
+  clusters of at most MIN_FRONTIER_SIZE cells are dropped.
+
+Like the BFS, the first row and column of the grid are never neighbours of a cell. The
+frontiers are ordered by label rather than by BFS discovery. The BFS does not walk on from a
+frontier cell it reaches through another cell of the same frontier, so it can miss a frontier
+that can only be reached across another one; the labelling does not.
+
+Run ``python3 -m turtlebot_motion.frontier_search`` to compare both searches on explored maps
+up to 1000 x 1000 cells.
+"""
+
+from collections import deque
+from enum import Enum
+import time
+from types import SimpleNamespace
+
+import numpy as np
+from scipy import ndimage
+
+from explorer_map_utils.occupancy_grid import occupancy_grid_view
+
+
+OCC_THRESHOLD = 10
+MIN_FRONTIER_SIZE = 5
+
+# 8-connectivity, the neighbourhood of the BFS
+EIGHT_CONNECTIVITY = ndimage.generate_binary_structure(2, 2)
+
+
+class OccupancyGrid2d():
+    class CostValues(Enum):
+        FreeSpace = 0
+        InscribedInflated = 100
+        LethalObstacle = 100
+        NoInformation = -1
+
+    def __init__(self, map):
+        self.map = map
+        self.grid = occupancy_grid_view(map)  # read-only int8 view of the map, indexed [my, mx]
+
+    def getCost(self, mx, my):
+        return int(self.grid.data[my, mx])
+
+    def getSize(self):
+        return (self.map.info.width, self.map.info.height)
+
+    def getSizeX(self):
+        return self.map.info.width
+
+    def getSizeY(self):
+        return self.map.info.height
+
+    def mapToWorld(self, mx, my):
+        wx = self.map.info.origin.position.x + (mx + 0.5) * self.map.info.resolution
+        wy = self.map.info.origin.position.y + (my + 0.5) * self.map.info.resolution
+
+        return (wx, wy)
+
+    def worldToMap(self, wx, wy):
+        if (wx < self.map.info.origin.position.x or wy < self.map.info.origin.position.y):
+            raise Exception("World coordinates out of bounds")
+
+        mx = int((wx - self.map.info.origin.position.x) / self.map.info.resolution)
+        my = int((wy - self.map.info.origin.position.y) / self.map.info.resolution)
+
+        if (my > self.map.info.height or mx > self.map.info.width):
+            raise Exception("Out of bounds")
+
+        return (mx, my)
+
+
+def neighbour_any(mask, first_row=True, first_col=True):
+    """
+    Marks the cells with a True cell among their 3 x 3 neighbours, themselves included.
+
+    The first row and column of the grid are never neighbours, as in getNeighbors.
+
+    :param mask: boolean array
+    :param first_row: whether the first row of the mask is the first row of the grid
+    :param first_col: whether the first column of the mask is the first column of the grid
+    :return: boolean array of the same shape
+    """
+    height, width = mask.shape
+    padded = np.zeros((height + 2, width + 2), dtype=bool)
+    padded[1:height + 1, 1:width + 1] = mask
+    padded[1, :] &= not first_row
+    padded[:, 1] &= not first_col
+    result = np.zeros((height, width), dtype=bool)
+    for dr in range(3):
+        for dc in range(3):
+            result |= padded[dr:dr + height, dc:dc + width]
+    return result
+
+
+def frontier_mask(data, occ_threshold=OCC_THRESHOLD):
+    """
+    Gets the frontier cells of an occupancy grid, as isFrontierPoint classifies them.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param occ_threshold: cost above which a neighbour is an obstacle
+    :return: boolean array, True for the unknown cells with a free neighbour and no obstacle
+    neighbour
+    """
+    data = np.asarray(data)
+    return frontier_window(data, 0, data.shape[0], 0, data.shape[1], occ_threshold)
+
+
+def frontier_window(data, row_start, row_stop, col_start, col_stop, occ_threshold=OCC_THRESHOLD):
+    """
+    Gets the frontier cells of a window of an occupancy grid, from the window and its border.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param row_start: first row of the window
+    :param row_stop: row after the last row of the window
+    :param col_start: first column of the window
+    :param col_stop: column after the last column of the window
+    :param occ_threshold: cost above which a neighbour is an obstacle
+    :return: boolean array of the shape of the window, see frontier_mask
+    """
+    height, width = data.shape
+    r0, c0 = max(row_start - 1, 0), max(col_start - 1, 0)
+    slab = data[r0:min(row_stop + 1, height), c0:min(col_stop + 1, width)]
+    free = neighbour_any(slab == OccupancyGrid2d.CostValues.FreeSpace.value, r0 == 0, c0 == 0)
+    blocked = neighbour_any(slab > occ_threshold, r0 == 0, c0 == 0)
+    frontier = (slab == OccupancyGrid2d.CostValues.NoInformation.value) & free & ~blocked
+    return frontier[row_start - r0:row_stop - r0, col_start - c0:col_stop - c0]
+
+
+def find_free(data, row, col):
+    """
+    Finds the free cell closest to a cell, where the search of the frontiers starts.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param row: row of the cell
+    :param col: column of the cell
+    :return: (row, column) of the closest free cell, or None if the grid has none
+    """
+    free = np.asarray(data) == OccupancyGrid2d.CostValues.FreeSpace.value
+    if free[row, col]:
+        return row, col
+    rows, cols = np.nonzero(free)
+    if len(rows) == 0:
+        return None
+    # the BFS reaches the cells in rings of growing Chebyshev distance
+    index = np.lexsort((np.hypot(rows - row, cols - col),
+                        np.maximum(np.abs(rows - row), np.abs(cols - col))))[0]
+    return int(rows[index]), int(cols[index])
+
+
+def frontier_clusters(data, row, col, occ_threshold=OCC_THRESHOLD, min_size=MIN_FRONTIER_SIZE):
+    """
+    Gets the frontiers the robot can get to from a cell.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param row: row of the cell of the robot
+    :param col: column of the cell of the robot
+    :param occ_threshold: cost above which a neighbour is an obstacle
+    :param min_size: frontiers of at most this number of cells are dropped
+    :return: (rows, cols, sizes), the centroid of every frontier in (fractional) cells and its
+    number of cells
+    """
+    data = np.asarray(data)
+    empty = (np.zeros(0), np.zeros(0), np.zeros(0, dtype=np.int64))
+    start = find_free(data, row, col)
+    if start is None:
+        return empty
+
+    # the BFS walks the cells next to a free cell, from the free cell closest to the robot
+    walked = neighbour_any(data == OccupancyGrid2d.CostValues.FreeSpace.value)
+    walked[0, :] = walked[:, 0] = False
+    walked[start] = True
+    regions, _ = ndimage.label(walked, structure=EIGHT_CONNECTIVITY)
+
+    # every frontier lies within one region, the frontiers of the other regions are not reached
+    frontier = frontier_mask(data, occ_threshold) & (regions == regions[start])
+    frontier[0, :] = frontier[:, 0] = False
+    labels, count = ndimage.label(frontier, structure=EIGHT_CONNECTIVITY)
+    if count == 0:
+        return empty
+
+    cells = np.flatnonzero(labels)
+    cluster = labels.ravel()[cells]
+    cell_rows, cell_cols = np.divmod(cells, data.shape[1])
+    sizes = np.bincount(cluster, minlength=count + 1)[1:]
+    rows = np.bincount(cluster, weights=cell_rows, minlength=count + 1)[1:] / sizes
+    cols = np.bincount(cluster, weights=cell_cols, minlength=count + 1)[1:] / sizes
+    kept = sizes > min_size
+    return rows[kept], cols[kept], sizes[kept]
+
+
+def getFrontier(pose, costmap, logger):
+    """
+    Gets the centroids of the frontiers the robot can get to, with frontier_clusters.
+
+    :param pose: Pose of the robot
+    :param costmap: OccupancyGrid2d of the map
+    :param logger: logger of the node
+    :return: list of (x, y) centroids in world coordinates
+    """
+    mx, my = costmap.worldToMap(pose.position.x, pose.position.y)
+    rows, cols, _ = frontier_clusters(costmap.grid.data, my, mx)
+    wx, wy = costmap.mapToWorld(cols, rows)
+    return list(zip(wx.tolist(), wy.tolist()))
+
+
+class PointClassification(Enum):
+    MapOpen = 1
+    MapClosed = 2
+    FrontierOpen = 4
+    FrontierClosed = 8
+
+
+MAP_OPEN = PointClassification.MapOpen.value
+MAP_CLOSED = PointClassification.MapClosed.value
+FRONTIER_OPEN = PointClassification.FrontierOpen.value
+FRONTIER_CLOSED = PointClassification.FrontierClosed.value
+
+
+class FrontierSearch():
+    """
+    Classification flags of the cells visited by the BFS, in a uint8 array indexed by cell.
+
+    The flags are allocated once for a map size and cleared between searches, so the memory of a
+    search is one byte per cell and its queues, whatever the number of searches.
+    """
+
+    def __init__(self):
+        self.flags = bytearray()  # PointClassification flags of every cell, at my * width + mx
+        self.width = 0
+        self.height = 0
+
+    def reset(self, costmap):
+        """
+        Clears the flags for a search over a map, reallocating them if the map size changed.
+
+        :param costmap: OccupancyGrid2d of the map
+        :return: the flags
+        """
+        self.width, self.height = costmap.getSizeX(), costmap.getSizeY()
+        if len(self.flags) != self.width * self.height:
+            self.flags = bytearray(self.width * self.height)
+        else:
+            np.frombuffer(self.flags, dtype=np.uint8).fill(0)
+        return self.flags
+
+
+def grid_costs(costmap):
+    """
+    Gets the costs of a map as a flat int8 memoryview, indexed by cell, without copying them.
+
+    :param costmap: OccupancyGrid2d of the map
+    :return: memoryview of the costs, at my * width + mx
+    """
+    return memoryview(np.ascontiguousarray(costmap.grid.data).reshape(-1))
+
+
+def centroid(arr):
+    arr = np.array(arr)
+    length = arr.shape[0]
+    sum_x = np.sum(arr[:, 0])
+    sum_y = np.sum(arr[:, 1])
+    return sum_x/length, sum_y/length
+
+
+def findFree(mx, my, costmap, search=None):
+    """
+    Finds the free cell closest to a cell with a BFS.
+
+    :param mx: column of the cell
+    :param my: row of the cell
+    :param costmap: OccupancyGrid2d of the map
+    :param search: FrontierSearch whose flags the BFS uses, a new one if None
+    :return: (mx, my) of the free cell, or of the cell itself if there is none
+    """
+    costs = grid_costs(costmap)
+    width = costmap.getSizeX()
+    start = my * width + mx
+    if costs[start] == OccupancyGrid2d.CostValues.FreeSpace.value:
+        return (mx, my)
+
+    flags = (FrontierSearch() if search is None else search).reset(costmap)
+    bfs = deque([start])
+
+    while len(bfs) > 0:
+        loc = bfs.popleft()
+
+        if costs[loc] == OccupancyGrid2d.CostValues.FreeSpace.value:
+            return (loc % width, loc // width)
+
+        for n in getNeighbors(loc, width, costmap.getSizeY()):
+            if flags[n] & MAP_CLOSED == 0:
+                flags[n] |= MAP_CLOSED
+                bfs.append(n)
+
+    return (mx, my)
+
+
+def getFrontierBFS(pose, costmap, logger, search=None):
+    """
+    Gets the centroids of the frontiers with the original cell-by-cell BFS, the reference of
+    getFrontier.
+
+    :param pose: Pose of the robot
+    :param costmap: OccupancyGrid2d of the map
+    :param logger: logger of the node
+    :param search: FrontierSearch whose flags the BFS uses, a new one if None
+    :return: list of (x, y) centroids in world coordinates, in the order the BFS finds them
+    """
+    search = FrontierSearch() if search is None else search
+    mx, my = costmap.worldToMap(pose.position.x, pose.position.y)
+
+    freePoint = findFree(mx, my, costmap, search)
+    flags = search.reset(costmap)
+    costs = grid_costs(costmap)
+    width, height = search.width, search.height
+
+    start = freePoint[1] * width + freePoint[0]
+    flags[start] = MAP_OPEN
+    mapPointQueue = deque([start])
+
+    frontiers = []
+
+    while len(mapPointQueue) > 0:
+        p = mapPointQueue.popleft()
+
+        if flags[p] & MAP_CLOSED != 0:
+            continue
+
+        if isFrontierPoint(p, costs, width, height):
+            flags[p] |= FRONTIER_OPEN
+            frontierQueue = deque([p])
+            newFrontier = []
+
+            while len(frontierQueue) > 0:
+                q = frontierQueue.popleft()
+
+                if flags[q] & (MAP_CLOSED | FRONTIER_CLOSED) != 0:
+                    continue
+
+                if isFrontierPoint(q, costs, width, height):
+                    newFrontier.append(q)
+
+                    for w in getNeighbors(q, width, height):
+                        if flags[w] & (FRONTIER_OPEN | FRONTIER_CLOSED | MAP_CLOSED) == 0:
+                            flags[w] |= FRONTIER_OPEN
+                            frontierQueue.append(w)
+
+                flags[q] |= FRONTIER_CLOSED
+
+            newFrontierCords = []
+            for x in newFrontier:
+                flags[x] |= MAP_CLOSED
+                newFrontierCords.append(costmap.mapToWorld(x % width, x // width))
+
+            if len(newFrontier) > MIN_FRONTIER_SIZE:
+                frontiers.append(centroid(newFrontierCords))
+
+        for v in getNeighbors(p, width, height):
+            if flags[v] & (MAP_OPEN | MAP_CLOSED) == 0:
+                free = OccupancyGrid2d.CostValues.FreeSpace.value
+                if any(costs[x] == free for x in getNeighbors(v, width, height)):
+                    flags[v] |= MAP_OPEN
+                    mapPointQueue.append(v)
+
+        flags[p] |= MAP_CLOSED
+
+    return frontiers
+
+
+def getNeighbors(index, width, height):
+    """
+    Iterates over the cells around a cell and the cell itself, except the first row and column.
+
+    :param index: cell, at my * width + mx
+    :param width: width of the map
+    :param height: height of the map
+    :return: generator of the cells
+    """
+    my, mx = divmod(index, width)
+    for x in range(mx - 1, mx + 2):
+        for y in range(my - 1, my + 2):
+            if (x > 0 and x < width and y > 0 and y < height):
+                yield y * width + x
+
+
+def isFrontierPoint(index, costs, width, height):
+    if costs[index] != OccupancyGrid2d.CostValues.NoInformation.value:
+        return False
+
+    hasFree = False
+    for n in getNeighbors(index, width, height):
+        cost = costs[n]
+
+        if cost > OCC_THRESHOLD:
+            return False
+
+        if cost == OccupancyGrid2d.CostValues.FreeSpace.value:
+            hasFree = True
+
+    return hasFree
+
+
+def explored_map(side, resolution=0.05, seed=0):
+    """
+    Builds an occupancy grid explored around its centre, the way Cartographer grows it.
+
+    The explored part is rooms 5 m wide with doors, with some clutter, a few unknown pockets and
+    an unknown border; the rest of the grid is unknown.
+
+    :param side: side of the square grid, in cells
+    :param resolution: size of one cell in meters
+    :param seed: seed of the random generator
+    :return: OccupancyGrid-like message, with the data as a list of int8 values
+    """
+    rng = np.random.default_rng(seed)
+    data = np.full((side, side), -1, dtype=np.int8)
+    inner = slice(side // 8, side - side // 8)
+    data[inner, inner] = 0
+    room = int(5.0 / resolution)
+    door = int(0.8 / resolution)
+    for start in range(side // 8, side - side // 8, room):
+        data[start:start + 2, inner] = 100
+        data[inner, start:start + 2] = 100
+        for other in range(side // 8, side - side // 8, room):
+            data[start:start + 2, other + room // 2:other + room // 2 + door] = 0
+            data[other + room // 2:other + room // 2 + door, start:start + 2] = 0
+    explored = data[inner, inner]
+    explored[(rng.random(explored.shape) < 0.002) & (explored == 0)] = 100
+    for _ in range(side // 50):
+        row, col = rng.integers(side // 8, side - side // 8 - 20, size=2)
+        data[row:row + rng.integers(5, 20), col:col + rng.integers(5, 20)] = -1
+    # the walls of the outer rooms are only partly mapped
+    edge = data[side // 8 - 1:side - side // 8 + 1, side // 8 - 1:side - side // 8 + 1]
+    edge[:3, ::7] = -1
+    edge[-3:, 3::5] = -1
+
+    return grid_message(data, resolution)
+
+
+def grid_message(data, resolution=0.05):
+    """
+    Wraps a grid in an OccupancyGrid-like message centred on the origin, for the benchmarks.
+
+    :param data: 2D array of occupancy values in [-1, 100]
+    :param resolution: size of one cell in meters
+    :return: OccupancyGrid-like message, with the data as a list of int8 values
+    """
+    height, width = data.shape
+    corner = SimpleNamespace(x=-width * resolution / 2, y=-height * resolution / 2)
+    info = SimpleNamespace(width=width, height=height, resolution=resolution,
+                           origin=SimpleNamespace(position=corner))
+    header = SimpleNamespace(frame_id='map', stamp=None)
+    return SimpleNamespace(info=info, header=header, data=data.ravel().tolist())
+
+
+def benchmark(map_sizes=(250, 500, 1000), resolution=0.05):
+    """
+    Prints the latency of getFrontier against the BFS, and checks that they find the same
+    frontiers.
+
+    :param map_sizes: side of the square maps, in cells
+    :param resolution: size of one cell in meters
+    """
+    print(f"{'map (cells)':>12} {'frontiers':>10} {'BFS (ms)':>10} {'vectorized (ms)':>16} "
+          f"{'speedup':>8}")
+    for side in map_sizes:
+        costmap = OccupancyGrid2d(explored_map(side, resolution))
+        pose = SimpleNamespace(position=SimpleNamespace(x=0.1, y=0.1))
+
+        start = time.perf_counter()
+        reference = getFrontierBFS(pose, costmap, None)
+        bfs = time.perf_counter() - start
+
+        vectorized = float('inf')
+        for _ in range(5):
+            start = time.perf_counter()
+            frontiers = getFrontier(pose, costmap, None)
+            vectorized = min(vectorized, time.perf_counter() - start)
+
+        assert len(frontiers) == len(reference)
+        assert np.allclose(sorted(frontiers), sorted(reference))
+        print(f'{side:>5} x {side:<4} {len(frontiers):>10} {bfs * 1000:>10.0f} '
+              f'{vectorized * 1000:>16.2f} {bfs / vectorized:>7.0f}x')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Frontier clusters kept up to date across the maps, rather than extracted again from every map.
+
+Two consecutive Cartographer maps only differ around the robot, yet the frontiers used to be
+extracted from the whole grid for every goal. FrontierTracker keeps the frontier cells and the
+label of the cluster of every cell between maps. On a new map it:
+
+- finds the box of the cells that changed, with one vectorized comparison with the previous
+  grid, unless the caller already knows the boxes;
+- classifies again the cells of the box and of its border, whose neighbourhood changed;
+- labels again only the clusters that touch the box, within the union of the box and of their
+  bounding boxes. A new cluster keeps the id of the old cluster it overlaps most, so that a
+  frontier that grows or shrinks is reported as changed rather than removed and added.
+
+The update reports the clusters added, removed and changed, among the clusters of more than
+min_size cells. When the map grows, the state is moved to the new origin and the new map is
+compared with it as usual; any other change of the frame labels the whole grid again. Unlike
+getFrontier, the tracker keeps the clusters the robot cannot get to, such as an unknown pocket in
+a closed room; the ranking of the frontiers drops them.
+
+Run ``python3 -m turtlebot_motion.frontier_tracker`` to compare the latency of an update with a
+full extraction, as the robot maps a 50 m x 50 m grid.
+"""
+
+from collections import namedtuple
+import time
+
+import numpy as np
+from scipy import ndimage
+
+from turtlebot_motion.frontier_search import EIGHT_CONNECTIVITY, MIN_FRONTIER_SIZE, OCC_THRESHOLD
+from turtlebot_motion.frontier_search import explored_map, frontier_mask, frontier_window
+
+
+# size: number of cells of the cluster
+# row, col: centroid of the cluster, in (fractional) cells
+# box: (row_start, row_stop, col_start, col_stop) bounding box of the cluster
+Frontier = namedtuple('Frontier', ['size', 'row', 'col', 'box'])
+
+# added, removed, changed: sorted ids of the clusters of more than min_size cells that appeared,
+# disappeared or whose cells changed
+# relabelled: number of cells relabelled by the update
+FrontierUpdate = namedtuple('FrontierUpdate', ['added', 'removed', 'changed', 'relabelled'])
+
+
+def changed_box(old, new):
+    """
+    Gets the bounding box of the cells that differ between two grids of the same shape.
+
+    :param old: 2D array
+    :param new: 2D array
+    :return: list with the (row_start, row_stop, col_start, col_stop) box, empty if the grids are
+    equal
+    """
+    diff = old != new
+    rows = np.flatnonzero(diff.any(axis=1))
+    if len(rows) == 0:
+        return []
+    cols = np.flatnonzero(diff.any(axis=0))
+    return [(int(rows[0]), int(rows[-1]) + 1, int(cols[0]), int(cols[-1]) + 1)]
+
+
+def union_box(first, second):
+    return (min(first[0], second[0]), max(first[1], second[1]),
+            min(first[2], second[2]), max(first[3], second[3]))
+
+
+class FrontierTracker():
+    """Frontier cells and cluster labels of the newest map, updated over the changed regions."""
+
+    def __init__(self, occ_threshold=OCC_THRESHOLD, min_size=MIN_FRONTIER_SIZE):
+        """
+        :param occ_threshold: cost above which a neighbour is an obstacle
+        :param min_size: clusters of at most this number of cells are not reported
+        """
+        self.occ_threshold = occ_threshold
+        self.min_size = min_size
+
+        self.data = None  # copy of the newest grid
+        self.origin = None  # (x, y) of the cell (0, 0) of the newest grid
+        self.resolution = None
+        self.mask = None  # True for the frontier cells
+        self.labels = None  # int64 id of the cluster of every frontier cell, 0 elsewhere
+        self.clusters = {}  # id -> Frontier, for every cluster whatever its size
+        self._next_id = 1
+
+    def frontiers(self):
+        """
+        :return: dict of id to Frontier, for the clusters of more than min_size cells
+        """
+        return {key: frontier for key, frontier in self.clusters.items()
+                if frontier.size > self.min_size}
+
+    def update(self, data, origin=(0.0, 0.0), resolution=1.0, boxes=None):
+        """
+        Updates the frontiers with a new map.
+
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param origin: (x, y) position of the cell (0, 0) in meters
+        :param resolution: size of one cell in meters
+        :param boxes: (row_start, row_stop, col_start, col_stop) boxes of the cells that changed
+        since the last map, or None to compare the maps
+        :return: FrontierUpdate
+        """
+        data = np.asarray(data)
+        origin = (float(origin[0]), float(origin[1]))
+        moved = self._reframe(data.shape, origin, resolution)
+        if moved is None:
+            return self._rebuild(data, origin, resolution)
+        if boxes is None or moved:
+            boxes = changed_box(self.data, data) + moved
+
+        before = self.frontiers()
+        touched = set()
+        relabelled = 0
+        for row_start, row_stop, col_start, col_stop in boxes:
+            if row_stop <= row_start or col_stop <= col_start:
+                continue
+            self.data[row_start:row_stop, col_start:col_stop] = data[row_start:row_stop,
+                                                                     col_start:col_stop]
+            relabelled += self._update_box(row_start, row_stop, col_start, col_stop, touched)
+
+        after = self.frontiers()
+        added = sorted(key for key in touched if key in after and key not in before)
+        removed = sorted(key for key in touched if key in before and key not in after)
+        changed = sorted(key for key in touched
+                         if key in before and key in after and before[key] != after[key])
+        return FrontierUpdate(added, removed, changed, relabelled)
+
+    def _rebuild(self, data, origin, resolution):
+        before = self.frontiers()
+        self.data = np.array(data, dtype=np.int8)
+        self.origin = origin
+        self.resolution = resolution
+        self.mask = frontier_mask(self.data, self.occ_threshold)
+        self.mask[0, :] = self.mask[:, 0] = False
+        self.labels = np.zeros(self.data.shape, dtype=np.int64)
+        self.clusters = {}
+        self._relabel(0, self.data.shape[0], 0, self.data.shape[1], np.zeros(0, dtype=np.int64))
+        return FrontierUpdate(sorted(self.frontiers()), sorted(before), [], self.data.size)
+
+    def _reframe(self, shape, origin, resolution):
+        """
+        Moves the state onto the frame of a new map that grew around the previous one.
+
+        :return: list of the boxes to classify again because the frame moved, empty if it did not,
+        or None if the state cannot be moved and must be rebuilt
+        """
+        if self.data is None or resolution != self.resolution:
+            return None
+        if shape == self.data.shape and origin == self.origin:
+            return []
+        offsets = [(old - new) / resolution for old, new in zip(self.origin, origin)]
+        if any(abs(offset - round(offset)) > 1e-3 for offset in offsets):
+            return None
+        dc, dr = (int(round(offset)) for offset in offsets)
+        height, width = self.data.shape
+        if dr < 0 or dc < 0 or dr + height > shape[0] or dc + width > shape[1]:
+            return None  # the map shrank, Cartographer maps only grow
+
+        data = np.full(shape, -1, dtype=np.int8)
+        mask = np.zeros(shape, dtype=bool)
+        labels = np.zeros(shape, dtype=np.int64)
+        data[dr:dr + height, dc:dc + width] = self.data
+        mask[dr:dr + height, dc:dc + width] = self.mask
+        labels[dr:dr + height, dc:dc + width] = self.labels
+        self.data, self.mask, self.labels = data, mask, labels
+        self.clusters = {key: Frontier(frontier.size, frontier.row + dr, frontier.col + dc,
+                                       (frontier.box[0] + dr, frontier.box[1] + dr,
+                                        frontier.box[2] + dc, frontier.box[3] + dc))
+                         for key, frontier in self.clusters.items()}
+        self.origin = origin
+        # the new cells around the previous grid, and its first row and column which were never
+        # neighbours and now are
+        return [(0, dr + 1, 0, shape[1]), (dr + height, shape[0], 0, shape[1]),
+                (0, shape[0], 0, dc + 1), (0, shape[0], dc + width, shape[1])]
+
+    def _update_box(self, row_start, row_stop, col_start, col_stop, touched):
+        """
+        Classifies the cells of a changed box again and relabels the clusters around it.
+
+        :param touched: set of the ids of the clusters changed, updated in place
+        :return: number of cells relabelled
+        """
+        height, width = self.data.shape
+        # the cells whose neighbourhood changed
+        r0, r1 = max(row_start - 1, 0), min(row_stop + 1, height)
+        c0, c1 = max(col_start - 1, 0), min(col_stop + 1, width)
+        window = frontier_window(self.data, r0, r1, c0, c1, self.occ_threshold)
+        if r0 == 0:
+            window[0, :] = False
+        if c0 == 0:
+            window[:, 0] = False
+        # the clusters of these cells and of their neighbours may merge, split or vanish
+        g0, g1 = max(r0 - 1, 0), min(r1 + 1, height)
+        h0, h1 = max(c0 - 1, 0), min(c1 + 1, width)
+        affected = np.unique(self.labels[g0:g1, h0:h1])
+        affected = affected[affected > 0]
+        if len(affected) == 0 and not window.any() and not self.mask[r0:r1, c0:c1].any():
+            return 0
+        self.mask[r0:r1, c0:c1] = window
+
+        box = (g0, g1, h0, h1)
+        for key in affected.tolist():
+            box = union_box(box, self.clusters[key].box)
+        self._relabel(*box, affected, touched)
+        return (box[1] - box[0]) * (box[3] - box[2])
+
+    def _relabel(self, row_start, row_stop, col_start, col_stop, affected, touched=None):
+        """
+        Labels again the frontier cells of a box that are not in a cluster outside 'affected'.
+
+        The clusters in 'affected' must lie within the box.
+        """
+        labels = self.labels[row_start:row_stop, col_start:col_stop]
+        old = labels.copy()
+        in_affected = np.isin(old, affected)
+        labels[in_affected] = 0
+        components, count = ndimage.label(self.mask[row_start:row_stop, col_start:col_stop]
+                                          & (labels == 0), structure=EIGHT_CONNECTIVITY)
+
+        # every new cluster keeps the id of the old cluster it overlaps most, once
+        ids = np.zeros(count + 1, dtype=np.int64)
+        both = (components > 0) & in_affected
+        if both.any():
+            pairs, overlaps = np.unique(np.stack([components[both], old[both]]), axis=1,
+                                        return_counts=True)
+            claimed = set()
+            for index in np.argsort(-overlaps, kind='stable'):
+                component, key = pairs[:, index].tolist()
+                if ids[component] == 0 and key not in claimed:
+                    ids[component] = key
+                    claimed.add(key)
+        for component in np.flatnonzero(ids[1:] == 0) + 1:
+            ids[component] = self._next_id
+            self._next_id += 1
+
+        for key in affected.tolist():
+            del self.clusters[key]
+            if touched is not None:
+                touched.add(key)
+        if count == 0:
+            return
+        cells = components > 0
+        labels[cells] = ids[components[cells]]
+
+        flat = components.ravel()
+        rows, cols = np.divmod(np.arange(flat.size), components.shape[1])
+        sizes = np.bincount(flat, minlength=count + 1)
+        row_sums = np.bincount(flat, weights=rows, minlength=count + 1)
+        col_sums = np.bincount(flat, weights=cols, minlength=count + 1)
+        for component, slices in enumerate(ndimage.find_objects(components), start=1):
+            key = int(ids[component])
+            self.clusters[key] = Frontier(
+                int(sizes[component]), row_start + row_sums[component] / sizes[component],
+                col_start + col_sums[component] / sizes[component],
+                (row_start + slices[0].start, row_start + slices[0].stop,
+                 col_start + slices[1].start, col_start + slices[1].stop))
+            if touched is not None:
+                touched.add(key)
+
+
+def full_clusters(data, occ_threshold=OCC_THRESHOLD):
+    """
+    Labels every frontier cluster of a grid from scratch, the reference of the tracker.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param occ_threshold: cost above which a neighbour is an obstacle
+    :return: sorted list of the (size, row, col) of every cluster
+    """
+    mask = frontier_mask(data, occ_threshold)
+    mask[0, :] = mask[:, 0] = False
+    labels, count = ndimage.label(mask, structure=EIGHT_CONNECTIVITY)
+    flat = labels.ravel()
+    rows, cols = np.divmod(np.arange(flat.size), labels.shape[1])
+    sizes = np.bincount(flat, minlength=count + 1)[1:]
+    row_means = np.bincount(flat, weights=rows, minlength=count + 1)[1:] / np.maximum(sizes, 1)
+    col_means = np.bincount(flat, weights=cols, minlength=count + 1)[1:] / np.maximum(sizes, 1)
+    return sorted(zip(sizes.tolist(), row_means.tolist(), col_means.tolist()))
+
+
+def benchmark(side=1000, steps=40, patch=60, seed=0):
+    """
+    Prints the latency of the tracker updates against full extractions, as the robot maps a grid.
+
+    At every step the robot maps a (patch x patch) square of the unknown pockets and of the
+    border of the explored area; every tenth step the map grows by 20 cells on the top and left.
+    The clusters of the tracker are checked against a full labelling at every step.
+
+    :param side: side of the square grid, in cells
+    :param steps: number of maps
+    :param patch: side of the square mapped at every step, in cells
+    :param seed: seed of the random generator
+    """
+    rng = np.random.default_rng(seed)
+    data = np.array(explored_map(side).data, dtype=np.int8).reshape(side, side)
+    origin = np.zeros(2)
+    tracker = FrontierTracker()
+    tracker.update(data, origin, 0.05)
+
+    full, incremental, cells, events = [], [], [], 0
+    for step in range(steps):
+        if step % 10 == 9:
+            grown = np.full((data.shape[0] + 20, data.shape[1] + 20), -1, dtype=np.int8)
+            grown[20:, 20:] = data
+            data = grown
+            origin = origin - 20 * 0.05
+        else:
+            frontier = np.argwhere(frontier_mask(data))
+            row, col = frontier[rng.integers(len(frontier))]
+            r0, c0 = max(row - patch // 2, 1), max(col - patch // 2, 1)
+            square = data[r0:r0 + patch, c0:c0 + patch]
+            square[square == -1] = 0
+            square[rng.random(square.shape) < 0.01] = 100
+
+        start = time.perf_counter()
+        reference = full_clusters(data)
+        full.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        update = tracker.update(data, origin, 0.05)
+        incremental.append(time.perf_counter() - start)
+        cells.append(update.relabelled)
+        events += len(update.added) + len(update.removed) + len(update.changed)
+
+        tracked = sorted((frontier.size, frontier.row, frontier.col)
+                         for frontier in tracker.clusters.values())
+        assert len(tracked) == len(reference)
+        assert np.allclose(tracked, reference)
+
+    print(f'{side} x {side} grid, {steps} maps, {patch} x {patch} cells mapped per map, '
+          f'{events} events')
+    print(f"{'':>12} {'median (ms)':>12} {'max (ms)':>9}")
+    print(f"{'full':>12} {np.median(full) * 1000:>12.2f} {np.max(full) * 1000:>9.2f}")
+    print(f"{'tracker':>12} {np.median(incremental) * 1000:>12.2f} "
+          f"{np.max(incremental) * 1000:>9.2f}")
+    print(f'cells relabelled per map: median {np.median(cells):.0f}, max {np.max(cells):.0f}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+End-to-end latency of the discoverer decisions.
+
+Every decision of the navigation loop (sending a goal, stopping for photos, stopping for the
+ball) is taken from the newest sensor data. LatencyMonitor records, for each kind of sensor, the
+time between the capture of the data a decision used and the decision itself, in a fixed-size
+window per sensor, and summarizes it with percentiles. Samples above the bound are counted, so
+that a regression of the executor or of the loop period shows up in the diagnostics.
+"""
+
+import numpy as np
+
+
+class LatencyMonitor():
+    """Sliding windows of sensor-to-decision latencies, one per sensor."""
+
+    def __init__(self, bound=0.5, window=1000):
+        """
+        :param bound: latency above which a decision is late, in seconds
+        :param window: number of samples kept per sensor
+        """
+        self.bound = bound
+        self.window = window
+        self._samples = {}  # sensor -> preallocated array of latencies, used as a ring
+        self._counts = {}  # sensor -> number of samples recorded
+        self._late = {}  # sensor -> number of samples above the bound
+
+    def record(self, sensor, capture_time, decision_time):
+        """
+        Records the latency of a decision.
+
+        :param sensor: name of the sensor whose data the decision used
+        :param capture_time: time the data was captured, in seconds, or None if unknown
+        :param decision_time: time of the decision, in seconds
+        :return: latency in seconds, or None if the capture time is unknown
+        """
+        if capture_time is None:
+            return None
+        latency = decision_time - capture_time
+        if sensor not in self._samples:
+            self._samples[sensor] = np.zeros(self.window)
+            self._counts[sensor] = 0
+            self._late[sensor] = 0
+        self._samples[sensor][self._counts[sensor] % self.window] = latency
+        self._counts[sensor] += 1
+        self._late[sensor] += latency > self.bound
+        return latency
+
+    def summary(self, sensor):
+        """
+        Summarizes the latencies of a sensor over its window.
+
+        :param sensor: name of the sensor
+        :return: dict with the count, the late count, and the median, 95th percentile and maximum
+        latencies in seconds, or None if nothing was recorded
+        """
+        if sensor not in self._samples:
+            return None
+        samples = self._samples[sensor][:min(self._counts[sensor], self.window)]
+        p50, p95 = np.percentile(samples, [50, 95])
+        return {'count': self._counts[sensor], 'late': self._late[sensor], 'p50': float(p50),
+                'p95': float(p95), 'max': float(samples.max())}
+
+    def metrics(self):
+        """
+        Gets the summaries of all the sensors as flat metrics.
+
+        :return: dict of metric name to value, such as 'latency_odom_p95'
+        """
+        metrics = {}
+        for sensor in self._samples:
+            for key, value in self.summary(sensor).items():
+                metrics[f'latency_{sensor}_{key}'] = value
+        return metrics
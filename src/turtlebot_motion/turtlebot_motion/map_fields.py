@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Whole-map fields computed once per map version for the discoverer.
+
+Each field is computed with vectorized passes over the grid, so that the per-waypoint checks
+that use it are O(1) lookups.
+"""
+
+import numpy as np
+from scipy import ndimage
+
+from turtlebot_motion.waypoint_scoring import OBSTACLE_THRESHOLD
+from turtlebot_motion.waypoint_scoring import gather_windows, window_bounds
+
+
+# 4-connectivity, so that free space does not leak through walls drawn as diagonal lines
+FOUR_CONNECTIVITY = ndimage.generate_binary_structure(2, 1)
+
+
+def free_space(data, obstacle_threshold=OBSTACLE_THRESHOLD):
+    """
+    Gets the free cells of an occupancy grid.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param obstacle_threshold: occupancy probability above which a cell is an obstacle
+    :return: boolean array, True for the known cells that are not obstacles
+    """
+    return (data >= 0) & (data <= obstacle_threshold)
+
+
+def position_to_cell(position, origin, resolution):
+    """
+    Converts a position in world coordinates to a grid cell.
+
+    :param position: [x, y] position in world coordinates
+    :param origin: [x, y] origin of the map in world coordinates
+    :param resolution: size of one cell in meters
+    :return: (row, column) of the cell
+    """
+    return (int(np.floor((position[1] - origin[1]) / resolution)),
+            int(np.floor((position[0] - origin[0]) / resolution)))
+
+
+def nearest_cell(mask, cell, max_radius=64):
+    """
+    Finds the cell of a mask closest to a given cell, searching in growing windows around it.
+
+    :param mask: boolean array
+    :param cell: (row, column) to search around, may be outside the grid
+    :param max_radius: largest half-size of the window searched, in cells
+    :return: (row, column) of the closest True cell, or None if there is none in the window
+    """
+    height, width = mask.shape
+    row, col = cell
+    radius = 1
+    while radius <= max_radius:
+        r0, r1 = max(row - radius, 0), min(row + radius + 1, height)
+        c0, c1 = max(col - radius, 0), min(col + radius + 1, width)
+        if r0 < r1 and c0 < c1:
+            rows, cols = np.nonzero(mask[r0:r1, c0:c1])
+            if rows.size > 0:
+                closest = np.argmin((rows + r0 - row) ** 2 + (cols + c0 - col) ** 2)
+                return int(rows[closest] + r0), int(cols[closest] + c0)
+        radius *= 2
+    return None
+
+
+def reachable_region(free, seed):
+    """
+    Flood-fills the free space from a seed cell, with a single connected-component labeling pass.
+
+    If the seed is not free (the robot may stand on a cell that is still unknown), the fill starts
+    from the closest free cell.
+
+    :param free: boolean array of the free cells
+    :param seed: (row, column) of the seed, usually the cell of the robot
+    :return: boolean array of the cells connected to the seed, or None if no free cell was found
+    """
+    seed = nearest_cell(free, seed)
+    if seed is None:
+        return None
+    labels, _ = ndimage.label(free, structure=FOUR_CONNECTIVITY)
+    return labels == labels[seed]
+
+
+def geodesic_distance(free, seed, max_radius=64):
+    """
+    Computes the travel distance from a seed cell to every free cell, with a vectorized wavefront.
+
+    The wavefront is a breadth-first search over the free cells, whose whole front is expanded at
+    once with numpy indexing. Steps alternate between the 8-neighbourhood and the 4-neighbourhood,
+    so that the front grows as an octagon and the distance stays within a few percent of the
+    Euclidean length of the path. Diagonal moves never cut a corner: both cells they pass between
+    must be free, so the reached cells are exactly the 4-connected component of the seed.
+
+    If the seed is not free (the robot may stand on a cell that is still unknown), the wavefront
+    starts from the closest free cell.
+
+    :param free: boolean array of the free cells
+    :param seed: (row, column) of the seed, usually the cell of the robot
+    :param max_radius: largest distance searched for a free cell around the seed, in cells
+    :return: float array of distances in cells, inf for the cells that cannot be reached, or None
+    if no free cell was found around the seed
+    """
+    seed = nearest_cell(free, seed, max_radius=max_radius)
+    if seed is None:
+        return None
+
+    # a border of obstacles removes the bounds checks, cells are indexed in the flat padded grid
+    height, width = free.shape
+    padded_width = width + 2
+    passable = np.zeros((height + 2, padded_width), dtype=bool)
+    passable[1:-1, 1:-1] = free
+    # -1 for the free cells not reached yet, -2 for the others, so one lookup checks both
+    steps = np.where(passable, -1, -2).astype(np.int32).ravel()
+    passable = passable.ravel()
+
+    axial = np.array([-padded_width, padded_width, -1, 1])
+    diagonal = np.array([-padded_width - 1, -padded_width + 1, padded_width - 1, padded_width + 1])
+    # the two axial cells each diagonal move passes between
+    diagonal_sides = np.array([[-padded_width, -1], [-padded_width, 1],
+                               [padded_width, -1], [padded_width, 1]])
+    # whether every diagonal move from every cell passes between two free cells, computed once
+    # for the whole grid instead of for every front. The border cells are never in the front
+    uncut = np.zeros((len(diagonal), passable.size), dtype=bool)
+    start, stop = padded_width + 1, passable.size - padded_width - 1
+    for direction, (vertical, horizontal) in enumerate(diagonal_sides):
+        uncut[direction, start:stop] = (passable[start + vertical:stop + vertical]
+                                        & passable[start + horizontal:stop + horizontal])
+
+    # last position each cell was written at in the neighbours, to drop duplicates without sorting
+    owner = np.zeros(passable.shape, dtype=np.int64)
+
+    front = np.array([(seed[0] + 1) * padded_width + seed[1] + 1])
+    steps[front] = 0
+    step = 0
+    while front.size > 0:
+        step += 1
+        neighbours = (front[:, None] + axial[None, :]).ravel()
+        if step % 2 == 1:
+            corners = front[None, :] + diagonal[:, None]
+            neighbours = np.concatenate((neighbours, corners[uncut[:, front]]))
+        neighbours = neighbours[steps[neighbours] == -1]
+        positions = np.arange(neighbours.size)
+        owner[neighbours] = positions
+        front = neighbours[owner[neighbours] == positions]
+        steps[front] = step
+
+    steps = steps.reshape((height + 2, padded_width))[1:-1, 1:-1]
+    return np.where(steps >= 0, steps, np.inf).astype(np.float64)
+
+
+def window_minimum(field, rows, cols, size):
+    """
+    Samples the minimum of a field over the (size x size) window around every cell.
+
+    The windows are those of ndimage.minimum_filter, gathered for the given cells only.
+
+    :param field: 2D float array
+    :param rows: row of every cell
+    :param cols: column of every cell
+    :param size: size of the kernel
+    :return: float array, inf for the cells outside the field
+    """
+    height, width = field.shape
+    inside = (rows >= 0) & (cols >= 0) & (rows < height) & (cols < width)
+    sampled = np.full(inside.shape, np.inf)
+    # the windows are clipped to the field, the cells outside it count as inf
+    rows_lo = np.maximum(rows[inside] - size // 2, 0)
+    cols_lo = np.maximum(cols[inside] - size // 2, 0)
+    rows_hi = np.minimum(rows[inside] - size // 2 + size, height)
+    cols_hi = np.minimum(cols[inside] - size // 2 + size, width)
+    windows = gather_windows(field, rows_lo, rows_hi, cols_lo, cols_hi, size, fill=np.inf)
+    sampled[inside] = windows.min(axis=(1, 2), initial=np.inf)
+    return sampled
+
+
+def windows_touching(mask, rows, cols, size):
+    """
+    Checks, for every cell, whether its (size x size) window contains a True cell of the mask.
+
+    The windows are the ones of convolute; the windows that go out of the map are False.
+
+    :param mask: boolean array
+    :param rows: row of every cell
+    :param cols: column of every cell
+    :param size: size of the kernel
+    :return: boolean array
+    """
+    height, width = mask.shape
+    rows_lo, rows_hi = window_bounds(rows, size)
+    cols_lo, cols_hi = window_bounds(cols, size)
+    inside = (rows_lo >= 0) & (cols_lo >= 0) & (rows_hi <= height) & (cols_hi <= width)
+    touching = np.zeros(inside.shape, dtype=bool)
+    touching[inside] = gather_windows(mask, rows_lo[inside], rows_hi[inside], cols_lo[inside],
+                                      cols_hi[inside], size, fill=False).any(axis=(1, 2))
+    return touching
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Snapshots of the mission state on disk, so that a restarted node resumes the mission.
+
+When a node of the exploration restarts, its visual coverage, its waypoint scores and its
+failed goals used to be lost, and the robot explored again from zero. SnapshotStore saves a set
+of named arrays with a small JSON metadata dict:
+
+- every array is written to its own .npy file through a memory map, under a name that carries
+  the generation of the snapshot, so the previous snapshot is never written over;
+- once all the arrays are on disk, a manifest naming the generation and the arrays is written to
+  a temporary file and renamed over the previous manifest. The rename is atomic, so a crash at
+  any point leaves either the previous snapshot or the new one, never a mix of both;
+- the files of the previous generation are removed last.
+
+Loading reads the manifest and maps the .npy files into memory without reading them, so a node
+restores its state in milliseconds whatever the size of the map; the pages are read when the
+arrays are first used.
+
+Run ``python3 -m turtlebot_motion.mission_snapshot`` to print the save and restore latencies
+against the size of the coverage grid.
+"""
+
+import json
+import os
+import tempfile
+import time
+
+import numpy as np
+
+
+class SnapshotStore():
+    """Atomic snapshots of named arrays and metadata, as memory-mapped .npy files."""
+
+    def __init__(self, directory, name):
+        """
+        :param directory: directory of the snapshots, created if needed
+        :param name: name of the snapshot, the prefix of its files
+        """
+        self.directory = directory
+        self.name = name
+        self.generation = 0  # generation of the last snapshot saved or loaded
+        self.last_save_duration = None  # time spent writing the last snapshot, in seconds
+
+    @property
+    def manifest_path(self):
+        return os.path.join(self.directory, f'{self.name}.json')
+
+    def array_path(self, generation, key):
+        """
+        :param generation: generation of the snapshot
+        :param key: name of the array
+        :return: path of the .npy file of the array
+        """
+        return os.path.join(self.directory, f'{self.name}.{generation}.{key}.npy')
+
+    def save(self, arrays, metadata=None):
+        """
+        Writes a new snapshot, replacing the previous one atomically.
+
+        :param arrays: dict of array name to numpy array, the names must be valid in file names
+        :param metadata: dict that can be serialized to JSON, or None
+        :return: generation of the snapshot
+        """
+        start = time.perf_counter()
+        os.makedirs(self.directory, exist_ok=True)
+        previous = self._read_manifest()
+        generation = max(self.generation, previous['generation'] if previous else 0) + 1
+
+        for key, array in arrays.items():
+            array = np.asarray(array)
+            path = self.array_path(generation, key)
+            mapped = np.lib.format.open_memmap(path + '.tmp', mode='w+', dtype=array.dtype,
+                                               shape=array.shape)
+            mapped[...] = array
+            mapped.flush()
+            del mapped
+            os.replace(path + '.tmp', path)
+
+        manifest = {'generation': generation, 'arrays': sorted(arrays), 'time': time.time(),
+                    'metadata': metadata or {}}
+        descriptor, temporary = tempfile.mkstemp(dir=self.directory, prefix=f'{self.name}.',
+                                                 suffix='.json.tmp')
+        with os.fdopen(descriptor, 'w') as stream:
+            json.dump(manifest, stream)
+            stream.flush()
+            os.fsync(stream.fileno())
+        os.replace(temporary, self.manifest_path)
+
+        if previous is not None:
+            for key in previous['arrays']:
+                try:
+                    os.remove(self.array_path(previous['generation'], key))
+                except FileNotFoundError:
+                    pass
+        self.generation = generation
+        self.last_save_duration = time.perf_counter() - start
+        return generation
+
+    def load(self):
+        """
+        Maps the arrays of the last snapshot into memory.
+
+        The arrays are read-only memory maps; copy them before changing them.
+
+        :return: dict of array name to array and metadata dict, or None if there is no complete
+        snapshot
+        """
+        manifest = self._read_manifest()
+        if manifest is None:
+            return None
+        try:
+            arrays = {key: np.load(self.array_path(manifest['generation'], key), mmap_mode='r')
+                      for key in manifest['arrays']}
+        except (OSError, ValueError):
+            return None
+        self.generation = manifest['generation']
+        return arrays, manifest['metadata']
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path) as stream:
+                return json.load(stream)
+        except (OSError, ValueError):
+            return None
+
+
+def benchmark(map_sizes=(500, 1000, 2000, 4000), repeats=5):
+    """
+    Prints the latency of saving and restoring a coverage grid and waypoint scores.
+
+    :param map_sizes: side of the square coverage grids, in cells
+    :param repeats: number of saves and loads, the best one is reported
+    """
+    rng = np.random.default_rng(0)
+    print(f"{'map (cells)':>12} {'size (MB)':>10} {'save (ms)':>10} {'restore (ms)':>13} "
+          f"{'restore + read (ms)':>20}")
+    with tempfile.TemporaryDirectory() as directory:
+        for side in map_sizes:
+            arrays = {'coverage': rng.integers(0, 2, size=(side, side), dtype=np.uint8),
+                      'waypoints': rng.random((2000, 2)), 'utility': rng.random(2000)}
+            store = SnapshotStore(directory, f'benchmark_{side}')
+            save = restore = read = float('inf')
+            for _ in range(repeats):
+                start = time.perf_counter()
+                store.save(arrays, {'origin': [0.0, 0.0], 'resolution': 0.05})
+                save = min(save, time.perf_counter() - start)
+
+                start = time.perf_counter()
+                loaded, _ = SnapshotStore(directory, f'benchmark_{side}').load()
+                restore = min(restore, time.perf_counter() - start)
+                coverage = np.array(loaded['coverage'])
+                read = min(read, time.perf_counter() - start)
+                assert np.array_equal(coverage, arrays['coverage'])
+            size = sum(array.nbytes for array in arrays.values()) / 1e6
+            print(f'{side:>5} x {side:<4} {size:>10.1f} {save * 1000:>10.2f} '
+                  f'{restore * 1000:>13.2f} {read * 1000:>20.2f}')
+
+
+if __name__ == '__main__':
+    benchmark()
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Timestamped history of the odometry, to get the pose of the robot at any recent time.
+
+A detection or a coverage update is only right if it uses the pose of the robot when the data
+was captured, not the newest pose. OdometryBuffer keeps the last 'capacity' poses (stamp, x, y,
+yaw) in preallocated arrays. Every sample is written twice, at its slot and at its slot plus
+the capacity, so the samples are always a contiguous, sorted window of the arrays: an append
+is two writes, and a lookup is one binary search over the stamps followed by an interpolation
+between the two poses around the time asked for.
+
+Run ``python3 -m turtlebot_motion.odometry_buffer`` to compare the latency with a list trimmed
+with pop(0) and searched linearly.
+"""
+
+import math
+import threading
+import time
+
+import numpy as np
+
+
+def yaw_from_quaternion(q):
+    """
+    Gets the rotation about the z axis of a quaternion.
+
+    :param q: quaternion with x, y, z and w attributes
+    :return: yaw in radians, in [-pi, pi]
+    """
+    return math.atan2(2.0 * (q.w * q.z + q.x * q.y), 1.0 - 2.0 * (q.y * q.y + q.z * q.z))
+
+
+def stamp_to_seconds(stamp):
+    """
+    Converts a builtin_interfaces Time to seconds.
+
+    :param stamp: Time message
+    :return: time in seconds
+    """
+    return stamp.sec + stamp.nanosec * 1e-9
+
+
+class OdometryBuffer():
+    """Ring buffer of timestamped poses, with interpolated lookups by time."""
+
+    def __init__(self, capacity=1000, max_extrapolation=0.1):
+        """
+        :param capacity: number of poses kept
+        :param max_extrapolation: how far after the newest pose a lookup may go, in seconds. The
+        newest pose is returned for those lookups, later ones return None
+        """
+        self.capacity = capacity
+        self.max_extrapolation = max_extrapolation
+        # (stamp, x, y, yaw) of every sample, written at index and index + capacity
+        self._samples = np.zeros((2 * capacity, 4))
+        self._count = 0  # number of samples appended since the start
+        self._lock = threading.Lock()  # the buffer is filled and read from different callbacks
+
+    def __len__(self):
+        return min(self._count, self.capacity)
+
+    def append(self, stamp, x, y, yaw):
+        """
+        Appends a pose, overwriting the oldest one once the buffer is full.
+
+        :param stamp: time of the pose, in seconds
+        :param x: x position in meters
+        :param y: y position in meters
+        :param yaw: heading in radians
+        :return: False if the pose is older than the newest one, and was dropped
+        """
+        with self._lock:
+            if self._count > 0 and stamp < self._newest()[0]:
+                return False
+            slot = self._count % self.capacity
+            self._samples[slot] = self._samples[slot + self.capacity] = (stamp, x, y, yaw)
+            self._count += 1
+            return True
+
+    def append_odometry(self, msg):
+        """
+        Appends the pose of an Odometry message, at the time of its header.
+
+        :param msg: Odometry message
+        :return: False if the pose was dropped, see append
+        """
+        pose = msg.pose.pose
+        return self.append(stamp_to_seconds(msg.header.stamp), pose.position.x, pose.position.y,
+                           yaw_from_quaternion(pose.orientation))
+
+    def latest(self):
+        """
+        Gets the newest pose.
+
+        :return: (stamp, x, y, yaw), or None if the buffer is empty
+        """
+        with self._lock:
+            if self._count == 0:
+                return None
+            return tuple(self._newest().tolist())
+
+    def pose_at(self, stamp):
+        """
+        Gets the pose of the robot at a given time, interpolated between the two closest poses.
+
+        :param stamp: time in seconds
+        :return: (x, y, yaw), or None if the time is before the oldest pose or too far after the
+        newest one
+        """
+        with self._lock:
+            window = self._window()
+            if len(window) == 0:
+                return None
+            stamps = window[:, 0]
+            if stamp > stamps[-1]:
+                if stamp - stamps[-1] > self.max_extrapolation:
+                    return None
+                return tuple(window[-1, 1:].tolist())
+            index = int(np.searchsorted(stamps, stamp))
+            if index == 0:
+                return tuple(window[0, 1:].tolist()) if stamp == stamps[0] else None
+            before, after = window[index - 1].tolist(), window[index].tolist()
+
+        span = after[0] - before[0]
+        fraction = 0.0 if span <= 0.0 else (stamp - before[0]) / span
+        # the heading turns the short way round
+        turn = math.remainder(after[3] - before[3], 2.0 * math.pi)
+        return (before[1] + fraction * (after[1] - before[1]),
+                before[2] + fraction * (after[2] - before[2]),
+                math.remainder(before[3] + fraction * turn, 2.0 * math.pi))
+
+    def _newest(self):
+        return self._samples[(self._count - 1) % self.capacity]
+
+    def _window(self):
+        """
+        :return: view of the samples, oldest first
+        """
+        size = min(self._count, self.capacity)
+        start = (self._count - size) % self.capacity
+        return self._samples[start:start + size]
+
+
+def benchmark(capacities=(10, 100, 1000, 10000), lookups=10000, rate=30.0):
+    """
+    Prints the latency of appends and lookups against a list trimmed with pop(0).
+
+    :param capacities: numbers of poses kept
+    :param lookups: number of appends and of lookups timed
+    :param rate: odometry rate, in Hz
+    """
+    print(f"{'capacity':>9} {'list append (us)':>17} {'append (us)':>12} "
+          f"{'list lookup (us)':>17} {'lookup (us)':>12}")
+    for capacity in capacities:
+        stamps = np.arange(capacity + lookups) / rate
+
+        history = []
+        start = time.perf_counter()
+        for stamp in stamps:
+            history.append((stamp, 0.0, 0.0, 0.0))
+            if len(history) > capacity:
+                history.pop(0)
+        list_append = (time.perf_counter() - start) / len(stamps)
+
+        buffer = OdometryBuffer(capacity)
+        start = time.perf_counter()
+        for stamp in stamps:
+            buffer.append(stamp, 0.0, 0.0, 0.0)
+        append = (time.perf_counter() - start) / len(stamps)
+
+        queries = np.random.default_rng(0).uniform(stamps[-capacity], stamps[-1], size=lookups)
+        start = time.perf_counter()
+        for query in queries:
+            next(sample for sample in history if sample[0] >= query)
+        list_lookup = (time.perf_counter() - start) / lookups
+
+        start = time.perf_counter()
+        for query in queries:
+            buffer.pose_at(query)
+        lookup = (time.perf_counter() - start) / lookups
+
+        print(f'{capacity:>9} {list_append * 1e6:>17.2f} {append * 1e6:>12.2f} '
+              f'{list_lookup * 1e6:>17.2f} {lookup * 1e6:>12.2f}')
+
+
+if __name__ == '__main__':
+    benchmark()
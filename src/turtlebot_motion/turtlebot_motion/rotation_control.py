@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Closed-loop rotation of the robot in place, driven by the odometry heading.
+
+The ball scan of the discoverer used to turn for a computed time at a fixed speed, busy-waiting
+on the clock, and to wait a fixed second at each of its stops. The angle actually turned then
+depends on how fast the robot accelerates and coasts, and the error of every stop adds up over
+the scan. RotationController turns to a target heading instead: the speed falls with the
+remaining angle, so that the robot can stop within 'deceleration' at every point, and the stop
+is over as soon as the yaw rate measured by the odometry drops below 'settle_rate'.
+
+The controller only computes commands, the loop that reads the odometry and publishes the
+commands is in the discoverer. Run ``python3 -m turtlebot_motion.rotation_control`` to compare
+the time and the heading error of a 360 degrees scan with the timed rotation, on a simulated
+robot with a first-order velocity response.
+"""
+
+import math
+
+import numpy as np
+
+
+def angle_difference(target, angle):
+    """
+    Gets the signed angle from an angle to a target, the short way round.
+
+    :param target: angle in radians
+    :param angle: angle in radians
+    :return: angle in [-pi, pi]
+    """
+    return math.remainder(target - angle, 2.0 * math.pi)
+
+
+class RotationController():
+    """Speed profile of an in-place rotation to a target heading."""
+
+    def __init__(self, max_speed=2.0, min_speed=0.15, deceleration=3.0, gain=3.0,
+                 tolerance=math.radians(1.5), coast_time=0.1, settle_rate=0.05,
+                 max_settle_time=1.0, period=0.02):
+        """
+        :param max_speed: largest angular speed, in rad/s
+        :param min_speed: smallest angular speed while turning, so that friction does not stall
+        the robot before the target, in rad/s
+        :param deceleration: angular deceleration the speed profile allows, in rad/s^2
+        :param gain: speed per radian of remaining angle close to the target, in 1/s
+        :param tolerance: remaining angle below which the target is reached, in radians
+        :param coast_time: time the robot keeps turning at its current rate once stopped, so that
+        the target is reached when the robot will coast to it, in seconds
+        :param settle_rate: yaw rate below which the robot has stopped, in rad/s
+        :param max_settle_time: longest wait for the robot to stop, in seconds
+        :param period: time between two commands, in seconds
+        """
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.deceleration = deceleration
+        self.gain = gain
+        self.tolerance = tolerance
+        self.coast_time = coast_time
+        self.settle_rate = settle_rate
+        self.max_settle_time = max_settle_time
+        self.period = period
+
+    def command(self, error, yaw_rate=0.0):
+        """
+        Computes the angular speed for a remaining angle.
+
+        :param error: signed remaining angle to the target, in radians
+        :param yaw_rate: yaw rate measured by the odometry, in rad/s
+        :return: angular speed in rad/s, 0 once the target is reached
+        """
+        if self.reached(error, yaw_rate):
+            return 0.0
+        remaining = abs(error)
+        speed = min(self.max_speed, self.gain * remaining,
+                    math.sqrt(2.0 * self.deceleration * remaining))
+        return math.copysign(max(speed, self.min_speed), error)
+
+    def reached(self, error, yaw_rate=0.0):
+        """
+        :param error: signed remaining angle to the target, in radians
+        :param yaw_rate: yaw rate measured by the odometry, in rad/s
+        :return: True if the robot will stop within the tolerance of the target
+        """
+        return abs(error - yaw_rate * self.coast_time) < self.tolerance
+
+    def settled(self, yaw_rate):
+        """
+        :param yaw_rate: yaw rate measured by the odometry, in rad/s
+        :return: True if the robot has stopped turning
+        """
+        return abs(yaw_rate) < self.settle_rate
+
+    def timeout(self, angle):
+        """
+        Gets the time after which a rotation is abandoned, for instance if the robot is stuck.
+
+        :param angle: angle to turn, in radians
+        :return: time in seconds, three times the time of the speed profile
+        """
+        return 3.0 * (abs(angle) / self.max_speed + self.max_speed / self.deceleration) + 1.0
+
+
+class SimulatedRobot():
+    """Yaw of a robot whose angular speed follows the command with a first-order lag."""
+
+    def __init__(self, time_constant=0.15, slip=0.9, noise=0.002, seed=0):
+        """
+        :param time_constant: time constant of the velocity response, in seconds
+        :param slip: fraction of the commanded speed the robot reaches
+        :param noise: standard deviation of the odometry heading, in radians
+        :param seed: seed of the random generator
+        """
+        self.time_constant = time_constant
+        self.slip = slip
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.yaw = 0.0  # unwrapped
+        self.yaw_rate = 0.0
+        self.time = 0.0
+
+    def step(self, command, duration, dt=0.001):
+        """
+        Integrates the motion under a constant command.
+
+        :param command: commanded angular speed, in rad/s
+        :param duration: time to integrate, in seconds
+        :param dt: integration step, in seconds
+        """
+        for _ in range(max(int(round(duration / dt)), 1)):
+            self.yaw_rate += (self.slip * command - self.yaw_rate) * dt / self.time_constant
+            self.yaw += self.yaw_rate * dt
+        self.time += duration
+
+    def odometry(self):
+        """
+        :return: measured heading in [-pi, pi] and yaw rate
+        """
+        yaw = math.remainder(self.yaw + self.rng.normal(0.0, self.noise), 2.0 * math.pi)
+        return yaw, self.yaw_rate
+
+
+def timed_scan(robot, steps=6, speed=2.0, stop_time=1.0):
+    """
+    Scans a full turn by turning for a computed time at every step, as spin_detect_ball did.
+
+    :param robot: SimulatedRobot
+    :param steps: number of stops of the scan
+    :param speed: angular speed, in rad/s
+    :param stop_time: wait at every stop, in seconds
+    :return: list of the headings turned at every stop, in radians
+    """
+    headings = []
+    for _ in range(steps):
+        robot.step(speed, 2.0 * math.pi / steps / speed)
+        robot.step(0.0, stop_time)
+        headings.append(robot.yaw)
+    return headings
+
+
+def closed_loop_scan(robot, controller, steps=6):
+    """
+    Scans a full turn by turning to every target heading with the controller.
+
+    :param robot: SimulatedRobot
+    :param controller: RotationController
+    :param steps: number of stops of the scan
+    :return: list of the headings turned at every stop, in radians
+    """
+    start, _ = robot.odometry()
+    headings = []
+    for step in range(1, steps + 1):
+        target = start + step * 2.0 * math.pi / steps
+        while True:
+            yaw, yaw_rate = robot.odometry()
+            error = angle_difference(target, yaw)
+            if controller.reached(error, yaw_rate):
+                break
+            robot.step(controller.command(error, yaw_rate), controller.period)
+        settle_start = robot.time
+        robot.step(0.0, controller.period)
+        while (not controller.settled(robot.odometry()[1])
+               and robot.time - settle_start < controller.max_settle_time):
+            robot.step(0.0, controller.period)
+        headings.append(robot.yaw)
+    return headings
+
+
+def benchmark(slips=(1.0, 0.9, 0.8), steps=6, trials=20):
+    """
+    Prints the time and the heading error of a 360 degrees scan, timed against closed-loop.
+
+    :param slips: fractions of the commanded speed the simulated robot reaches
+    :param steps: number of stops of the scan
+    :param trials: number of scans with different odometry noise
+    """
+    print(f"{'slip':>5} {'timed (s)':>10} {'error (deg)':>12} {'worst stop':>11} "
+          f"{'closed-loop (s)':>16} {'error (deg)':>12} {'worst stop':>11}")
+    for slip in slips:
+        rows = []
+        for scan in (timed_scan, closed_loop_scan):
+            durations, errors, worst = [], [], []
+            for trial in range(trials):
+                robot = SimulatedRobot(slip=slip, seed=trial)
+                if scan is timed_scan:
+                    headings = scan(robot, steps=steps)
+                else:
+                    headings = scan(robot, RotationController(), steps=steps)
+                targets = np.arange(1, steps + 1) * 2.0 * math.pi / steps
+                stop_errors = np.degrees(np.abs(np.array(headings) - targets))
+                durations.append(robot.time)
+                errors.append(stop_errors[-1])
+                worst.append(stop_errors.max())
+            rows.append((np.mean(durations), np.mean(errors), np.mean(worst)))
+        (timed_time, timed_error, timed_worst), (loop_time, loop_error, loop_worst) = rows
+        print(f'{slip:>5.2f} {timed_time:>10.2f} {timed_error:>12.2f} {timed_worst:>11.2f} '
+              f'{loop_time:>16.2f} {loop_error:>12.2f} {loop_worst:>11.2f}')
+
+
+if __name__ == '__main__':
+    benchmark()
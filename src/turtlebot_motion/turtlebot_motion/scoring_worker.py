@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Background waypoint scoring for the discoverer.
+
+Scoring a map takes much longer than the other work of the discoverer, so it runs on a dedicated
+thread. The map callback only hands the decoded grid over to the worker and returns. Maps are
+coalesced: if a new map arrives while the worker is busy, it replaces the one that was waiting,
+so only the newest map is ever scored.
+
+The worker publishes every result as an immutable ScoringResult, swapped in atomically under a
+lock. The navigation loop takes the newest result whenever it needs one, without ever waiting for
+the scoring to finish.
+
+A map whose scoring raises does not stop the worker: the error is kept for the consumer to
+report with take_error, and the next map is scored from scratch, since the incremental state may
+have been left half updated.
+
+The waypoints are sampled again for every map, around the frontiers, by the generate_waypoints
+function. The ones that were already there keep their score and their index is mapped to the
+new one, so that the consumer can carry its own state over.
+
+Once per map, the waypoints that are not in the free-space component of the robot are dropped,
+so that no goal is sent into an enclosed pocket Nav2 cannot reach.
+
+With a travel weight, the worker also computes a geodesic distance field from the robot cell once
+per map, and ranks the waypoints by their utility, their score minus the travel weight times
+their travel distance, so that a slightly better goal across the map does not win over a good
+one next to the robot. The travel distance follows the free space around the walls, unlike the
+straight-line distance.
+
+With a view gain scorer, the utility also rewards the fraction of the camera view of a waypoint
+that is still unseen, weighted by the gain weight, so that the robot stops where it will see
+the most new cells.
+
+With a MapPyramid, the worker keeps it up to date with the regions that changed in every map,
+and the work that used to cover the whole grid runs on its blocks instead: the candidates are
+sampled only in the blocks around the frontiers, and the wavefront from the robot runs over the
+blocks whose cells are all free. The travel distance of a waypoint is then the one to the closest
+reached block around its own, so the work of a map follows the frontiers and the blocks, not the
+area of the grid at full resolution.
+"""
+
+from collections import namedtuple
+import threading
+import time
+import traceback
+
+import numpy as np
+
+from turtlebot_motion.map_fields import free_space, geodesic_distance, position_to_cell
+from turtlebot_motion.map_fields import reachable_region, window_minimum, windows_touching
+
+
+ScoringJob = namedtuple('ScoringJob', [
+    'map_version', 'data', 'coverage_map', 'resolution', 'origin', 'robot_position', 'stamp'])
+
+# version: version of the result, increasing
+# map_version: version of the map the result was computed from
+# waypoints, valid, accessible, scores: waypoints and their scores, see score_waypoints
+# reachable: boolean array, True for the waypoints in the free-space component of the robot
+# travel: travel distance from the robot to every waypoint in meters, inf if it cannot be reached
+# gain: fraction of the camera view of every waypoint that is unseen, 0 without view gain scorer
+# utility: score plus gain weight times gain minus travel weight times travel distance, inf if the
+# waypoint is not accessible
+# changed: indices of the waypoints rescored since the last result taken by the consumer
+# previous_indices: index of every waypoint in the last result taken by the consumer, -1 for the
+# new ones, or None if the waypoints did not change
+# full_rescore: whether every waypoint was rescored since the last result taken by the consumer
+# travel_updated: whether the travel distances were recomputed, which changes every utility
+# origin, resolution, shape: metadata of the map
+# stamp: capture time of the map in seconds, None if unknown
+# duration: time spent scoring the map, in seconds
+# coalesced: number of maps dropped since the last result because a newer one arrived
+ScoringResult = namedtuple('ScoringResult', [
+    'version', 'map_version', 'waypoints', 'valid', 'accessible', 'scores', 'reachable', 'travel',
+    'gain', 'utility', 'changed', 'previous_indices', 'full_rescore', 'travel_updated', 'origin',
+    'resolution', 'shape', 'stamp', 'duration', 'coalesced'])
+
+
+class ScoringWorker():
+    """Scores the newest map on a background thread with an IncrementalScorer."""
+
+    def __init__(self, scorer, generate_waypoints, reachability=True, travel_weight=0.0,
+                 view_gain=None, gain_weight=0.0, pyramid=None, pyramid_level=1):
+        """
+        :param scorer: IncrementalScorer used to score the maps
+        :param generate_waypoints: function of (data, coverage, resolution, clearance, pyramid)
+        returning the waypoints, called for every map with the grids and the clearance of the
+        scorer, and the pyramid of the worker
+        :param reachability: whether to drop the waypoints the robot cannot reach
+        :param travel_weight: score a waypoint must gain per meter of travel to be worth it, 0 to
+        rank the waypoints by score only
+        :param view_gain: ViewGainScorer used to score the camera view of the waypoints, or None
+        :param gain_weight: score of a waypoint whose whole view is unseen
+        :param pyramid: MapPyramid updated with every map, or None to work at full resolution
+        :param pyramid_level: level of the pyramid the wavefront from the robot runs at
+        """
+        self.scorer = scorer
+        self.generate_waypoints = generate_waypoints
+        self.reachability = reachability
+        self.travel_weight = travel_weight
+        self.view_gain = view_gain
+        self.gain_weight = gain_weight
+        self.pyramid = pyramid
+        self.pyramid_level = pyramid_level
+
+        self._condition = threading.Condition()
+        self._pending = None  # newest map not scored yet, older ones are overwritten
+        self._result = None  # newest result
+        self._taken = True  # whether the newest result has been taken by the consumer
+        self._coalesced = 0
+        self._map_version = 0
+        self._version = 0
+        self._stopped = False
+        self._error = None  # (map version, traceback) of the newest scoring error not taken yet
+        self.failures = 0  # number of maps whose scoring raised
+        self._waypoints = np.zeros((0, 2))
+        self._reachable = np.zeros(0, dtype=bool)
+
+        self._thread = threading.Thread(target=self._run, name='scoring_worker', daemon=True)
+        self._thread.start()
+
+    def submit(self, data, coverage_map, resolution, origin, robot_position=None, stamp=None):
+        """
+        Hands a new map over to the worker, replacing the map waiting to be scored if any.
+
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param coverage_map: visual coverage map (0 = unseen, 1 = seen), or None
+        :param resolution: size of one cell in meters
+        :param origin: [x, y] origin of the map in world coordinates
+        :param robot_position: [x, y] position of the robot in world coordinates, None if unknown
+        :param stamp: capture time of the map in seconds, carried over to the result
+        :return: version of the submitted map
+        """
+        with self._condition:
+            self._map_version += 1
+            if self._pending is not None:
+                self._coalesced += 1
+            self._pending = ScoringJob(self._map_version, data, coverage_map, resolution, origin,
+                                       robot_position, stamp)
+            self._condition.notify()
+            return self._map_version
+
+    def latest(self):
+        """
+        Gets the newest result, without marking it as taken.
+
+        :return: newest ScoringResult, or None if no map has been scored yet
+        """
+        return self._result
+
+    def take(self):
+        """
+        Takes the newest result if it has not been taken yet.
+
+        Results that were never taken are merged into the newest one, so that its 'changed'
+        indices and 'full_rescore' flag cover every update since the last result taken.
+
+        :return: ScoringResult, or None if there is no new result
+        """
+        with self._condition:
+            if self._taken:
+                return None
+            self._taken = True
+            return self._result
+
+    def take_error(self):
+        """
+        Takes the newest scoring error if it has not been taken yet.
+
+        :return: (map version, formatted traceback) of the newest map whose scoring raised, or
+        None if there is no new error
+        """
+        with self._condition:
+            error, self._error = self._error, None
+            return error
+
+    def stop(self, timeout=1.0):
+        """
+        Stops the worker thread.
+
+        :param timeout: time to wait for the thread to finish, in seconds
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while self._pending is None and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                job = self._pending
+                self._pending = None
+                coalesced = self._coalesced
+                self._coalesced = 0
+
+            start = time.perf_counter()
+            try:
+                result = self._score(job, coalesced)
+            except Exception:
+                # the next map is scored from scratch, whatever state the failure left behind
+                self.scorer.data = None
+                with self._condition:
+                    self.failures += 1
+                    self._error = (job.map_version, traceback.format_exc())
+                continue
+            result = result._replace(duration=time.perf_counter() - start)
+
+            with self._condition:
+                if not self._taken:
+                    result = self._merge(self._result, result)
+                self._result = result
+                self._taken = False
+
+    def _score(self, job, coalesced):
+        # the waypoints are sampled from the updated grids, then only the new ones and the ones a
+        # change reaches are rescored
+        self.scorer.update_fields(job.data, job.coverage_map, job.resolution)
+        if self.pyramid is not None:
+            self.pyramid.update(self.scorer.data, self.scorer.coverage,
+                                None if self.scorer.fields_reset else self.scorer.dirty_boxes)
+        waypoints = self.generate_waypoints(self.scorer.data, self.scorer.coverage, job.resolution,
+                                            self.scorer.clearance, self.pyramid)
+        valid, accessible, scores = self.scorer.update_scores(waypoints)
+        self._waypoints = self.scorer.waypoints
+        changed = self.scorer.rescored_indices
+        previous_indices = self.scorer.previous_indices
+
+        gain = np.zeros(len(self._waypoints))
+        if self.view_gain is not None:
+            # the views reaching a changed region are recast, every view after a full rescore
+            dirty_boxes = None if self.scorer.full_rescore else self.scorer.dirty_boxes
+            gains = self.view_gain.update(job.data, self.scorer.coverage, self.scorer.rows,
+                                          self.scorer.cols, job.resolution, dirty_boxes,
+                                          previous_indices)
+            gain = gains / self.view_gain.max_gain
+            if not self.scorer.full_rescore:
+                changed = np.union1d(changed, self.view_gain.recast_indices)
+
+        # the waypoints whose reachability flipped must be updated too
+        reachable, travel = self._reachable_waypoints(job)
+        if not self.scorer.full_rescore:
+            before = reachable.copy()
+            if previous_indices is None:
+                before[:] = self._reachable
+            else:
+                kept = previous_indices >= 0
+                before[kept] = self._reachable[previous_indices[kept]]
+            changed = np.union1d(changed, np.flatnonzero(reachable != before))
+        self._reachable = reachable
+
+        accessible = accessible & reachable
+        scores = np.where(reachable, scores, np.inf)
+        utility = np.full(len(scores), np.inf)
+        utility[accessible] = (scores[accessible] + self.gain_weight * gain[accessible]
+                               - self.travel_weight * travel[accessible])
+
+        self._version += 1
+        # the scorer updates its arrays in place, the result gets its own copies
+        return ScoringResult(
+            version=self._version, map_version=job.map_version, waypoints=self._waypoints,
+            valid=valid.copy(), accessible=accessible, scores=scores, reachable=reachable,
+            travel=travel, gain=gain, utility=utility, changed=changed,
+            previous_indices=previous_indices,
+            full_rescore=self.scorer.full_rescore, travel_updated=self.travel_weight > 0.0,
+            origin=job.origin, resolution=job.resolution, shape=job.data.shape, stamp=job.stamp,
+            duration=0.0,
+            coalesced=coalesced)
+
+    def _reachable_waypoints(self, job):
+        reachable = np.ones(len(self._waypoints), dtype=bool)
+        travel = np.zeros(len(self._waypoints))
+        if job.robot_position is None or (not self.reachability and self.travel_weight <= 0.0):
+            return reachable, travel
+
+        seed = position_to_cell(job.robot_position, job.origin, job.resolution)
+        rows, cols, size = self.scorer.rows, self.scorer.cols, self.scorer.size
+        if self.pyramid is not None:
+            # the wavefront runs over the blocks the robot can drive through, and a waypoint
+            # reaches the closest reached block of the 3 x 3 blocks around its own
+            level = self.pyramid_level
+            block_size = self.pyramid.block_size(level)
+            distance = geodesic_distance(self.pyramid.all('free', level),
+                                         (seed[0] // block_size, seed[1] // block_size))
+            if distance is None:
+                return reachable, travel
+            block_rows, block_cols = self.pyramid.blocks(rows, cols, level)
+            travel = window_minimum(distance, block_rows, block_cols, 3)
+            travel *= block_size * job.resolution
+            region = np.isfinite(travel)
+            if self.reachability:
+                reachable = region
+            else:
+                travel[~region] = travel[region].max(initial=0.0)
+            return reachable, travel
+
+        if self.travel_weight > 0.0:
+            # one wavefront gives both the travel distances and the free-space component
+            distance = geodesic_distance(free_space(job.data), seed)
+            if distance is None:
+                return reachable, travel
+            region = np.isfinite(distance)
+            # the travel distance to a waypoint is the one to the closest free cell of its window
+            travel = window_minimum(distance, rows, cols, size) * job.resolution
+        else:
+            region = reachable_region(free_space(job.data), seed)
+            if region is None:
+                return reachable, travel
+
+        if self.reachability:
+            # a waypoint is reachable if its window touches the free-space component of the robot
+            reachable = windows_touching(region, rows, cols, size)
+        else:
+            # the waypoints the wavefront did not reach are kept, ranked as the farthest ones
+            finite = np.isfinite(travel)
+            travel[~finite] = travel[finite].max(initial=0.0)
+        return reachable, travel
+
+    @staticmethod
+    def _merge(previous, result):
+        coalesced = previous.coalesced + result.coalesced
+        result = result._replace(travel_updated=previous.travel_updated or result.travel_updated)
+        if result.full_rescore or previous.full_rescore:
+            return result._replace(full_rescore=True, previous_indices=None, coalesced=coalesced)
+
+        previous_changed = previous.changed
+        previous_indices = previous.previous_indices
+        if result.previous_indices is not None:
+            # the changes of the previous result are moved to the indices of the new one, and both
+            # mappings are chained back to the last result taken
+            previous_changed = np.flatnonzero(np.isin(result.previous_indices, previous.changed))
+            previous_indices = result.previous_indices
+            if previous.previous_indices is not None:
+                kept = previous_indices >= 0
+                previous_indices = np.full(len(previous_indices), -1, dtype=np.int64)
+                previous_indices[kept] = previous.previous_indices[result.previous_indices[kept]]
+        return result._replace(changed=np.union1d(previous_changed, result.changed),
+                               previous_indices=previous_indices, coalesced=coalesced)
@@ -27,18 +27,17 @@ from nav_msgs.msg import Odometry
 
 import rclpy
 from rclpy.action import ActionClient
+from rclpy.callback_groups import MutuallyExclusiveCallbackGroup
+from rclpy.executors import MultiThreadedExecutor
 from rclpy.node import Node
 from rclpy.qos import QoSDurabilityPolicy, QoSHistoryPolicy, QoSReliabilityPolicy
 from rclpy.qos import QoSProfile
 
 from enum import Enum
 
-import numpy as np
-
-import math
-
-OCC_THRESHOLD = 10
-MIN_FRONTIER_SIZE = 5
+from turtlebot_motion.frontier_ranking import rank_frontiers
+from turtlebot_motion.frontier_search import OccupancyGrid2d, getFrontier
+from turtlebot_motion.frontier_tracker import FrontierTracker
 
 class Costmap2d():
     class CostValues(Enum):
@@ -65,190 +64,13 @@ class Costmap2d():
     def __getIndex(self, mx, my):
         return my * self.map.metadata.size_x + mx
 
-class OccupancyGrid2d():
-    class CostValues(Enum):
-        FreeSpace = 0
-        InscribedInflated = 100
-        LethalObstacle = 100
-        NoInformation = -1
-
-    def __init__(self, map):
-        self.map = map
-
-    def getCost(self, mx, my):
-        return self.map.data[self.__getIndex(mx, my)]
-
-    def getSize(self):
-        return (self.map.info.width, self.map.info.height)
-
-    def getSizeX(self):
-        return self.map.info.width
-
-    def getSizeY(self):
-        return self.map.info.height
-
-    def mapToWorld(self, mx, my):
-        wx = self.map.info.origin.position.x + (mx + 0.5) * self.map.info.resolution
-        wy = self.map.info.origin.position.y + (my + 0.5) * self.map.info.resolution
-
-        return (wx, wy)
-
-    def worldToMap(self, wx, wy):
-        if (wx < self.map.info.origin.position.x or wy < self.map.info.origin.position.y):
-            raise Exception("World coordinates out of bounds")
-
-        mx = int((wx - self.map.info.origin.position.x) / self.map.info.resolution)
-        my = int((wy - self.map.info.origin.position.y) / self.map.info.resolution)
-        
-        if  (my > self.map.info.height or mx > self.map.info.width):
-            raise Exception("Out of bounds")
-
-        return (mx, my)
-
-    def __getIndex(self, mx, my):
-        return my * self.map.info.width + mx
-
-class FrontierCache():
-    cache = {}
-
-    def getPoint(self, x, y):
-        idx = self.__cantorHash(x, y)
-
-        if idx in self.cache:
-            return self.cache[idx]
-
-        self.cache[idx] = FrontierPoint(x, y)
-        return self.cache[idx]
-
-    def __cantorHash(self, x, y):
-        return (((x + y) * (x + y + 1)) / 2) + y
-
-    def clear(self):
-        self.cache = {}
-
-class FrontierPoint():
-    def __init__(self, x, y):
-        self.classification = 0
-        self.mapX = x
-        self.mapY = y
-
-def centroid(arr):
-    arr = np.array(arr)
-    length = arr.shape[0]
-    sum_x = np.sum(arr[:, 0])
-    sum_y = np.sum(arr[:, 1])
-    return sum_x/length, sum_y/length
-
-def findFree(mx, my, costmap):
-    fCache = FrontierCache()
-
-    bfs = [fCache.getPoint(mx, my)]
-
-    while len(bfs) > 0:
-        loc = bfs.pop(0)
-
-        if costmap.getCost(loc.mapX, loc.mapY) == OccupancyGrid2d.CostValues.FreeSpace.value:
-            return (loc.mapX, loc.mapY)
-
-        for n in getNeighbors(loc, costmap, fCache):
-            if n.classification & PointClassification.MapClosed.value == 0:
-                n.classification = n.classification | PointClassification.MapClosed.value
-                bfs.append(n)
-
-    return (mx, my)
-
-def getFrontier(pose, costmap, logger):
-    fCache = FrontierCache()
-
-    fCache.clear()
-
-    mx, my = costmap.worldToMap(pose.position.x, pose.position.y)
-
-    freePoint = findFree(mx, my, costmap)
-    start = fCache.getPoint(freePoint[0], freePoint[1])
-    start.classification = PointClassification.MapOpen.value
-    mapPointQueue = [start]
-
-    frontiers = []
-
-    while len(mapPointQueue) > 0:
-        p = mapPointQueue.pop(0)
-
-        if p.classification & PointClassification.MapClosed.value != 0:
-            continue
-
-        if isFrontierPoint(p, costmap, fCache):
-            p.classification = p.classification | PointClassification.FrontierOpen.value
-            frontierQueue = [p]
-            newFrontier = []
 
-            while len(frontierQueue) > 0:
-                q = frontierQueue.pop(0)
+class ExplorerState(Enum):
+    Waiting = 0  # the maps are tracked, exploration has not started
+    Idle = 1  # no goal, a goal is planned on the next map
+    SendingGoal = 2  # a goal was sent, waiting for the action server to accept it
+    Navigating = 3  # the goal was accepted, waiting for its result
 
-                if q.classification & (PointClassification.MapClosed.value | PointClassification.FrontierClosed.value) != 0:
-                    continue
-
-                if isFrontierPoint(q, costmap, fCache):
-                    newFrontier.append(q)
-
-                    for w in getNeighbors(q, costmap, fCache):
-                        if w.classification & (PointClassification.FrontierOpen.value | PointClassification.FrontierClosed.value | PointClassification.MapClosed.value) == 0:
-                            w.classification = w.classification | PointClassification.FrontierOpen.value
-                            frontierQueue.append(w)
-
-                q.classification = q.classification | PointClassification.FrontierClosed.value
-
-            
-            newFrontierCords = []
-            for x in newFrontier:
-                x.classification = x.classification | PointClassification.MapClosed.value
-                newFrontierCords.append(costmap.mapToWorld(x.mapX, x.mapY))
-
-            if len(newFrontier) > MIN_FRONTIER_SIZE:
-                frontiers.append(centroid(newFrontierCords))
-
-        for v in getNeighbors(p, costmap, fCache):
-            if v.classification & (PointClassification.MapOpen.value | PointClassification.MapClosed.value) == 0:
-                if any(costmap.getCost(x.mapX, x.mapY) == OccupancyGrid2d.CostValues.FreeSpace.value for x in getNeighbors(v, costmap, fCache)):
-                    v.classification = v.classification | PointClassification.MapOpen.value
-                    mapPointQueue.append(v)
-
-        p.classification = p.classification | PointClassification.MapClosed.value
-
-    return frontiers
-        
-
-def getNeighbors(point, costmap, fCache):
-    neighbors = []
-
-    for x in range(point.mapX - 1, point.mapX + 2):
-        for y in range(point.mapY - 1, point.mapY + 2):
-            if (x > 0 and x < costmap.getSizeX() and y > 0 and y < costmap.getSizeY()):
-                neighbors.append(fCache.getPoint(x, y))
-
-    return neighbors
-
-def isFrontierPoint(point, costmap, fCache):
-    if costmap.getCost(point.mapX, point.mapY) != OccupancyGrid2d.CostValues.NoInformation.value:
-        return False
-
-    hasFree = False
-    for n in getNeighbors(point, costmap, fCache):
-        cost = costmap.getCost(n.mapX, n.mapY)
-
-        if cost > OCC_THRESHOLD:
-            return False
-
-        if cost == OccupancyGrid2d.CostValues.FreeSpace.value:
-            hasFree = True
-
-    return hasFree
-
-class PointClassification(Enum):
-    MapOpen = 1
-    MapClosed = 2
-    FrontierOpen = 4
-    FrontierClosed = 8
 
 class WaypointFollowerTest(Node):
 
@@ -258,7 +80,11 @@ class WaypointFollowerTest(Node):
         self.readyToMove = True
         self.currentPose = None
         self.lastWaypoint = None
-        self.action_client = ActionClient(self, FollowWaypoints, 'FollowWaypoints')
+        # Exploration is a state machine driven by the map and action callbacks, which share a callback group so
+        # that they never run at the same time. The odometry callback is in the default group and keeps running.
+        self.explorationGroup = MutuallyExclusiveCallbackGroup()
+        self.action_client = ActionClient(self, FollowWaypoints, 'FollowWaypoints',
+                                          callback_group=self.explorationGroup)
         self.initial_pose_pub = self.create_publisher(PoseWithCovarianceStamped,
                                                       'initialpose', 10)
 
@@ -278,28 +104,96 @@ class WaypointFollowerTest(Node):
                                                        '/odom', self.poseCallback, pose_qos)
 
         # self.costmapSub = self.create_subscription(Costmap(), '/global_costmap/costmap_raw', self.costmapCallback, pose_qos)
-        self.costmapSub = self.create_subscription(OccupancyGrid(), '/map', self.occupancyGridCallback, pose_qos)
+        self.costmapSub = self.create_subscription(OccupancyGrid(), '/map', self.occupancyGridCallback, pose_qos,
+                                                   callback_group=self.explorationGroup)
         self.costmap = None
+        # frontier clusters kept up to date with every map, instead of extracted for every goal
+        self.frontierTracker = FrontierTracker()
+
+        # the goal is replaced when the map shows a frontier whose utility is replanMargin times the one of the goal
+        self.declare_parameter('replan_margin', 1.5)
+        self.replanMargin = self.get_parameter('replan_margin').get_parameter_value().double_value
+        self.state = ExplorerState.Waiting
+        self.mapVersion = 0
+        self.goalFrontier = None  # id of the frontier cluster of the current goal
+        # ids of the frontier clusters Nav2 failed to reach, left out of the ranking until their cells change
+        self.failedFrontiers = set()
+        self.frontiersExhausted = False
 
         self.get_logger().info('Running Waypoint Test')
 
     def occupancyGridCallback(self, msg):
         self.costmap = OccupancyGrid2d(msg)
+        update = self.frontierTracker.update(self.costmap.grid.data,
+                                             (msg.info.origin.position.x, msg.info.origin.position.y),
+                                             msg.info.resolution)
+        if update.added or update.removed or update.changed:
+            self.get_logger().debug(f'Frontiers added {update.added}, removed {update.removed}, '
+                                    f'changed {update.changed}, {update.relabelled} cells relabelled')
+        self.mapVersion += 1
+        # a failed frontier is tried again once the map around it changed
+        self.failedFrontiers.difference_update(update.removed, update.changed)
+
+        # every new map version is planned on at once, whatever the robot is doing
+        if self.state == ExplorerState.Idle:
+            self.moveToFrontiers()
+        elif self.state == ExplorerState.Navigating:
+            self.replanFrontier()
+
+    def startExploration(self):
+        self.state = ExplorerState.Idle
+        if self.costmap is not None:
+            self.moveToFrontiers()
+
+    def rankFrontiers(self):
+        if self.costmap is None or self.currentPose is None:
+            return []
+        try:
+            mx, my = self.costmap.worldToMap(self.currentPose.position.x, self.currentPose.position.y)
+        except Exception as e:
+            self.warn_msg('Robot outside of the map %r' % (e,))
+            return []
+        # the reachable frontiers by expected gain over travel cost, rather than the farthest one
+        frontiers = {key: frontier for key, frontier in self.frontierTracker.frontiers().items()
+                     if key not in self.failedFrontiers}
+        return rank_frontiers(self.costmap.grid.data, self.frontierTracker.labels, frontiers, (my, mx),
+                              self.costmap.map.info.resolution)
 
     def moveToFrontiers(self):
-        frontiers = getFrontier(self.currentPose, self.costmap, self.get_logger())
+        # a goal sent before the action server is up never gets a response, the next map tries again
+        if not self.action_client.server_is_ready():
+            self.get_logger().info("'FollowWaypoints' action server not available, waiting...",
+                                   throttle_duration_sec=10.0)
+            return
+
+        ranking = self.rankFrontiers()
 
-        if len(frontiers) == 0:
-            self.info_msg('No More Frontiers')
+        if len(ranking) == 0:
+            if not self.frontiersExhausted:
+                self.info_msg('No More Frontiers')
+            self.frontiersExhausted = True
             return
 
-        location = None
-        largestDist = 0
-        for f in frontiers:
-            dist = math.sqrt(((f[0] - self.currentPose.position.x)**2) + ((f[1] - self.currentPose.position.y)**2))
-            if  dist > largestDist:
-                largestDist = dist
-                location = [f] 
+        self.frontiersExhausted = False
+        self.sendFrontierGoal(ranking[0])
+
+    def replanFrontier(self):
+        ranking = self.rankFrontiers()
+        if len(ranking) == 0 or not self.action_client.server_is_ready():
+            return
+        current = next((score for score in ranking if score.key == self.goalFrontier), None)
+        if current is not None and ranking[0].utility <= current.utility * self.replanMargin:
+            return
+
+        # a new goal preempts the active one in Nav2, without a cancel round-trip
+        self.info_msg('Goal frontier explored or outranked, replacing the goal')
+        self.sendFrontierGoal(ranking[0])
+
+    def sendFrontierGoal(self, score):
+        best = self.frontierTracker.clusters[score.key]
+        location = [self.costmap.mapToWorld(best.col, best.row)]
+        self.info_msg(f'Frontier utility {score.utility:.1f}, gain {score.gain} cells, cost {score.cost:.2f} m, '
+                      f'map version {self.mapVersion}')
 
         #worldFrontiers = [self.costmap.mapToWorld(f[0], f[1]) for f in frontiers]
         self.info_msg(f'World points {location}')
@@ -309,31 +203,51 @@ class WaypointFollowerTest(Node):
         action_request.poses = self.waypoints
 
         self.info_msg('Sending goal request...')
+        # the result of the replaced goal, if any, is ignored from now on
+        self.goal_handle = None
+        self.goalFrontier = score.key
+        self.state = ExplorerState.SendingGoal
         send_goal_future = self.action_client.send_goal_async(action_request)
+        send_goal_future.add_done_callback(self.goalResponseCallback)
+
+    def goalResponseCallback(self, future):
         try:
-            rclpy.spin_until_future_complete(self, send_goal_future)
-            self.goal_handle = send_goal_future.result()
+            goal_handle = future.result()
         except Exception as e:
             self.error_msg('Service call failed %r' % (e,))
+            self.state = ExplorerState.Idle
+            return
 
-        if not self.goal_handle.accepted:
+        if not goal_handle.accepted:
+            # the next map plans a goal again
             self.error_msg('Goal rejected')
+            self.state = ExplorerState.Idle
             return
 
         self.info_msg('Goal accepted')
-
-        get_result_future = self.goal_handle.get_result_async()
+        self.goal_handle = goal_handle
+        self.state = ExplorerState.Navigating
 
         self.info_msg("Waiting for 'FollowWaypoints' action to complete")
+        get_result_future = goal_handle.get_result_async()
+        get_result_future.add_done_callback(lambda future: self.goalResultCallback(future, goal_handle))
+
+    def goalResultCallback(self, future, goal_handle):
+        if goal_handle is not self.goal_handle:
+            return  # the goal was replaced
+
         try:
-            rclpy.spin_until_future_complete(self, get_result_future)
-            status = get_result_future.result().status
-            result = get_result_future.result().result
+            status = future.result().status
         except Exception as e:
             self.error_msg('Service call failed %r' % (e,))
+            status = None
+        if status != GoalStatus.STATUS_SUCCEEDED:
+            self.info_msg('Goal failed with status code: {0}'.format(status))
+            # the ranking is the same on the same map, the frontier would be sent again at once
+            self.failedFrontiers.add(self.goalFrontier)
 
-        #self.currentPose = self.waypoints[len(self.waypoints) - 1].pose
-
+        self.goal_handle = None
+        self.state = ExplorerState.Idle
         self.moveToFrontiers()
 
     def costmapCallback(self, msg):
@@ -503,13 +417,12 @@ def main(argv=sys.argv[1:]):
         test.info_msg('Waiting for amcl_pose to be received')
         rclpy.spin_once(test, timeout_sec=1.0)  # wait for poseCallback
 
-    while test.costmap == None:
-        test.info_msg('Getting initial map')
-        rclpy.spin_once(test, timeout_sec=1.0)
-
-    test.moveToFrontiers()
+    # the first goal is sent on the first map, then every goal on the result of the previous one or on a new map
+    test.startExploration()
 
-    rclpy.spin(test)
+    executor = MultiThreadedExecutor()
+    executor.add_node(test)
+    executor.spin()
     # result = test.run(True)
     # assert result
 
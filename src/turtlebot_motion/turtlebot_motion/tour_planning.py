@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Tour planning over the best discoverer waypoints.
+
+Instead of sending one NavigateToPose goal at a time, the discoverer can take the K best
+waypoints and visit them in a single FollowWaypoints action, so that the planner start-up and
+the stop at every goal are paid once per tour. The visiting order is an open path starting at
+the robot, found with the nearest-neighbour heuristic and improved with 2-opt moves. K is small,
+so every 2-opt pass evaluates all the segment reversals at once with numpy and applies the best
+one.
+
+The costs between the points are either straight-line distances, or geodesic distances along
+the free space from one wavefront per point.
+
+Run ``python3 -m turtlebot_motion.tour_planning`` to compare the length of the tours with the
+order of the scores.
+"""
+
+import time
+
+import numpy as np
+
+from turtlebot_motion.map_fields import geodesic_distance
+
+
+def euclidean_costs(points):
+    """
+    Computes the straight-line distances between all the points.
+
+    :param points: array of shape (n, 2)
+    :return: array of shape (n, n)
+    """
+    points = np.asarray(points, dtype=np.float64)
+    return np.hypot(*(points[:, None, :] - points[None, :, :]).transpose(2, 0, 1))
+
+
+def geodesic_costs(free, cells, resolution):
+    """
+    Computes the travel distances along the free space between all the cells.
+
+    One wavefront is run from every cell, so the cost grows with the number of cells. Cells that
+    cannot reach each other get an infinite cost.
+
+    :param free: boolean array of the free cells
+    :param cells: list of (row, column) cells
+    :param resolution: size of one cell in meters
+    :return: array of shape (n, n) of distances in meters
+    """
+    costs = np.full((len(cells), len(cells)), np.inf)
+    rows = np.array([cell[0] for cell in cells])
+    cols = np.array([cell[1] for cell in cells])
+    inside = (rows >= 0) & (cols >= 0) & (rows < free.shape[0]) & (cols < free.shape[1])
+    for i, cell in enumerate(cells):
+        distance = geodesic_distance(free, cell)
+        if distance is not None:
+            costs[i, inside] = distance[rows[inside], cols[inside]] * resolution
+    np.fill_diagonal(costs, 0.0)
+    # the wavefronts are approximations, the costs are made symmetric
+    return np.minimum(costs, costs.T)
+
+
+def path_length(tour, costs):
+    """
+    Computes the length of an open path.
+
+    :param tour: indices of the points in the visiting order
+    :param costs: array of shape (n, n) of the costs between the points
+    :return: sum of the costs of the consecutive points
+    """
+    tour = np.asarray(tour)
+    return float(costs[tour[:-1], tour[1:]].sum())
+
+
+def nearest_neighbour_tour(costs, start=0):
+    """
+    Orders the points by always going to the closest point not visited yet.
+
+    :param costs: array of shape (n, n) of the costs between the points
+    :param start: index of the first point
+    :return: int64 array of the indices of the points in the visiting order
+    """
+    n = len(costs)
+    visited = np.zeros(n, dtype=bool)
+    tour = [start]
+    visited[start] = True
+    for _ in range(n - 1):
+        remaining = np.where(visited, np.inf, costs[tour[-1]])
+        following = int(np.argmin(remaining))
+        tour.append(following)
+        visited[following] = True
+    return np.array(tour, dtype=np.int64)
+
+
+def two_opt(tour, costs, max_passes=100):
+    """
+    Improves an open path with its first point fixed, by reversing segments while it gets shorter.
+
+    Reversing the segment tour[i:j + 1] replaces the edges (tour[i - 1], tour[i]) and
+    (tour[j], tour[j + 1]) by (tour[i - 1], tour[j]) and (tour[i], tour[j + 1]); when j is the
+    last point, the second edge does not exist. The gains of all the reversals are computed at
+    once and the best one is applied, until none shortens the path. Infinite (unreachable) costs
+    are replaced by a penalty larger than any path of finite edges, so that a reversal removing
+    an unreachable edge is always the best move.
+
+    :param tour: indices of the points in the visiting order
+    :param costs: array of shape (n, n) of the costs between the points
+    :param max_passes: largest number of reversals
+    :return: int64 array of the indices of the points in the improved order
+    """
+    tour = np.array(tour, dtype=np.int64)
+    n = len(tour)
+    if n < 3:
+        return tour
+    costs = np.asarray(costs, dtype=np.float64)
+    finite = np.isfinite(costs)
+    if not finite.all():
+        penalty = n * (np.abs(costs[finite]).max(initial=0.0) + 1.0)
+        costs = np.where(finite, costs, penalty)
+    i, j = np.triu_indices(n, k=1)
+    keep = i >= 1
+    i, j = i[keep], j[keep]
+    last = j == n - 1
+    following = np.where(last, j, j + 1)
+
+    for _ in range(max_passes):
+        before, first, end, after = tour[i - 1], tour[i], tour[j], tour[following]
+        gains = (costs[before, first] - costs[before, end]
+                 + np.where(last, 0.0, costs[end, after] - costs[first, after]))
+        best = int(np.argmax(gains))
+        if gains[best] <= 1e-9:
+            break
+        tour[i[best]:j[best] + 1] = tour[i[best]:j[best] + 1][::-1]
+    return tour
+
+
+def plan_tour(points, start, costs=None):
+    """
+    Orders points into a short open path from a start position.
+
+    :param points: array of shape (k, 2) of the points to visit
+    :param start: (x, y) start position, usually the robot
+    :param costs: array of shape (k + 1, k + 1) of the costs between the start (index 0) and the
+    points (index i + 1), or None for straight-line distances
+    :return: indices of the points in the visiting order, and the length of the path
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    if len(points) == 0:
+        return np.zeros(0, dtype=np.int64), 0.0
+    if costs is None:
+        costs = euclidean_costs(np.vstack((np.asarray(start, dtype=np.float64)[None, :], points)))
+    tour = two_opt(nearest_neighbour_tour(costs, start=0), costs)
+    return tour[1:] - 1, path_length(tour, costs)
+
+
+def benchmark(counts=(5, 10, 20, 50), trials=200, seed=0):
+    """
+    Prints the length of the tours of random points, against visiting them in a random order.
+
+    :param counts: numbers of points in the tours
+    :param trials: number of random tours per count
+    :param seed: seed of the random generator
+    """
+    rng = np.random.default_rng(seed)
+    print(f"{'points':>7} {'random order':>13} {'nearest':>8} {'+ 2-opt':>8} {'latency (ms)':>13}")
+    for count in counts:
+        lengths = np.zeros(3)
+        latency = 0.0
+        for _ in range(trials):
+            points = rng.uniform(0.0, 20.0, size=(count + 1, 2))
+            costs = euclidean_costs(points)
+            lengths[0] += path_length(np.concatenate(([0], rng.permutation(count) + 1)), costs)
+            start = time.perf_counter()
+            tour = nearest_neighbour_tour(costs)
+            lengths[1] += path_length(tour, costs)
+            tour = two_opt(tour, costs)
+            latency += time.perf_counter() - start
+            lengths[2] += path_length(tour, costs)
+        lengths /= trials
+        print(f'{count:>7} {lengths[0]:>13.1f} {lengths[1]:>8.1f} {lengths[2]:>8.1f} '
+              f'{latency * 1000 / trials:>13.2f}')
+
+
+if __name__ == '__main__':
+    benchmark()
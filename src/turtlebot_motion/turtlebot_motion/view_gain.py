@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Next-best-view scoring of the discoverer waypoints over the visual coverage map.
+
+The information gain of a waypoint is the number of unseen cells the camera would see from it.
+The camera is modelled as VisualCoverageMapper does: rays cast over a 'fov_deg' frustum, up to
+'max_range' meters, that stop at the first obstacle. At every stop the robot spins with one
+check every 'fov_deg' degrees, so the view of a waypoint is the union of the frustums of all
+those headings.
+
+The rays of a view do not depend on the waypoint, so they are computed once as cell offsets.
+The views of many waypoints are then cast together: the cells under every ray of every waypoint
+are gathered with one numpy indexing operation, and the occlusion along the rays is a cumulative
+AND. ViewGainScorer keeps the gains between maps and recasts only the views that reach a
+changed region.
+
+Run ``python3 -m turtlebot_motion.view_gain`` to print the latency against the number of
+waypoints.
+"""
+
+import time
+
+import numpy as np
+
+from turtlebot_motion.waypoint_scoring import OBSTACLE_THRESHOLD, coverage_like, random_map
+
+
+def ray_offsets(angles, reach):
+    """
+    Computes the cells under rays cast from a cell, as offsets from it.
+
+    Every ray is sampled once per cell along its major axis, as the Bresenham lines of
+    VisualCoverageMapper. Shorter rays repeat their last cell, so that all rays have the same
+    number of samples.
+
+    :param angles: angle of every ray from the x axis, in radians
+    :param reach: length of the rays, in cells
+    :return: int64 array of shape (rays, samples, 2) of (row, column) offsets
+    """
+    ends = np.column_stack((np.round(reach * np.sin(angles)), np.round(reach * np.cos(angles))))
+    steps = np.maximum(np.abs(ends).max(axis=1), 1.0)
+    n_samples = int(steps.max()) + 1
+    fractions = np.minimum(np.arange(n_samples)[None, :], steps[:, None]) / steps[:, None]
+    return np.round(fractions[:, :, None] * ends[:, None, :]).astype(np.int64)
+
+
+def view_rays(fov_deg=60.0, max_range=3.0, resolution=0.05, ray_count=30, headings=None):
+    """
+    Computes the cells under the rays of a view, as offsets from the cell of the camera.
+
+    The rays are the ones of ray_offsets, and cells seen by several rays are counted once.
+
+    :param fov_deg: horizontal field of view of the camera, in degrees
+    :param max_range: range of the camera, in meters
+    :param resolution: size of one cell in meters
+    :param ray_count: number of rays cast over the field of view
+    :param headings: headings of the camera relative to the robot, in degrees. By default, one
+    every fov_deg degrees over a full turn, as the robot spins at every stop
+    :return offsets: int64 array of shape (rays, samples, 2) of (row, column) offsets
+    :return unique: flat indices in the (rays, samples) samples of one sample per distinct cell,
+    the closest one to the camera
+    """
+    if headings is None:
+        headings = np.arange(0.0, 360.0, fov_deg)
+    angles = np.radians((np.asarray(headings, dtype=np.float64)[:, None]
+                         + np.linspace(-fov_deg / 2, fov_deg / 2, num=ray_count)[None, :]).ravel())
+
+    offsets = ray_offsets(angles, max_range / resolution)
+    n_samples = offsets.shape[1]
+
+    # the samples are ordered by distance to the camera, so each cell keeps its closest sample
+    by_distance = offsets.transpose(1, 0, 2).reshape(-1, 2)
+    _, first = np.unique(by_distance, axis=0, return_index=True)
+    sample, ray = np.divmod(first, len(angles))
+    return offsets, np.sort(ray * n_samples + sample)
+
+
+def view_gain(data, coverage_map, rows, cols, offsets, unique,
+              obstacle_threshold=OBSTACLE_THRESHOLD, batch_size=256):
+    """
+    Counts the unseen cells visible from many cells at once.
+
+    A cell is visible if no obstacle lies before it on its ray; the obstacle itself is visible,
+    as in VisualCoverageMapper. Cells outside the map stop the rays and are not counted.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param coverage_map: visual coverage map (0 = unseen), or None
+    :param rows: row of every camera cell
+    :param cols: column of every camera cell
+    :param offsets: ray offsets returned by view_rays
+    :param unique: distinct samples returned by view_rays
+    :param obstacle_threshold: occupancy probability above which a cell stops the rays
+    :param batch_size: number of views cast together, which bounds the memory used
+    :return: int64 array with the number of unseen cells visible from every cell
+    """
+    data = np.asarray(data)
+    height, width = data.shape
+    margin = int(np.abs(offsets).max()) + 1
+
+    # a border of opaque, seen cells removes the bounds checks, cells are indexed in the flat grid
+    padded_width = width + 2 * margin
+    opaque = np.ones((height + 2 * margin, padded_width), dtype=bool)
+    opaque[margin:-margin, margin:-margin] = data > obstacle_threshold
+    unseen = np.zeros(opaque.shape, dtype=bool)
+    unseen[margin:-margin, margin:-margin] = coverage_like(coverage_map, data.shape) == 0
+    opaque, unseen = opaque.ravel(), unseen.ravel()
+
+    flat_offsets = offsets[:, :, 0] * padded_width + offsets[:, :, 1]
+    unique_offsets = flat_offsets.ravel()[unique]
+    centers = ((np.asarray(rows, dtype=np.int64) + margin) * padded_width
+               + np.asarray(cols, dtype=np.int64) + margin)
+
+    gains = np.zeros(len(centers), dtype=np.int64)
+    for start in range(0, len(centers), batch_size):
+        batch = centers[start:start + batch_size]
+        # a sample is visible if every sample before it on its ray is transparent
+        clear = ~opaque[batch[:, None, None] + flat_offsets[None, :, :]]
+        visible = np.ones(clear.shape, dtype=bool)
+        np.logical_and.accumulate(clear[:, :, :-1], axis=2, out=visible[:, :, 1:])
+        visible = visible.reshape(len(batch), -1)[:, unique]
+        gains[start:start + batch_size] = np.count_nonzero(
+            visible & unseen[batch[:, None] + unique_offsets[None, :]], axis=1)
+    return gains
+
+
+def heading_gains(data, coverage_map, row, col, yaw, resolution, fov_deg=60.0, max_range=3.0,
+                  ray_count=30, count=6, obstacle_threshold=OBSTACLE_THRESHOLD):
+    """
+    Counts the unseen cells the camera would see from one cell at every stop of a scan.
+
+    The stops are 'count' headings evenly spaced over a full turn, the first one being the
+    current heading. The rays of all the stops are cast together, and the cells seen by several
+    rays of a stop are counted once.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param coverage_map: visual coverage map (0 = unseen), or None
+    :param row: row of the camera cell
+    :param col: column of the camera cell
+    :param yaw: current heading of the camera, in radians
+    :param resolution: size of one cell in meters
+    :param fov_deg: horizontal field of view of the camera, in degrees
+    :param max_range: range of the camera, in meters
+    :param ray_count: number of rays cast over the field of view
+    :param count: number of stops of the scan
+    :param obstacle_threshold: occupancy probability above which a cell stops the rays
+    :return: headings of the stops in radians, and int64 array of the unseen cells of every stop
+    """
+    data = np.asarray(data)
+    height, width = data.shape
+    headings = yaw + np.arange(count) * 2.0 * np.pi / count
+    angles = (headings[:, None]
+              + np.radians(np.linspace(-fov_deg / 2, fov_deg / 2, num=ray_count))[None, :]).ravel()
+    offsets = ray_offsets(angles, max_range / resolution)
+    rows, cols = row + offsets[:, :, 0], col + offsets[:, :, 1]
+
+    # cells outside the map are opaque and seen, they stop the rays and are not counted
+    inside = (rows >= 0) & (cols >= 0) & (rows < height) & (cols < width)
+    rows, cols = np.where(inside, rows, 0), np.where(inside, cols, 0)
+    clear = inside & (data[rows, cols] <= obstacle_threshold)
+    visible = np.ones(clear.shape, dtype=bool)
+    np.logical_and.accumulate(clear[:, :-1], axis=1, out=visible[:, 1:])
+    # the coverage map may be smaller than the grid for a short time, missing cells are unseen
+    unseen = inside
+    if coverage_map is not None:
+        coverage_map = np.asarray(coverage_map)
+        covered = (rows < coverage_map.shape[0]) & (cols < coverage_map.shape[1])
+        seen = coverage_map[np.where(covered, rows, 0), np.where(covered, cols, 0)] != 0
+        unseen = inside & ~(covered & seen)
+
+    stop = np.repeat(np.arange(count), ray_count)[:, None] * np.ones(rows.shape, dtype=np.int64)
+    keys = (stop * height + rows) * width + cols
+    distinct = np.unique(keys[visible & unseen])
+    return headings, np.bincount(distinct // (height * width), minlength=count)
+
+
+class ViewGainScorer():
+    """Keeps the information gain of the waypoints, recasting only the views that changed."""
+
+    def __init__(self, fov_deg=60.0, max_range=3.0, ray_count=30, headings=None,
+                 obstacle_threshold=OBSTACLE_THRESHOLD, batch_size=256):
+        """
+        :param fov_deg: horizontal field of view of the camera, in degrees
+        :param max_range: range of the camera, in meters
+        :param ray_count: number of rays cast over the field of view
+        :param headings: headings of the camera relative to the robot, see view_rays
+        :param obstacle_threshold: occupancy probability above which a cell stops the rays
+        :param batch_size: number of views cast together
+        """
+        self.fov_deg = fov_deg
+        self.max_range = max_range
+        self.ray_count = ray_count
+        self.headings = headings
+        self.obstacle_threshold = obstacle_threshold
+        self.batch_size = batch_size
+
+        self.resolution = None
+        self.offsets = None
+        self.unique = None
+        self.shape = None
+        self.rows = None
+        self.cols = None
+        self.gains = np.zeros(0, dtype=np.int64)
+        self.max_gain = 1  # number of distinct cells of a view
+        self.recast_indices = np.zeros(0, dtype=np.int64)  # the views recast by the last update
+
+    def update(self, data, coverage_map, rows, cols, resolution, dirty_boxes=None,
+               previous_indices=None):
+        """
+        Updates the gains with a new occupancy grid and visual coverage map.
+
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param coverage_map: visual coverage map (0 = unseen), or None
+        :param rows: row of every waypoint
+        :param cols: column of every waypoint
+        :param resolution: size of one cell in meters
+        :param dirty_boxes: (row_start, row_stop, col_start, col_stop) boxes of the cells that
+        changed since the last update, or None to recast every view
+        :param previous_indices: previous index of every waypoint, -1 for the new ones, if the
+        waypoints changed since the last update
+        :return: int64 array with the gain of every waypoint
+        """
+        if resolution != self.resolution:
+            self.resolution = resolution
+            self.offsets, self.unique = view_rays(self.fov_deg, self.max_range, resolution,
+                                                  self.ray_count, self.headings)
+            self.max_gain = len(self.unique)
+            dirty_boxes = None
+
+        if previous_indices is not None and dirty_boxes is not None and self.shape == data.shape:
+            # the views of the waypoints that were already there are kept
+            kept = previous_indices >= 0
+            gains = np.zeros(len(rows), dtype=np.int64)
+            gains[kept] = self.gains[previous_indices[kept]]
+            self.gains = gains
+            self.rows, self.cols = np.array(rows), np.array(cols)
+            self.recast_indices = np.union1d(np.flatnonzero(~kept),
+                                             self.views_reaching(dirty_boxes))
+        elif (dirty_boxes is None or self.shape != data.shape or self.rows is None
+                or not np.array_equal(self.rows, rows) or not np.array_equal(self.cols, cols)):
+            self.shape = data.shape
+            self.rows, self.cols = np.array(rows), np.array(cols)
+            self.gains = np.zeros(len(self.rows), dtype=np.int64)
+            self.recast_indices = np.arange(len(self.rows))
+        else:
+            self.recast_indices = self.views_reaching(dirty_boxes)
+
+        if self.recast_indices.size > 0:
+            self.gains[self.recast_indices] = view_gain(
+                data, coverage_map, self.rows[self.recast_indices], self.cols[self.recast_indices],
+                self.offsets, self.unique, obstacle_threshold=self.obstacle_threshold,
+                batch_size=self.batch_size)
+        return self.gains
+
+    def views_reaching(self, boxes):
+        """
+        Finds the waypoints whose view may reach one of the boxes.
+
+        :param boxes: list of (row_start, row_stop, col_start, col_stop) boxes
+        :return: sorted indices of the waypoints
+        """
+        reach = int(np.abs(self.offsets).max())
+        reaching = np.zeros(len(self.rows), dtype=bool)
+        for row_start, row_stop, col_start, col_stop in boxes:
+            reaching |= ((self.rows >= row_start - reach) & (self.rows < row_stop + reach)
+                         & (self.cols >= col_start - reach) & (self.cols < col_stop + reach))
+        return np.flatnonzero(reaching)
+
+
+def benchmark(side=400, resolution=0.05, counts=(100, 1000, 10000), repeats=3):
+    """
+    Prints the latency of view_gain against the number of waypoints, on a random map.
+
+    :param side: side of the square map, in cells
+    :param resolution: size of one cell in meters
+    :param counts: numbers of waypoints to score
+    :param repeats: number of runs, the best one is reported
+    """
+    data, coverage_map = random_map(side, side)
+    data[data == 100] = 0  # the random walls are too dense for the rays to go anywhere
+    offsets, unique = view_rays(resolution=resolution)
+    rng = np.random.default_rng(0)
+    print(f'{side} x {side} map, {offsets.shape[0]} rays of {offsets.shape[1]} samples, '
+          f'{len(unique)} cells per view')
+    print(f"{'waypoints':>10} {'latency (ms)':>13} {'per waypoint (us)':>18}")
+    for count in counts:
+        rows, cols = rng.integers(0, side, size=(2, count))
+        latency = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            view_gain(data, coverage_map, rows, cols, offsets, unique)
+            latency = min(latency, time.perf_counter() - start)
+        print(f'{count:>10} {latency * 1000:>13.1f} {latency * 1e6 / count:>18.1f}')
+
+
+if __name__ == '__main__':
+    benchmark()
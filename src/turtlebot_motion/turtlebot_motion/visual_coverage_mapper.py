@@ -4,13 +4,55 @@
 import rclpy
 from rclpy.node import Node
 from nav_msgs.msg import OccupancyGrid, Odometry
+from sensor_msgs.msg import Image
 from geometry_msgs.msg import PoseStamped
 from std_msgs.msg import Header
 import numpy as np
-import tf_transformations
 import math
+import os
 from rclpy.qos import QoSProfile, ReliabilityPolicy
 
+from explorer_map_utils.occupancy_grid import grid_message_data, occupancy_grid_view
+from turtlebot_motion.mission_snapshot import SnapshotStore
+from turtlebot_motion.odometry_buffer import OdometryBuffer, stamp_to_seconds
+
+
+def shift_coverage(coverage, old_origin, new_origin, resolution, new_shape):
+    """
+    Moves a coverage map onto a map of another size or origin, the cells outside the old map are unseen.
+
+    :param coverage: coverage map of the old map
+    :param old_origin: (x, y) origin of the old map, in meters
+    :param new_origin: (x, y) origin of the new map, in meters
+    :param resolution: size of one cell in meters
+    :param new_shape: (height, width) of the new map
+    :return: coverage map of the new map
+    """
+    new_height, new_width = new_shape
+    old_height, old_width = coverage.shape
+    new_coverage = np.zeros((new_height, new_width), dtype=np.uint8)
+
+    # Compute offset of old map origin in new map
+    dx = int(round((old_origin[0] - new_origin[0]) / resolution))
+    dy = int(round((old_origin[1] - new_origin[1]) / resolution))
+
+    # Copy old data into new_coverage
+    y_start = max(0, dy)
+    x_start = max(0, dx)
+    y_end = min(old_height + dy, new_height)
+    x_end = min(old_width + dx, new_width)
+    if y_end <= y_start or x_end <= x_start:
+        return new_coverage
+
+    old_y_start = max(0, -dy)
+    old_x_start = max(0, -dx)
+    old_y_end = old_y_start + (y_end - y_start)
+    old_x_end = old_x_start + (x_end - x_start)
+
+    new_coverage[y_start:y_end, x_start:x_end] = coverage[old_y_start:old_y_end, old_x_start:old_x_end]
+    return new_coverage
+
+
 class VisualCoverageMapper(Node):
     def __init__(self):
         super().__init__('visual_coverage_mapper')
@@ -26,32 +68,61 @@ class VisualCoverageMapper(Node):
         self.resolution = self.get_parameter('resolution').get_parameter_value().double_value
         self.ray_count = self.get_parameter('ray_count').get_parameter_value().integer_value
 
+        # Warm restart: the coverage map is saved to snapshot_directory every snapshot_period seconds, and restored
+        # from it at startup, so a restarted node does not forget what the camera has seen. '' disables the snapshots.
+        self.declare_parameter('snapshot_directory', '')
+        self.declare_parameter('snapshot_period', 5.0)
+        snapshot_directory = self.get_parameter('snapshot_directory').get_parameter_value().string_value
+        snapshot_period = self.get_parameter('snapshot_period').get_parameter_value().double_value
+        self.snapshot = None
+        self.restored_coverage = None  # (coverage, metadata) of the snapshot, placed onto the first map received
+        if snapshot_directory:
+            self.snapshot = SnapshotStore(os.path.expanduser(snapshot_directory), 'visual_coverage')
+            self.restore_snapshot()
+            self.snapshot_timer = self.create_timer(snapshot_period, self.save_snapshot)
+
         self.map = None
         self.map_info = None
 
         self.coverage_map = None
+        self.odom_buffer = OdometryBuffer()  # poses of the last seconds, the coverage is cast from the pose of its time
+        self.coverage_stamp = None  # capture time of the camera frame the coverage was last cast from
 
         self.map_sub = self.create_subscription(OccupancyGrid, '/map', self.map_callback, 10)
 
         qos_profile = QoSProfile(depth=10)
         qos_profile.reliability = ReliabilityPolicy.BEST_EFFORT
-        self.odom_sub = self.create_subscription(Odometry, '/odom', self.odom_callback, qos_profile)
+        self.odom_sub = self.create_subscription(Odometry, '/odom', self.odom_buffer.append_odometry, qos_profile)
+        # the camera sees what is in front of it when a frame is captured, not when the odometry arrives
+        self.image_sub = self.create_subscription(Image, '/oakd/rgb/preview/image_raw', self.image_callback, 10)
         self.coverage_pub = self.create_publisher(OccupancyGrid, '/visual_coverage_map', 10)
 
         self.get_logger().info('Visual Coverage Mapper Node Initialized.')
 
     def map_callback(self, msg):
-        new_map_info = msg.info
-        new_height, new_width = new_map_info.height, new_map_info.width
+        grid = occupancy_grid_view(msg)  # read-only view of the message, no copy
+        new_map_info = grid.info
+        new_height, new_width = grid.height, grid.width
         new_origin = new_map_info.origin
 
-        new_map = np.array(msg.data, dtype=np.int8).reshape((new_height, new_width))
+        new_map = grid.data
 
         # First time init
         if self.coverage_map is None:
             self.coverage_map = np.zeros((new_height, new_width), dtype=np.uint8)
+            if self.restored_coverage is not None:
+                coverage, metadata = self.restored_coverage
+                self.restored_coverage = None
+                if math.isclose(metadata['resolution'], new_map_info.resolution):
+                    self.coverage_map = shift_coverage(coverage, metadata['origin'],
+                                                       (new_origin.position.x, new_origin.position.y),
+                                                       new_map_info.resolution, (new_height, new_width))
             self.map = new_map
             self.map_info = new_map_info
+            # the robot already sees what is in front of it, without waiting for it to move
+            latest = self.odom_buffer.latest()
+            if latest is not None:
+                self.update_coverage(*latest[1:])
             return
 
         old_height, old_width = self.map_info.height, self.map_info.width
@@ -59,43 +130,25 @@ class VisualCoverageMapper(Node):
 
         # If size or origin changed → reallocate coverage_map
         if new_height != old_height or new_width != old_width or new_origin.position.x != old_origin.position.x or new_origin.position.y != old_origin.position.y:
-            new_coverage = np.zeros((new_height, new_width), dtype=np.uint8)
-
-            # Compute offset of old map origin in new map
-            dx = int(round((old_origin.position.x - new_origin.position.x) / new_map_info.resolution))
-            dy = int(round((old_origin.position.y - new_origin.position.y) / new_map_info.resolution))
-
-            # Copy old data into new_coverage
-            y_start = max(0, dy)
-            x_start = max(0, dx)
-            y_end = min(old_height + dy, new_height)
-            x_end = min(old_width + dx, new_width)
-
-            old_y_start = max(0, -dy)
-            old_x_start = max(0, -dx)
-            old_y_end = old_y_start + (y_end - y_start)
-            old_x_end = old_x_start + (x_end - x_start)
-
-            new_coverage[y_start:y_end, x_start:x_end] = self.coverage_map[old_y_start:old_y_end, old_x_start:old_x_end]
-
-            self.coverage_map = new_coverage
+            self.coverage_map = shift_coverage(self.coverage_map, (old_origin.position.x, old_origin.position.y),
+                                               (new_origin.position.x, new_origin.position.y),
+                                               new_map_info.resolution, (new_height, new_width))
 
         # Save map and info
         self.map = new_map
         self.map_info = new_map_info
 
 
-    def odom_callback(self, msg):
+    def image_callback(self, msg):
         if self.map is None or self.coverage_map is None:
             return
 
-        position = msg.pose.pose.position
-        orientation = msg.pose.pose.orientation
-        _, _, yaw = tf_transformations.euler_from_quaternion([
-            orientation.x, orientation.y, orientation.z, orientation.w
-        ])
-
-        self.update_coverage(position.x, position.y, yaw)
+        # pose of the robot when the frame was captured, the odometry is recorded before the first map too
+        pose = self.odom_buffer.pose_at(stamp_to_seconds(msg.header.stamp))
+        if pose is None:
+            return  # outside of the buffered poses
+        self.update_coverage(*pose)
+        self.coverage_stamp = msg.header.stamp
         self.publish_coverage_map()
 
     def is_obstacle(self, i, j):
@@ -147,16 +200,36 @@ class VisualCoverageMapper(Node):
     def publish_coverage_map(self):
         msg = OccupancyGrid()
         msg.header = Header()
-        msg.header.stamp = self.get_clock().now().to_msg()
+        # stamped with the pose it was cast from, so that its consumers can tell how old it is
+        msg.header.stamp = self.coverage_stamp if self.coverage_stamp is not None else self.get_clock().now().to_msg()
         msg.header.frame_id = "map"
         msg.info = self.map_info
-        data = list(self.coverage_map.flatten() * 100)
-        # convert to int8
-        data = [int(x) for x in data]
-        msg.data = data
-        print("GJFFKVEF")
+        # convert to int8, without going through every cell in Python
+        msg.data = grid_message_data(self.coverage_map * 100)
         self.coverage_pub.publish(msg)
 
+    def save_snapshot(self):
+        """
+        Saves the coverage map and the origin of its map to the snapshot directory.
+        """
+        if self.coverage_map is None:
+            return
+        origin = self.map_info.origin.position
+        self.snapshot.save({'coverage': self.coverage_map},
+                           {'origin': [origin.x, origin.y], 'resolution': self.map_info.resolution})
+
+    def restore_snapshot(self):
+        """
+        Loads the coverage map of the last snapshot, it is placed onto the first map received.
+        """
+        snapshot = self.snapshot.load()
+        if snapshot is None:
+            return
+        arrays, metadata = snapshot
+        self.restored_coverage = (np.array(arrays['coverage'], dtype=np.uint8), metadata)
+        self.get_logger().info(f"Restored the coverage map of snapshot {self.snapshot.generation} "
+                               f"({np.count_nonzero(arrays['coverage'])} cells seen)")
+
 
 def main(args=None):
     rclpy.init(args=args)
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Indexed max-heap of waypoint scores.
+
+The discoverer used to keep its goals in an array sorted with a full argsort on every map, and
+popped the best goal by slicing a copy of that array. WaypointQueue keeps a binary heap of
+(score, waypoint index) entries instead. Updating or removing a waypoint does not search the
+heap: the old entry is invalidated lazily, by bumping the version of the waypoint, and is
+discarded when it reaches the top. Updates and pops are O(log n), and the heap is rebuilt in
+O(n) whenever the stale entries outnumber the live ones. A waypoint passed several times to the
+same call keeps its last score.
+
+The O(log n) updates only pay off when few waypoints change. The discoverer rebuilds the queue
+with reset whenever every utility changes, which is the case for every map when the utility
+has a travel cost (travel_cost_weight > 0, the default) since the robot moves between maps, and
+when the candidates were sampled again; an update of every waypoint would cost O(n log n).
+"""
+
+import heapq
+
+import numpy as np
+
+
+class WaypointQueue():
+    """Max-heap of waypoint indices ordered by score, with lazy invalidation."""
+
+    def __init__(self, n_waypoints=0):
+        """
+        :param n_waypoints: number of waypoints that can be stored, indexed from 0
+        """
+        self._heap = []  # (-score, version, index) entries, some of them stale
+        self._versions = np.zeros(n_waypoints, dtype=np.int64)
+        self._scores = np.full(n_waypoints, np.nan)  # nan if the waypoint is not in the queue
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, index):
+        return 0 <= index < len(self._scores) and not np.isnan(self._scores[index])
+
+    def score(self, index):
+        """
+        Gets the score of a waypoint.
+
+        :param index: index of the waypoint
+        :return: score of the waypoint, or None if it is not in the queue
+        """
+        return float(self._scores[index]) if index in self else None
+
+    def reset(self, indices, scores, n_waypoints=None):
+        """
+        Replaces the content of the queue, in O(n).
+
+        :param indices: indices of the waypoints to store
+        :param scores: score of every waypoint, non-finite scores are not stored
+        :param n_waypoints: new number of waypoints that can be stored, if it changed
+        """
+        if n_waypoints is not None and n_waypoints != len(self._scores):
+            self._versions = np.zeros(n_waypoints, dtype=np.int64)
+            self._scores = np.full(n_waypoints, np.nan)
+        else:
+            self._versions += 1
+            self._scores[:] = np.nan
+
+        indices, scores = self._finite(*self._last_occurrences(indices, scores))
+        self._scores[indices] = scores
+        self._size = len(indices)
+        self._heap = list(zip((-scores).tolist(), self._versions[indices].tolist(),
+                              indices.tolist()))
+        heapq.heapify(self._heap)
+
+    def update(self, indices, scores):
+        """
+        Inserts, rescores or removes waypoints, in O(log n) each.
+
+        :param indices: indices of the waypoints
+        :param scores: new score of every waypoint, a non-finite score removes the waypoint
+        """
+        indices, scores = self._last_occurrences(indices, scores)
+        finite = np.isfinite(scores)
+        self.remove(indices[~finite])
+
+        indices, scores = indices[finite], scores[finite]
+        changed = self._scores[indices] != scores  # also True if the waypoint was not stored
+        indices, scores = indices[changed], scores[changed]
+        self._size += int(np.count_nonzero(np.isnan(self._scores[indices])))
+        self._versions[indices] += 1
+        self._scores[indices] = scores
+        for entry in zip((-scores).tolist(), self._versions[indices].tolist(), indices.tolist()):
+            heapq.heappush(self._heap, entry)
+        self._compact()
+
+    def remove(self, indices):
+        """
+        Removes waypoints from the queue, in O(1) each. Their heap entries become stale.
+
+        :param indices: indices of the waypoints
+        """
+        indices = np.unique(np.asarray(indices, dtype=np.int64).ravel())
+        indices = indices[~np.isnan(self._scores[indices])]
+        self._versions[indices] += 1
+        self._scores[indices] = np.nan
+        self._size -= len(indices)
+
+    def peek(self):
+        """
+        Gets the best waypoint without removing it.
+
+        :return: index of the waypoint with the highest score, or None if the queue is empty
+        """
+        self._discard_stale()
+        return self._heap[0][2] if self._heap else None
+
+    def pop(self):
+        """
+        Removes and returns the best waypoint, in O(log n).
+
+        :return: index of the waypoint with the highest score, or None if the queue is empty
+        """
+        self._discard_stale()
+        if not self._heap:
+            return None
+        _, _, index = heapq.heappop(self._heap)
+        self._versions[index] += 1
+        self._scores[index] = np.nan
+        self._size -= 1
+        return index
+
+    def top(self, k):
+        """
+        Gets the k best waypoints without removing them, in O(k log n).
+
+        :param k: number of waypoints
+        :return: list of the indices of the k waypoints with the highest scores, best first
+        """
+        entries = []
+        while self._heap and len(entries) < k:
+            entry = heapq.heappop(self._heap)
+            if self._is_live(entry):
+                entries.append(entry)
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+        return [entry[2] for entry in entries]
+
+    def _is_live(self, entry):
+        return entry[1] == self._versions[entry[2]]
+
+    def _discard_stale(self):
+        while self._heap and not self._is_live(self._heap[0]):
+            heapq.heappop(self._heap)
+
+    def _compact(self):
+        # rebuild the heap from the live entries once the stale ones outnumber them
+        if len(self._heap) > 2 * self._size + 64:
+            self._heap = [entry for entry in self._heap if self._is_live(entry)]
+            heapq.heapify(self._heap)
+
+    @staticmethod
+    def _last_occurrences(indices, scores):
+        # the size is counted from the distinct waypoints, a repeated one keeps its last score
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        _, last = np.unique(indices[::-1], return_index=True)
+        last = len(indices) - 1 - last
+        return indices[last], scores[last]
+
+    @staticmethod
+    def _finite(indices, scores):
+        indices = np.asarray(indices, dtype=np.int64).ravel()
+        scores = np.asarray(scores, dtype=np.float64).ravel()
+        finite = np.isfinite(scores)
+        return indices[finite], scores[finite]
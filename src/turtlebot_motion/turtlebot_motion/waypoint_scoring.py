@@ -0,0 +1,625 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+"""
+Batched waypoint scoring for the discoverer.
+
+Every waypoint is scored from its clearance, the Euclidean distance from its cell to the
+closest obstacle or unknown cell, and from the average unseen fraction of a (size x size) window
+around it. The clearance of the whole grid is a distance transform computed once per map, so
+accessibility and the clearance term are a single lookup per waypoint. The coverage of the whole
+grid is turned into a summed-area table once per map, so that the sum over any window is
+obtained with four lookups. All waypoints are then scored at once with numpy indexing.
+
+IncrementalScorer keeps the clearance and the scores between map messages. It diffs every new
+grid against the previous one, recomputes the clearance around the changed regions only, and
+rescores only the waypoints the changes can reach, so that the update cost follows what changed
+instead of the map area.
+
+Run ``python3 -m turtlebot_motion.waypoint_scoring`` to print the per-message latency of the
+batched engine against the map size.
+"""
+
+import math
+import time
+
+import numpy as np
+from scipy import ndimage
+
+
+OBSTACLE_THRESHOLD = 50  # occupancy probability above which a cell is an obstacle
+ROBOT_RADIUS = 0.2  # clearance below which a waypoint is not accessible, in meters
+PREFERRED_CLEARANCE = 0.5  # clearance above which a waypoint is not safer, in meters
+
+
+def convolute(clearance, coverage_map, coordinates, size=3, robot_radius=ROBOT_RADIUS,
+              preferred_clearance=PREFERRED_CLEARANCE, coverage_weight=0.5):
+    """
+    Determines if a waypoint is accessible from its clearance, and scores it.
+
+    This is the scalar reference of score_waypoints, kept to check the batched engine against.
+    It only matches score_waypoints for the windows inside the map: a window past the last row or
+    column raises an IndexError, and one before the first wraps around to the opposite edge.
+
+    :param clearance: clearance map returned by clearance_map
+    :param coverage_map: visual coverage map, same shape as the clearance (0 = unseen, 1 = seen)
+    :param coordinates: the [row, column] coordinates of the OccupancyGrid to convolute around
+    :param size: size of the kernel
+    :param robot_radius: clearance below which the waypoint is not accessible, in meters
+    :param preferred_clearance: clearance above which the waypoint is not safer, in meters
+    :param coverage_weight: weight of the unseen fraction in the score
+    :return: True or False, depending on whether the waypoint is accessible or not, and its score
+    """
+    coverage_sum = 0
+
+    for x in range(int(coordinates[0] - size / 2), int(coordinates[0] + size / 2)):
+        for y in range(int(coordinates[1] - size / 2), int(coordinates[1] + size / 2)):
+            # encourage going to unseen places (0 = unseen, 1 = seen)
+            coverage_sum += 1 - coverage_map[x, y]  # high if unseen
+
+    area = size * size
+    coverage_avg = coverage_sum / area  # 0 if fully seen, 1 if fully unseen
+
+    waypoint_clearance = clearance[coordinates[0], coordinates[1]]
+    if waypoint_clearance >= robot_radius:
+        # keep away from walls, up to the preferred clearance
+        safety = 100 * min(waypoint_clearance / preferred_clearance, 1.0)
+        score = (1 - coverage_weight) * safety + coverage_weight * (100 * coverage_avg)
+        return True, score
+    else:
+        return False, float('inf')
+
+
+def clearance_map(data, resolution, cap=None, obstacle_threshold=OBSTACLE_THRESHOLD):
+    """
+    Computes the clearance of every cell, with a Euclidean distance transform.
+
+    The clearance of a cell is its distance to the closest obstacle or unknown cell; the cells
+    outside the grid count as obstacles.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param resolution: size of one cell in meters
+    :param cap: clearance above which the exact distance does not matter, in meters, or None
+    :param obstacle_threshold: occupancy probability above which a cell is an obstacle
+    :return: float32 array of the same shape with the clearance of every cell, in meters
+    """
+    data = np.asarray(data)
+    free = np.zeros((data.shape[0] + 2, data.shape[1] + 2), dtype=bool)
+    free[1:-1, 1:-1] = (data >= 0) & (data <= obstacle_threshold)
+    clearance = ndimage.distance_transform_edt(free)[1:-1, 1:-1] * resolution
+    if cap is not None:
+        np.minimum(clearance, cap, out=clearance)
+    return clearance.astype(np.float32)
+
+
+def summed_area_table(grid, dtype=np.int64):
+    """
+    Builds the summed-area table of a 2D grid.
+
+    The table has one extra leading row and column of zeros, so that the sum over the cells
+    [r0:r1, c0:c1] is table[r1, c1] - table[r0, c1] - table[r1, c0] + table[r0, c0].
+
+    :param grid: 2D array
+    :param dtype: accumulator type of the table
+    :return: array of shape (height + 1, width + 1)
+    """
+    height, width = grid.shape
+    table = np.zeros((height + 1, width + 1), dtype=dtype)
+    np.cumsum(grid, axis=0, dtype=dtype, out=table[1:, 1:])
+    np.cumsum(table[1:, 1:], axis=1, out=table[1:, 1:])
+    return table
+
+
+def box_sums(table, rows_lo, rows_hi, cols_lo, cols_hi):
+    """
+    Sums a summed-area table over many windows at once.
+
+    :param table: summed-area table returned by summed_area_table
+    :param rows_lo: first row of every window
+    :param rows_hi: row after the last one of every window
+    :param cols_lo: first column of every window
+    :param cols_hi: column after the last one of every window
+    :return: array with the sum of the grid over every window
+    """
+    return (table[rows_hi, cols_hi] - table[rows_lo, cols_hi]
+            - table[rows_hi, cols_lo] + table[rows_lo, cols_lo])
+
+
+def gather_windows(grid, rows_lo, rows_hi, cols_lo, cols_hi, size, fill=0):
+    """
+    Gathers the cells of many windows at once, for a few windows on a large grid.
+
+    Building a summed-area table costs a pass over the whole grid, gathering the windows costs
+    size x size lookups per window.
+
+    :param grid: 2D array
+    :param rows_lo: first row of every window, the windows must be inside the grid
+    :param rows_hi: row after the last one of every window
+    :param cols_lo: first column of every window
+    :param cols_hi: column after the last one of every window
+    :param size: largest size of the windows
+    :param fill: value of the cells past the end of the windows smaller than the size
+    :return: array of shape (n, size, size)
+    """
+    offsets = np.arange(size)
+    rows = np.asarray(rows_lo)[:, None] + offsets[None, :]
+    cols = np.asarray(cols_lo)[:, None] + offsets[None, :]
+    row_inside = rows < np.asarray(rows_hi)[:, None]
+    col_inside = cols < np.asarray(cols_hi)[:, None]
+    rows = np.where(row_inside, rows, np.asarray(rows_lo)[:, None])
+    cols = np.where(col_inside, cols, np.asarray(cols_lo)[:, None])
+    windows = grid[rows[:, :, None], cols[:, None, :]]
+    return np.where(row_inside[:, :, None] & col_inside[:, None, :], windows, fill)
+
+
+def waypoints_to_cells(waypoints, resolution):
+    """
+    Converts waypoints in map coordinates (x, y), in meters, to grid cells (row, column).
+
+    :param waypoints: array of shape (n, 2)
+    :param resolution: size of one cell in meters
+    :return: rows and columns of the waypoints, as int64 arrays
+    """
+    waypoints = np.asarray(waypoints, dtype=np.float64).reshape(-1, 2)
+    rows = np.trunc(waypoints[:, 1] / resolution).astype(np.int64)
+    cols = np.trunc(waypoints[:, 0] / resolution).astype(np.int64)
+    return rows, cols
+
+
+def window_bounds(centers, size):
+    """
+    Computes the window of 'size' cells around every center, with the same rounding as convolute.
+
+    :param centers: int array of rows or columns
+    :param size: size of the kernel
+    :return: first index and index after the last one of every window
+    """
+    lo = np.trunc(centers - size / 2).astype(np.int64)
+    hi = np.trunc(centers + size / 2).astype(np.int64)
+    return lo, hi
+
+
+def coverage_like(coverage_map, shape, dtype=np.float64):
+    """
+    Fits the visual coverage map to the shape of the occupancy grid.
+
+    The coverage mapper reallocates its map after the occupancy grid grows, so for a short time
+    both grids may differ in size. Missing cells are considered unseen.
+
+    :param coverage_map: visual coverage map, or None if none has been received yet
+    :param shape: shape of the occupancy grid
+    :param dtype: type of the returned array
+    :return: array of the given shape
+    """
+    if coverage_map is not None and np.shape(coverage_map) == tuple(shape):
+        return np.array(coverage_map, dtype=dtype)
+    coverage = np.zeros(shape, dtype=dtype)
+    if coverage_map is not None:
+        coverage_map = np.asarray(coverage_map)
+        height = min(shape[0], coverage_map.shape[0])
+        width = min(shape[1], coverage_map.shape[1])
+        coverage[:height, :width] = coverage_map[:height, :width]
+    return coverage
+
+
+def score_cells(clearance, coverage_table, rows, cols, size=5, robot_radius=ROBOT_RADIUS,
+                preferred_clearance=PREFERRED_CLEARANCE, coverage_weight=0.5, coverage=None):
+    """
+    Scores grid cells from the clearance map and the summed-area table of the visual coverage.
+
+    :param clearance: clearance map returned by clearance_map
+    :param coverage_table: summed-area table of the visual coverage, or None to sum the windows
+    of the coverage grid directly
+    :param rows: row of every cell
+    :param cols: column of every cell
+    :param size: size of the kernel
+    :param robot_radius: clearance below which a cell is not accessible, in meters
+    :param preferred_clearance: clearance above which a cell is not safer, in meters
+    :param coverage_weight: weight of the unseen fraction in the score
+    :param coverage: visual coverage grid, used if there is no summed-area table
+    :return: valid, accessible and score arrays, see score_waypoints
+    """
+    height, width = clearance.shape
+    rows_lo, rows_hi = window_bounds(rows, size)
+    cols_lo, cols_hi = window_bounds(cols, size)
+
+    # windows that go out of the map are not scored, on purpose on both edges: convolute raises an
+    # IndexError past the last row or column, but a negative index wraps around to the opposite
+    # edge there and sums cells that are not around the waypoint
+    valid = (rows_lo >= 0) & (cols_lo >= 0) & (rows_hi <= height) & (cols_hi <= width)
+    rows_lo, rows_hi = rows_lo[valid], rows_hi[valid]
+    cols_lo, cols_hi = cols_lo[valid], cols_hi[valid]
+
+    area = size * size
+    n_cells = (rows_hi - rows_lo) * (cols_hi - cols_lo)
+    if coverage_table is None:
+        seen = gather_windows(coverage, rows_lo, rows_hi, cols_lo, cols_hi, size).sum(
+            axis=(1, 2), dtype=np.float64)
+    else:
+        seen = box_sums(coverage_table, rows_lo, rows_hi, cols_lo, cols_hi)
+    coverage_avg = (n_cells - seen) / area
+    cell_clearance = clearance[rows[valid], cols[valid]]
+
+    accessible = np.zeros(valid.shape, dtype=bool)
+    scores = np.full(valid.shape, np.inf)
+    cell_accessible = cell_clearance >= robot_radius
+    accessible[valid] = cell_accessible
+    safety = 100 * np.minimum(cell_clearance / preferred_clearance, 1.0)
+    scores[valid] = np.where(
+        cell_accessible,
+        (1 - coverage_weight) * safety + coverage_weight * (100 * coverage_avg),
+        np.inf)
+    return valid, accessible, scores
+
+
+def score_waypoints(data, coverage_map, waypoints, resolution, size=5, robot_radius=ROBOT_RADIUS,
+                    preferred_clearance=PREFERRED_CLEARANCE, coverage_weight=0.5):
+    """
+    Scores all the waypoints at once, with the same scores as convolute for the windows inside
+    the map. The waypoints whose window goes out of the map, on either edge, are not valid.
+
+    :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+    :param coverage_map: visual coverage map (0 = unseen, 1 = seen), or None
+    :param waypoints: array of shape (n, 2) of waypoints in map coordinates (x, y), in meters
+    :param resolution: size of one cell in meters
+    :param size: size of the kernel
+    :param robot_radius: clearance below which a waypoint is not accessible, in meters
+    :param preferred_clearance: clearance above which a waypoint is not safer, in meters
+    :param coverage_weight: weight of the unseen fraction in the score
+    :return valid: boolean array, False for the waypoints whose window goes out of the map
+    :return accessible: boolean array, True for the valid waypoints that are accessible
+    :return scores: float array with the score of the accessible waypoints, inf for the rest
+    """
+    data = np.asarray(data)
+    clearance = clearance_map(data, resolution, cap=max(robot_radius, preferred_clearance))
+    coverage_table = summed_area_table(coverage_like(coverage_map, data.shape), dtype=np.float64)
+    rows, cols = waypoints_to_cells(waypoints, resolution)
+    return score_cells(clearance, coverage_table, rows, cols, size=size,
+                       robot_radius=robot_radius, preferred_clearance=preferred_clearance,
+                       coverage_weight=coverage_weight)
+
+
+def match_keys(previous_keys, keys):
+    """
+    Finds where every key was in a previous array of keys.
+
+    :param previous_keys: int array of distinct keys
+    :param keys: int array of keys
+    :return: int64 array with the index of every key in previous_keys, -1 if it is not there
+    """
+    order = np.argsort(previous_keys, kind='stable')
+    sorted_keys = previous_keys[order]
+    positions = np.minimum(np.searchsorted(sorted_keys, keys), max(len(sorted_keys) - 1, 0))
+    if len(sorted_keys) == 0:
+        return np.full(len(keys), -1, dtype=np.int64)
+    return np.where(sorted_keys[positions] == keys, order[positions], -1).astype(np.int64)
+
+
+class IncrementalScorer():
+    """
+    Scores waypoints incrementally, rescoring only the ones a changed region can affect.
+
+    The clearance, valid, accessible and scores arrays persist between updates. They are
+    recomputed from scratch when the map size or the resolution change, or when the changed
+    regions cover too much of the map for the incremental update to pay off. When the waypoints
+    change, the ones that were already scored keep their score unless a change reaches them, and
+    previous_indices maps every waypoint to its previous index.
+
+    The clearance is capped at the largest of the robot radius and the preferred clearance, so a
+    change only moves the clearance of the cells closer to it than the cap. Around every changed
+    region, the clearance is recomputed on a crop that extends past those cells by the cap, and
+    the waypoints whose window or cell is within the cap of the region are rescored.
+    """
+
+    def __init__(self, size=5, robot_radius=ROBOT_RADIUS, preferred_clearance=PREFERRED_CLEARANCE,
+                 coverage_weight=0.5, max_dirty_fraction=0.25, max_dirty_boxes=64):
+        """
+        :param size: size of the kernel
+        :param robot_radius: clearance below which a waypoint is not accessible, in meters
+        :param preferred_clearance: clearance above which a waypoint is not safer, in meters
+        :param coverage_weight: weight of the unseen fraction in the score
+        :param max_dirty_fraction: fraction of the map above which everything is rescored
+        :param max_dirty_boxes: number of changed regions above which they are merged into one box
+        """
+        self.size = size
+        self.robot_radius = robot_radius
+        self.preferred_clearance = preferred_clearance
+        self.coverage_weight = coverage_weight
+        self.max_dirty_fraction = max_dirty_fraction
+        self.max_dirty_boxes = max_dirty_boxes
+
+        self.data = None
+        self.coverage = None
+        self.clearance = None  # clearance of every cell in meters, capped at self.cap
+        self.resolution = None
+        self.margin = 0  # distance in cells past which a change cannot move the clearance
+        self.waypoints = None
+        self.rows = None
+        self.cols = None
+        self.windows = None
+        self.row_order = None  # waypoints sorted by the first row of their window
+        self.sorted_rows_lo = None
+        self.valid = np.zeros(0, dtype=bool)
+        self.accessible = np.zeros(0, dtype=bool)
+        self.scores = np.zeros(0)
+        self.dirty_boxes = []  # (row_start, row_stop, col_start, col_stop) of the last update
+        self.rescored = 0  # number of waypoints rescored by the last update
+        self.rescored_indices = np.zeros(0, dtype=np.int64)  # the waypoints rescored last time
+        self.full_rescore = False  # whether the last update rescored every waypoint
+        self.fields_reset = False  # whether the last update recomputed the clearance from scratch
+        # previous index of every waypoint if the waypoints changed in the last update, -1 for the
+        # new ones, None if they did not change
+        self.previous_indices = None
+
+    @property
+    def cap(self):
+        """Clearance above which the exact distance does not change the score, in meters."""
+        return max(self.robot_radius, self.preferred_clearance)
+
+    def update(self, data, coverage_map, waypoints, resolution):
+        """
+        Updates the scores with a new occupancy grid and visual coverage map.
+
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param coverage_map: visual coverage map (0 = unseen, 1 = seen), or None
+        :param waypoints: array of shape (n, 2) of waypoints in map coordinates (x, y), in meters
+        :param resolution: size of one cell in meters
+        :return: valid, accessible and score arrays, see score_waypoints
+        """
+        self.update_fields(data, coverage_map, resolution)
+        return self.update_scores(waypoints)
+
+    def update_fields(self, data, coverage_map, resolution):
+        """
+        Updates the grids and the clearance with a new occupancy grid and visual coverage map.
+
+        The waypoints are not rescored until update_scores is called, so that the waypoints can
+        be chosen from the updated clearance.
+
+        :param data: Occupancy Grid Data (shaped to (height, width) map dimensions)
+        :param coverage_map: visual coverage map (0 = unseen, 1 = seen), or None
+        :param resolution: size of one cell in meters
+        """
+        data = np.asarray(data)
+        coverage = coverage_like(coverage_map, data.shape, dtype=np.float32)
+
+        if self.data is None or self.data.shape != data.shape or self.resolution != resolution:
+            self._reset_fields(data, coverage, resolution)
+            return
+
+        changed_data = data != self.data
+        changed = changed_data | (coverage != self.coverage)
+        self.data = data.copy()
+        self.coverage = coverage
+        self.dirty_boxes = self.changed_boxes(changed)
+        self.fields_reset = False
+
+        dirty_area = sum((r1 - r0 + 2 * self.margin) * (c1 - c0 + 2 * self.margin)
+                         for r0, r1, c0, c1 in self.dirty_boxes)
+        if dirty_area > self.max_dirty_fraction * data.size:
+            self._reset_fields(data, coverage, resolution)
+            return
+
+        for box in self.changed_boxes(changed_data):
+            self._update_clearance(*box)
+
+    def update_scores(self, waypoints):
+        """
+        Rescores the waypoints the last update_fields can affect, and the new waypoints.
+
+        :param waypoints: array of shape (n, 2) of waypoints in map coordinates (x, y), in meters
+        :return: valid, accessible and score arrays, see score_waypoints
+        """
+        waypoints = np.array(waypoints, dtype=np.float64).reshape(-1, 2)
+        self.previous_indices = None
+        if self.fields_reset or self.waypoints is None:
+            self._set_waypoints(waypoints)
+            self._score_indices(np.arange(len(waypoints)))
+            self.full_rescore = True
+            return self.valid, self.accessible, self.scores
+
+        self.full_rescore = False
+        new = np.zeros(0, dtype=np.int64)
+        if not np.array_equal(self.waypoints, waypoints):
+            previous_keys = self.rows * self.data.shape[1] + self.cols
+            previous = (self.valid, self.accessible, self.scores)
+            self._set_waypoints(waypoints)
+            self.previous_indices = match_keys(previous_keys,
+                                               self.rows * self.data.shape[1] + self.cols)
+            kept = self.previous_indices >= 0
+            for current, before in zip((self.valid, self.accessible, self.scores), previous):
+                current[kept] = before[self.previous_indices[kept]]
+            new = np.flatnonzero(~kept)
+            self._score_indices(new)
+
+        rescored = [self._rescore_box(*box) for box in self.dirty_boxes]
+        self.rescored_indices = np.unique(np.concatenate([new] + rescored))
+        self.rescored = len(self.rescored_indices)
+        return self.valid, self.accessible, self.scores
+
+    def changed_boxes(self, changed):
+        """
+        Finds the bounding boxes of the changed regions of the grid.
+
+        :param changed: boolean array, True for the cells that changed since the last update
+        :return: list of (row_start, row_stop, col_start, col_stop) boxes
+        """
+        rows = np.flatnonzero(changed.any(axis=1))
+        if rows.size == 0:
+            return []
+        cols = np.flatnonzero(changed.any(axis=0))
+        r0, r1, c0, c1 = rows[0], rows[-1] + 1, cols[0], cols[-1] + 1
+
+        # changes closer than the kernel size share waypoints, so they are merged in a single box
+        crop = ndimage.binary_dilation(changed[r0:r1, c0:c1],
+                                       structure=np.ones((self.size, self.size), dtype=bool))
+        labels, n_regions = ndimage.label(crop, structure=np.ones((3, 3)))
+        if n_regions > self.max_dirty_boxes:
+            return [(r0, r1, c0, c1)]
+
+        boxes = []
+        for region in ndimage.find_objects(labels):
+            # the dilation may have grown the region past the changed cells, clip it back
+            region_changed = changed[r0 + region[0].start:r0 + region[0].stop,
+                                     c0 + region[1].start:c0 + region[1].stop]
+            region_rows = np.flatnonzero(region_changed.any(axis=1))
+            region_cols = np.flatnonzero(region_changed.any(axis=0))
+            boxes.append((r0 + region[0].start + region_rows[0],
+                          r0 + region[0].start + region_rows[-1] + 1,
+                          c0 + region[1].start + region_cols[0],
+                          c0 + region[1].start + region_cols[-1] + 1))
+        return boxes
+
+    def _reset_fields(self, data, coverage, resolution):
+        self.data = data.copy()
+        self.coverage = coverage
+        self.resolution = resolution
+        self.margin = math.ceil(self.cap / resolution) + 1
+        self.clearance = clearance_map(data, resolution, cap=self.cap)
+        self.dirty_boxes = [(0, data.shape[0], 0, data.shape[1])]
+        self.fields_reset = True
+
+    def _set_waypoints(self, waypoints):
+        self.waypoints = waypoints
+        self.rows, self.cols = waypoints_to_cells(waypoints, self.resolution)
+        self.windows = window_bounds(self.rows, self.size) + window_bounds(self.cols, self.size)
+        self.row_order = np.argsort(self.windows[0], kind='stable')
+        self.sorted_rows_lo = self.windows[0][self.row_order]
+        self.valid = np.zeros(len(waypoints), dtype=bool)
+        self.accessible = np.zeros(len(waypoints), dtype=bool)
+        self.scores = np.full(len(waypoints), np.inf)
+
+    def _score_indices(self, indices):
+        if len(indices) == 0:
+            return
+        # a summed-area table pays off when there are more windows than cells per window
+        coverage_table = None
+        if len(indices) * self.size ** 2 > self.coverage.size:
+            coverage_table = summed_area_table(self.coverage, dtype=np.float64)
+        self.valid[indices], self.accessible[indices], self.scores[indices] = score_cells(
+            self.clearance, coverage_table, self.rows[indices], self.cols[indices],
+            size=self.size, robot_radius=self.robot_radius,
+            preferred_clearance=self.preferred_clearance, coverage_weight=self.coverage_weight,
+            coverage=self.coverage)
+        self.rescored_indices = np.asarray(indices, dtype=np.int64)
+        self.rescored = len(indices)
+
+    def _grown(self, row_start, row_stop, col_start, col_stop, margin):
+        height, width = self.data.shape
+        return (max(row_start - margin, 0), min(row_stop + margin, height),
+                max(col_start - margin, 0), min(col_stop + margin, width))
+
+    def _update_clearance(self, row_start, row_stop, col_start, col_stop):
+        # the cells within the margin of the box may change; their clearance only depends on the
+        # cells within the margin of them, so the transform runs on a crop grown twice
+        r0, r1, c0, c1 = self._grown(row_start, row_stop, col_start, col_stop, self.margin)
+        s0, s1, t0, t1 = self._grown(row_start, row_stop, col_start, col_stop, 2 * self.margin)
+        clearance = clearance_map(self.data[s0:s1, t0:t1], self.resolution, cap=self.cap)
+        self.clearance[r0:r1, c0:c1] = clearance[r0 - s0:r1 - s0, c0 - t0:c1 - t0]
+
+    def _rescore_box(self, row_start, row_stop, col_start, col_stop):
+        # the waypoints whose window overlaps the box grown by the margin, looked up among the
+        # rows around it. This covers the windows overlapping the box and the cells whose
+        # clearance may have changed.
+        row_start, row_stop, col_start, col_stop = self._grown(row_start, row_stop, col_start,
+                                                               col_stop, self.margin)
+        rows_lo, rows_hi, cols_lo, cols_hi = self.windows
+        first, last = np.searchsorted(self.sorted_rows_lo, [row_start - self.size - 1, row_stop])
+        candidates = self.row_order[first:last]
+        overlap = candidates[
+            self.valid[candidates]
+            & (rows_lo[candidates] < row_stop) & (rows_hi[candidates] > row_start)
+            & (cols_lo[candidates] < col_stop) & (cols_hi[candidates] > col_start)]
+        if overlap.size == 0:
+            return overlap
+
+        # their windows all fit in the box grown by the kernel size, so only that crop is summed
+        r0, r1, c0, c1 = self._grown(row_start, row_stop, col_start, col_stop, self.size)
+        coverage_table = summed_area_table(self.coverage[r0:r1, c0:c1], dtype=np.float64)
+        _, accessible, scores = score_cells(
+            self.clearance[r0:r1, c0:c1], coverage_table, self.rows[overlap] - r0,
+            self.cols[overlap] - c0, size=self.size, robot_radius=self.robot_radius,
+            preferred_clearance=self.preferred_clearance, coverage_weight=self.coverage_weight)
+        self.accessible[overlap] = accessible
+        self.scores[overlap] = scores
+        return overlap
+
+
+def random_map(height, width, seed=0):
+    """
+    Generates a random occupancy grid and visual coverage map for benchmarking.
+
+    :param height: height of the map in cells
+    :param width: width of the map in cells
+    :param seed: seed of the random generator
+    :return: occupancy grid (int8) and visual coverage map (uint8)
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.choice(np.array([-1, 0, 0, 0, 0, 0, 10, 100], dtype=np.int8), size=(height, width))
+    coverage_map = rng.integers(0, 2, size=(height, width), dtype=np.uint8)
+    return data, coverage_map
+
+
+def benchmark(map_sizes=(100, 200, 400, 800, 1600, 3200), resolution=0.05, step=0.2,
+              reference_limit=400, repeats=5, patch=40):
+    """
+    Prints the per-message latency of score_waypoints against the map size.
+
+    The incremental column is the latency of IncrementalScorer.update when a patch of
+    'patch' x 'patch' cells changes, as it does around the robot between two Cartographer maps.
+    For the smaller maps the per-waypoint convolute loop is timed too, and both results are
+    checked to agree.
+
+    :param map_sizes: side of the square maps to benchmark, in cells
+    :param resolution: size of one cell in meters
+    :param step: distance between waypoints in meters
+    :param reference_limit: largest map side for which the convolute loop is timed
+    :param repeats: number of runs of the batched engine, the best one is reported
+    :param patch: side of the region changed between two maps for the incremental update, in cells
+    """
+    print(f"{'map (cells)':>12} {'waypoints':>10} {'batched (ms)':>13} {'incremental (ms)':>17} "
+          f"{'loop (ms)':>10}")
+    for side in map_sizes:
+        data, coverage_map = random_map(side, side)
+        coords = np.arange(0.0, side * resolution, step)
+        xs, ys = np.meshgrid(coords, coords, indexing='ij')
+        waypoints = np.column_stack((xs.ravel(), ys.ravel()))
+
+        batched = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            valid, accessible, scores = score_waypoints(data, coverage_map, waypoints, resolution)
+            batched = min(batched, time.perf_counter() - start)
+
+        scorer = IncrementalScorer(size=5)
+        scorer.update(data, coverage_map, waypoints, resolution)
+        incremental = float('inf')
+        for i in range(repeats):
+            updated = data.copy()
+            corner = side // 2 - patch // 2 + i
+            updated[corner:corner + patch, corner:corner + patch] = 0
+            start = time.perf_counter()
+            scorer.update(updated, coverage_map, waypoints, resolution)
+            incremental = min(incremental, time.perf_counter() - start)
+        assert np.array_equal(scorer.scores, score_waypoints(updated, coverage_map, waypoints,
+                                                             resolution)[2])
+
+        loop = ''
+        if side <= reference_limit:
+            # the discoverer used to decode the coverage grid to int64 before the loop
+            clearance = clearance_map(data, resolution, cap=PREFERRED_CLEARANCE)
+            coverage_map = coverage_map.astype(np.int64)
+            rows, cols = waypoints_to_cells(waypoints, resolution)
+            start = time.perf_counter()
+            for i in np.flatnonzero(valid):
+                reference = convolute(clearance, coverage_map, [rows[i], cols[i]], size=5)
+                assert reference[0] == accessible[i]
+                assert not reference[0] or np.isclose(reference[1], scores[i])
+            loop = f'{(time.perf_counter() - start) * 1000:.1f}'
+
+        print(f'{side:>5} x {side:<4} {len(waypoints):>10} {batched * 1000:>13.2f} '
+              f'{incremental * 1000:>17.2f} {loop:>10}')
+
+
+if __name__ == '__main__':
+    benchmark()